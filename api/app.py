@@ -14,10 +14,16 @@ from src.routes.polls import polls
 from src.routes.tutoring import tutoring
 from src.routes.study_groups import study_groups
 from src.routes.auth import auth
+from src.routes.dashboard import dashboard
+from src.routes.analytics import analytics
+from src.routes.search import search
+from src.routes.events import events
+from src.routes.generation import generation
+from src import worker
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB upload limit
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Has-More', 'Idempotent-Replayed'])
 
 app.register_blueprint(auth)
 app.register_blueprint(create)
@@ -32,6 +38,14 @@ app.register_blueprint(polls)
 app.register_blueprint(tutoring)
 app.register_blueprint(study_groups)
 app.register_blueprint(pages)
+app.register_blueprint(dashboard)
+app.register_blueprint(analytics)
+app.register_blueprint(search)
+app.register_blueprint(events)
+app.register_blueprint(generation)
+
+if worker.JOB_WORKER_EMBEDDED:
+    worker.start()
 
 
 
@@ -29,6 +29,11 @@ else:
     print("[cache] No REDIS_URL set, running without cache")
 
 
+def get_client():
+    """Return the shared Redis client, or None when Redis is unavailable."""
+    return _client
+
+
 def cache_get(key: str):
     """Get a value from Redis. Returns None on miss or if Redis is unavailable."""
     if not _client:
@@ -78,6 +83,26 @@ def cache_delete_pattern(pattern: str):
         pass
 
 
+def cache_delete_where(pattern: str, predicate):
+    """
+    Delete keys matching a glob pattern for which predicate(key) is true, in a
+    single SCAN pass. Lets callers invalidate many ids without one scan per id.
+    """
+    if not _client:
+        return
+    try:
+        cursor = 0
+        while True:
+            cursor, keys = _client.scan(cursor=cursor, match=pattern, count=500)
+            doomed = [k for k in keys if predicate(k)]
+            if doomed:
+                _client.delete(*doomed)
+            if cursor == 0:
+                break
+    except Exception:
+        pass
+
+
 def cached(key_func, ttl: int = 10):
     """
     Decorator that caches a Flask route's JSON response in Redis.
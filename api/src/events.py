@@ -0,0 +1,154 @@
+"""
+Course event bus behind the dashboard Server-Sent Events stream.
+
+Write paths call publish(course_id, type, data) after they commit. With
+Redis the event goes to the `course_events:{course_id}` pub/sub channel, so
+every worker sees it; each worker runs one listener thread (a single pattern
+subscription) that fans events out to its open streams. Without Redis events
+are delivered to streams in the same process only.
+
+Events are fire-and-forget: a stream that falls behind, or a listener that
+reconnects, gets a `resync` event telling the client to reload its snapshot.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from .cache import get_client
+
+CHANNEL_PREFIX = "course_events:"
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "200"))
+RECONNECT_SECONDS = 1.0
+CLIENT_RETRY_MS = 3000
+
+_lock = threading.Lock()
+_subscribers = {}  # course_id -> set of queue.Queue
+_listener = None
+
+
+def publish(course_id, event_type, data):
+    """Send one event to every dashboard stream of a course. Never raises."""
+    if not course_id:
+        return
+    message = json.dumps({'type': event_type, 'data': data, 'ts': round(time.time(), 3)}, default=str)
+    client = get_client()
+    if client:
+        try:
+            client.publish(CHANNEL_PREFIX + course_id, message)
+            return
+        except Exception as e:
+            print(f"[events] Publish failed, delivering locally: {e}")
+    _dispatch(course_id, message)
+
+
+def _offer(q, message):
+    try:
+        q.put_nowait(message)
+    except queue.Full:
+        # The client is too slow to keep up: drop its backlog and ask it to reload
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            q.put_nowait(json.dumps({'type': 'resync', 'data': {'reason': 'lagging'}, 'ts': round(time.time(), 3)}))
+        except queue.Full:
+            pass
+
+
+def _dispatch(course_id, message):
+    with _lock:
+        queues = list(_subscribers.get(course_id, ()))
+    for q in queues:
+        _offer(q, message)
+
+
+def _resync_all(reason):
+    message = json.dumps({'type': 'resync', 'data': {'reason': reason}, 'ts': round(time.time(), 3)})
+    with _lock:
+        queues = [q for qs in _subscribers.values() for q in qs]
+    for q in queues:
+        _offer(q, message)
+
+
+def _listen(client):
+    first = True
+    while True:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.psubscribe(CHANNEL_PREFIX + '*')
+            if not first:
+                _resync_all('reconnected')  # events published while we were away are lost
+            first = False
+            while True:
+                # Short polls rather than listen(): the shared client has a socket timeout
+                message = pubsub.get_message(timeout=1.0)
+                if message and message['type'] == 'pmessage':
+                    _dispatch(message['channel'][len(CHANNEL_PREFIX):], message['data'])
+        except Exception as e:
+            print(f"[events] Listener lost Redis ({e}); reconnecting")
+            time.sleep(RECONNECT_SECONDS)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+def _ensure_listener():
+    global _listener
+    client = get_client()
+    if not client or _listener is not None:
+        return
+    with _lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, args=(client,), name="course-events", daemon=True)
+            _listener.start()
+
+
+def stream_count():
+    with _lock:
+        return sum(len(qs) for qs in _subscribers.values())
+
+
+def open_stream(course_id):
+    """Register a stream for a course. Returns its queue, or None when this worker is at MAX_STREAMS."""
+    _ensure_listener()
+    q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        if sum(len(qs) for qs in _subscribers.values()) >= MAX_STREAMS:
+            return None
+        _subscribers.setdefault(course_id, set()).add(q)
+    return q
+
+
+def close_stream(course_id, q):
+    with _lock:
+        queues = _subscribers.get(course_id)
+        if queues is not None:
+            queues.discard(q)
+            if not queues:
+                del _subscribers[course_id]
+
+
+def sse_lines(course_id, q):
+    """Yield SSE frames for a registered stream until the client disconnects."""
+    try:
+        yield f"retry: {CLIENT_RETRY_MS}\n\n"
+        yield f"event: ready\ndata: {json.dumps({'course_id': course_id})}\n\n"
+        while True:
+            try:
+                message = q.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            event_type = json.loads(message).get('type', 'message')
+            yield f"event: {event_type}\ndata: {message}\n\n"
+    finally:
+        close_stream(course_id, q)
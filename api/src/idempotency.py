@@ -0,0 +1,106 @@
+"""
+Idempotency-Key support for write endpoints.
+
+The first request with a given key claims it with SET NX; once it finishes its
+response is stored under the key, and retries with the same key get that
+response back instead of repeating the write. A retry that arrives while the
+first attempt is still running is told to back off. Without Redis, keys are
+not tracked and every request runs.
+"""
+
+import json
+import os
+
+from flask import request, jsonify
+
+from .cache import get_client
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+PENDING_TTL = 60
+PENDING_RETRY_AFTER = 1
+MAX_KEY_LENGTH = 200
+
+_PENDING = '__pending__'
+
+
+def _key(scope, idempotency_key):
+    return f"idem:{scope}:{idempotency_key}"
+
+
+def begin(scope, idempotency_key):
+    """
+    Claim a key. Returns ('new', None) if the caller should do the work,
+    ('pending', None) if another attempt holds it, or ('done', (body, status))
+    with the stored response.
+    """
+    client = get_client()
+    if not client or not idempotency_key:
+        return 'new', None
+    key = _key(scope, idempotency_key)
+    try:
+        if client.set(key, _PENDING, nx=True, ex=PENDING_TTL):
+            return 'new', None
+        stored = client.get(key)
+    except Exception as e:
+        print(f"[idempotency] Redis unavailable, running request: {e}")
+        return 'new', None
+    if stored is None:
+        return begin(scope, idempotency_key)  # expired between SET and GET
+    if stored == _PENDING:
+        return 'pending', None
+    saved = json.loads(stored)
+    return 'done', (saved['body'], saved['status'])
+
+
+def finish(scope, idempotency_key, body, status):
+    """Store the response for a claimed key so retries replay it."""
+    client = get_client()
+    if not client or not idempotency_key:
+        return
+    try:
+        client.setex(_key(scope, idempotency_key), IDEMPOTENCY_TTL, json.dumps({'body': body, 'status': status}))
+    except Exception as e:
+        print(f"[idempotency] Failed to store response: {e}")
+
+
+def release(scope, idempotency_key):
+    """Drop a claimed key after a failed attempt so a retry can run."""
+    client = get_client()
+    if not client or not idempotency_key:
+        return
+    try:
+        client.delete(_key(scope, idempotency_key))
+    except Exception:
+        pass
+
+
+def run_idempotent(scope, handler):
+    """
+    Run handler() -> (body, status) at most once per Idempotency-Key header in
+    `scope` and return a Flask response. Requests without the header always run.
+    """
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+    state, saved = begin(scope, idempotency_key)
+    if state == 'pending':
+        response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+        response.headers['Retry-After'] = str(PENDING_RETRY_AFTER)
+        return response, 409
+    if state == 'done':
+        body, status = saved
+        response = jsonify(body)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response, status
+
+    try:
+        body, status = handler()
+    except Exception:
+        release(scope, idempotency_key)
+        raise
+    if status < 500:
+        finish(scope, idempotency_key, body, status)
+    else:
+        release(scope, idempotency_key)
+    return jsonify(body), status
@@ -0,0 +1,177 @@
+"""
+Durable queue for background content generation, kept in the generation_jobs
+table (scripts/migration_generation_jobs.sql).
+
+enqueue() adds one job per (course, concept, content type) and skips pairs
+that already have a queued or running job, so repeated uploads or bulk
+requests cannot start duplicate runs. Workers (src/worker.py) claim due jobs
+lowest priority first, each under a lease; a job whose worker dies is picked
+up again once the lease expires. A failed attempt is retried with exponential
+backoff until the job's max_attempts is reached, after which it stays
+'failed' with its error.
+"""
+
+import os
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .db import supabase
+from .query import PAGE_SIZE, after_cursor
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = 3600
+ENQUEUE_CHUNK_SIZE = 500
+STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# Set when this process enqueues work, so an embedded worker need not wait for its next poll
+_wake = threading.Event()
+
+
+def enqueue(course_id, concept_ids, content_types, priorities=None):
+    """
+    Queue every concept x content type pair for a course. priorities maps
+    (concept_id, content_type) to a claim priority, lowest first (default 0).
+    Returns {'enqueued': n, 'skipped': n, 'jobs': [...]}; skipped pairs already had an active job.
+    """
+    priorities = priorities or {}
+    wanted = [{'course_id': course_id, 'concept_id': cid, 'content_type': t, 'priority': priorities.get((cid, t), 0)}
+              for cid in dict.fromkeys(concept_ids) for t in content_types]
+    jobs = []
+    for i in range(0, len(wanted), ENQUEUE_CHUNK_SIZE):
+        jobs.extend(supabase.rpc('enqueue_generation_jobs', {
+            'p_jobs': wanted[i:i + ENQUEUE_CHUNK_SIZE]}).execute().data or [])
+    if any(job['created'] for job in jobs):
+        _wake.set()
+    return {
+        'enqueued': sum(1 for job in jobs if job['created']),
+        'skipped': sum(1 for job in jobs if not job['created']),
+        'jobs': [{k: job[k] for k in ('id', 'concept_id', 'content_type', 'status')} for job in jobs],
+    }
+
+
+def wait_for_work(timeout):
+    """Block until this process enqueues something or timeout passes."""
+    woken = _wake.wait(timeout)
+    _wake.clear()
+    return woken
+
+
+def claim(worker_id, limit):
+    """Lease up to `limit` due jobs for this worker. Each returned job has its new attempt count."""
+    return supabase.rpc('claim_generation_jobs', {
+        'p_worker_id': worker_id,
+        'p_limit': limit,
+        'p_lease_seconds': JOB_LEASE_SECONDS,
+    }).execute().data or []
+
+
+def queue_missing(error):
+    """Whether an error means the queue's table or claim function is not installed."""
+    message = str(error)
+    return ('generation_jobs' in message or 'claim_generation_jobs' in message) and (
+        'PGRST202' in message or '42P01' in message or 'does not exist' in message or 'Could not find' in message)
+
+
+def _owned(query, job):
+    # A worker that outlived its lease must not overwrite the attempt that replaced it
+    return query.eq('id', job['id']).eq('status', 'running').eq(
+        'worker_id', job['worker_id']).eq('attempts', job['attempts'])
+
+
+def complete(job):
+    """Mark a claimed job done. Returns False if the lease was lost in the meantime."""
+    now = datetime.now(timezone.utc).isoformat()
+    return bool(_owned(supabase.table('generation_jobs').update({
+        'status': 'succeeded',
+        'finished_at': now,
+        'lease_expires_at': None,
+        'last_error': None,
+    }), job).execute().data)
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: exponential in the attempts made, with jitter."""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(job, error, retry=True):
+    """
+    Record a failed attempt. The job is re-queued with backoff while attempts
+    remain (and `retry` is set), otherwise it becomes 'failed'.
+    """
+    now = datetime.now(timezone.utc)
+    final = not retry or job['attempts'] >= job['max_attempts']
+    update = {'last_error': str(error)[:2000], 'lease_expires_at': None}
+    if final:
+        update.update(status='failed', finished_at=now.isoformat())
+    else:
+        update.update(status='queued', run_after=(now + timedelta(seconds=retry_delay(job['attempts']))).isoformat())
+    _owned(supabase.table('generation_jobs').update(update), job).execute()
+    return 'failed' if final else 'queued'
+
+
+def get_job(job_id):
+    rows = supabase.table('generation_jobs').select('*').eq('id', job_id).execute().data
+    return rows[0] if rows else None
+
+
+def _course_jobs(course_id):
+    rows = []
+    cursor = None
+    while True:
+        query = supabase.table('generation_jobs').select(
+            'id, concept_id, content_type, status, attempts, max_attempts, run_after, last_error, created_at, '
+            'finished_at').eq('course_id', course_id)
+        if cursor:
+            query = after_cursor(query, cursor)
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+
+
+def course_progress(course_id):
+    """
+    Status of the latest job for each (concept, content type) in a course:
+    counts overall and per content type, plus the jobs that gave up.
+    """
+    latest = {}
+    for job in _course_jobs(course_id):  # oldest first, so newer runs win
+        latest[(job['concept_id'], job['content_type'])] = job
+
+    counts = dict.fromkeys(STATUSES, 0)
+    by_type = {}
+    for job in latest.values():
+        counts[job['status']] += 1
+        type_counts = by_type.setdefault(job['content_type'], dict.fromkeys(STATUSES, 0))
+        type_counts[job['status']] += 1
+
+    total = len(latest)
+    finished = counts['succeeded'] + counts['failed']
+    return {
+        'course_id': course_id,
+        'total': total,
+        'counts': counts,
+        'by_content_type': by_type,
+        'percent_complete': round(100.0 * finished / total, 1) if total else 100.0,
+        'done': finished == total,
+        'failed': [{
+            'job_id': job['id'],
+            'concept_id': job['concept_id'],
+            'content_type': job['content_type'],
+            'attempts': job['attempts'],
+            'last_error': job['last_error'],
+        } for job in latest.values() if job['status'] == 'failed'],
+        'retrying': [{
+            'job_id': job['id'],
+            'concept_id': job['concept_id'],
+            'content_type': job['content_type'],
+            'attempts': job['attempts'],
+            'run_after': job['run_after'],
+            'last_error': job['last_error'],
+        } for job in latest.values() if job['status'] == 'queued' and job['last_error']],
+    }
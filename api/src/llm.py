@@ -0,0 +1,306 @@
+"""
+Gateway for every outbound model call.
+
+One long-lived client per provider (the Anthropic SDK's httpx pool, a pooled
+requests.Session for Perplexity), so generation reuses warm connections
+instead of paying a TLS handshake per call. complete() applies each provider's
+timeout, throttles through src/ratelimit.py, retries transient failures
+(timeouts, dropped connections, 5xx) with backoff and records per call site
+latency, token and error metrics, served by GET /api/llm/metrics.
+
+Model ids live in MODELS, keyed by role and overridable with
+LLM_MODEL_<ROLE>. Providers are pluggable (register_provider); the built-in
+'stub' answers every site with canned output, and LLM_PROVIDER=stub routes
+all calls to it for local work without API keys.
+
+cached() is complete() behind the response cache (src/llm_cache.py).
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import anthropic
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import ratelimit
+from .llm_cache import get_or_create
+
+MODELS = {
+    role: os.getenv(f"LLM_MODEL_{role.upper()}", default) for role, default in {
+        'content': 'claude-sonnet-4-20250514',          # learning pages, practice quizzes, knowledge graphs
+        'concept_content': 'claude-sonnet-4-5-20250929',  # concept pages and quizzes
+        'summary': 'claude-haiku-4-5-20251001',         # tutoring summaries
+        'search': 'sonar',                              # further reading
+        'search_pro': 'sonar-pro',                      # free-form Perplexity queries
+    }.items()
+}
+PROVIDER_OVERRIDE = os.getenv("LLM_PROVIDER", "").strip()
+TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LATENCY_SAMPLES = 500
+
+
+class Completion:
+    def __init__(self, text, input_tokens=0, output_tokens=0, extra=None):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.extra = extra or {}
+
+
+class ProviderError(Exception):
+    """A provider answered with an error status."""
+
+    def __init__(self, provider, status_code, body):
+        super().__init__(f"{provider} returned {status_code}: {body[:500]}")
+        self.status_code = status_code
+        self.body = body
+
+
+class AnthropicProvider:
+    name = 'anthropic'
+    throttled = True
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def configured(self):
+        return bool(os.getenv("ANTHROPIC_API_KEY"))
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # Retries happen in complete(), under the rate limiter, not inside the SDK
+                self._client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"),
+                                                   timeout=TIMEOUT_SECONDS, max_retries=0)
+            return self._client
+
+    def complete(self, site, model, messages, max_tokens, timeout):
+        message = self.client().messages.create(model=model, max_tokens=max_tokens, messages=messages,
+                                                timeout=timeout)
+        return Completion(message.content[0].text, message.usage.input_tokens, message.usage.output_tokens)
+
+    def transient(self, error):
+        if isinstance(error, anthropic.APIConnectionError):  # includes timeouts
+            return True
+        return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+class PerplexityProvider:
+    name = 'perplexity'
+    throttled = True
+    url = "https://api.perplexity.ai/chat/completions"
+
+    def __init__(self):
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+
+    def configured(self):
+        return bool(os.getenv("PERPLEXITY_API_KEY"))
+
+    def complete(self, site, model, messages, max_tokens, timeout):
+        body = {"model": model, "messages": messages}
+        if max_tokens:
+            body["max_tokens"] = max_tokens
+        response = self._session.post(self.url, json=body, timeout=timeout, headers={
+            "Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}",
+            "Content-Type": "application/json",
+        })
+        if response.status_code == 429:
+            raise ratelimit.RateLimited(self.name, ratelimit.retry_after_seconds(response.headers))
+        if response.status_code != 200:
+            raise ProviderError(self.name, response.status_code, response.text)
+        result = response.json()
+        usage = result.get('usage') or {}
+        return Completion(result['choices'][0]['message']['content'], usage.get('prompt_tokens', 0),
+                          usage.get('completion_tokens', 0), {'citations': result.get('citations', [])})
+
+    def transient(self, error):
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        return isinstance(error, ProviderError) and error.status_code >= 500
+
+
+def _stub_quiz_question(n):
+    return {
+        "question": f"Stub question {n + 1}?", "option_a": "A", "option_b": "B", "option_c": "C", "option_d": "D",
+        "correct_answer": n % 4, "explanation": "Stub explanation.",
+    }
+
+
+class StubProvider:
+    """Canned, well-formed output for each call site; no network."""
+    name = 'stub'
+    throttled = False
+    responses = {
+        'learning_page': json.dumps({"title": "Stub learning page", "content": "## Stub\n\nGenerated offline."}),
+        'practice_quiz': json.dumps({"questions": [{
+            "question_text": f"Stub question {n + 1}?", "options": ["A", "B", "C", "D"],
+            "correct_answer": "ABCD"[n % 4], "explanation": "Stub explanation.",
+        } for n in range(5)]}),
+        'concept_page': "## Stub concept page\n\nGenerated offline.",
+        'concept_quiz': json.dumps([_stub_quiz_question(n) for n in range(5)]),
+        'knowledge_graph': json.dumps({
+            "nodes": {"basics": "Foundations", "methods": "Core methods", "applications": "Applications"},
+            "edges": [["basics", "methods"], ["methods", "applications"]],
+        }),
+        'further_reading': json.dumps([]),
+        'test': json.dumps({"test": "hello"}),
+    }
+
+    def configured(self):
+        return True
+
+    def complete(self, site, model, messages, max_tokens, timeout):
+        text = self.responses.get(site, f"Stub response from {model}.")
+        prompt_chars = sum(len(json.dumps(m.get('content'))) for m in messages)
+        return Completion(text, prompt_chars // 4, len(text) // 4)
+
+    def transient(self, error):
+        return False
+
+
+_providers = {p.name: p for p in (AnthropicProvider(), PerplexityProvider(), StubProvider())}
+
+
+def register_provider(provider):
+    """
+    Add or replace a provider: an object with name, throttled (go through the
+    rate limiter), configured(), complete(site, model, messages, max_tokens,
+    timeout) -> Completion and transient(error) -> bool (worth retrying).
+    """
+    _providers[provider.name] = provider
+
+
+def resolve(provider):
+    """The provider that actually serves calls for `provider` (LLM_PROVIDER overrides them all)."""
+    return PROVIDER_OVERRIDE or provider
+
+
+def available(provider='anthropic'):
+    """Whether calls to `provider` can be made (its key is set, or it is overridden by one that can)."""
+    impl = _providers.get(resolve(provider))
+    return bool(impl and impl.configured())
+
+
+# ---- metrics ---------------------------------------------------------------
+
+_metrics_lock = threading.Lock()
+_metrics = {}  # site -> counters plus a window of recent latencies
+
+
+def _site_metrics(site):
+    return _metrics.setdefault(site, {
+        'calls': 0, 'errors': 0, 'retries': 0, 'input_tokens': 0, 'output_tokens': 0,
+        'latency_ms_total': 0.0, 'queued_ms_total': 0.0, 'latencies': collections.deque(maxlen=LATENCY_SAMPLES),
+        'provider': None, 'model': None, 'last_error': None,
+    })
+
+
+def _record(site, provider, model, latency, queued, completion=None, error=None, retries=0):
+    with _metrics_lock:
+        m = _site_metrics(site)
+        m['calls'] += 1
+        m['retries'] += retries
+        m['provider'], m['model'] = provider, model
+        m['queued_ms_total'] += queued * 1000
+        if error is not None:
+            m['errors'] += 1
+            m['last_error'] = f"{type(error).__name__}: {error}"[:500]
+            return
+        m['latency_ms_total'] += latency * 1000
+        m['latencies'].append(latency * 1000)
+        m['input_tokens'] += completion.input_tokens
+        m['output_tokens'] += completion.output_tokens
+
+
+def _percentile(ordered, pct):
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 1) if ordered else None
+
+
+def metrics():
+    """
+    Per call site: calls, errors, retries, tokens and provider latency.
+    queued_ms_avg is the rest of each call: rate limiter waits and retry backoff.
+    """
+    with _metrics_lock:
+        out = {}
+        for site, m in _metrics.items():
+            ordered = sorted(m['latencies'])
+            succeeded = m['calls'] - m['errors']
+            out[site] = {
+                'provider': m['provider'],
+                'model': m['model'],
+                'calls': m['calls'],
+                'errors': m['errors'],
+                'retries': m['retries'],
+                'input_tokens': m['input_tokens'],
+                'output_tokens': m['output_tokens'],
+                'latency_ms': {
+                    'avg': round(m['latency_ms_total'] / succeeded, 1) if succeeded else None,
+                    'p50': _percentile(ordered, 50),
+                    'p95': _percentile(ordered, 95),
+                    'max': round(ordered[-1], 1) if ordered else None,
+                },
+                'queued_ms_avg': round(m['queued_ms_total'] / m['calls'], 1) if m['calls'] else None,
+                'last_error': m['last_error'],
+            }
+        return out
+
+
+# ---- calls -----------------------------------------------------------------
+
+def complete(site, messages, model, max_tokens, provider='anthropic', timeout=None):
+    """
+    Run one model call for a call site and return its Completion.
+    Transient failures are retried up to LLM_MAX_RETRIES times; anything else raises.
+    """
+    name = resolve(provider)
+    impl = _providers[name]
+    timeout = timeout or TIMEOUT_SECONDS
+    started = time.time()
+    spent = 0.0  # time inside the provider, as opposed to waiting on the rate limiter
+
+    def timed():
+        nonlocal spent
+        call_started = time.time()
+        try:
+            return impl.complete(site, model, messages, max_tokens, timeout)
+        finally:
+            spent = time.time() - call_started
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            completion = ratelimit.call(name, timed) if impl.throttled else timed()
+        except Exception as e:
+            # Rate limits were already retried by ratelimit.call
+            if attempt < MAX_RETRIES and impl.transient(e) and not ratelimit.rate_limit_info(e)[0]:
+                delay = ratelimit.backoff(attempt)
+                print(f"[llm] {site}: {type(e).__name__} from {name}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            _record(site, name, model, spent, time.time() - started - spent, error=e, retries=attempt)
+            raise
+        _record(site, name, model, spent, time.time() - started - spent, completion, retries=attempt)
+        return completion
+
+
+def cached(site, request, parse=None, bypass=False):
+    """
+    complete() behind the response cache. request holds provider, model,
+    max_tokens and messages; parse(text) turns the answer into the value to
+    cache and must raise if the answer is unusable.
+    """
+    request = dict(request, provider=resolve(request.get('provider', 'anthropic')))
+
+    def produce():
+        text = complete(site, **request).text
+        return parse(text) if parse else text
+
+    return get_or_create(site, request, produce, bypass=bypass)
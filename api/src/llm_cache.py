@@ -0,0 +1,158 @@
+"""
+Content-addressed cache for model responses.
+
+A response is stored under the sha256 of everything that determines it:
+provider, model, messages and sampling parameters. Identical prompts (the
+same concept at the same confidence tier, a regenerated course, the same
+PDF) are answered from the cache instead of paying seconds and tokens again.
+
+Values are the call site's parsed result, JSON-encoded and zlib-compressed,
+kept in Redis (`llm:{sha256}`) when it is available and in files under
+LLM_CACHE_DIR otherwise. Only results that parsed and validated are stored:
+the produce() callback raises on bad output, so a malformed response is
+never replayed.
+
+Each call site has its own TTL (SITE_TTLS, overridable with
+LLM_CACHE_TTL_<SITE>). LLM_CACHE_BYPASS lists sites (or `all`) that always
+call the model; callers can also pass bypass=True to force a fresh answer,
+which then replaces the cached one. LLM_CACHE_ENABLED=false turns it off.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from .cache import get_client
+
+DAY = 24 * 3600
+SITE_TTLS = {
+    'learning_page': 7 * DAY,
+    'practice_quiz': 7 * DAY,
+    'concept_page': 30 * DAY,
+    'concept_quiz': 30 * DAY,
+    'knowledge_graph': 90 * DAY,
+}
+DEFAULT_TTL = DAY
+ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+BYPASS = {s.strip() for s in os.getenv("LLM_CACHE_BYPASS", "").split(',') if s.strip()}
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "llm_cache"))
+KEY_PREFIX = "llm:"
+
+_lock = threading.Lock()
+_stats = {}  # site -> {'hits', 'misses', 'bypassed', 'stored'}
+
+
+def ttl_for(site):
+    override = os.getenv(f"LLM_CACHE_TTL_{site.upper()}")
+    return int(override) if override else SITE_TTLS.get(site, DEFAULT_TTL)
+
+
+def request_key(request):
+    """sha256 over a canonical JSON encoding of the request (provider, model, messages, parameters)."""
+    canonical = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _count(site, field):
+    with _lock:
+        site_stats = _stats.setdefault(site, {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0})
+        site_stats[field] += 1
+
+
+def stats():
+    with _lock:
+        return {site: dict(counts) for site, counts in _stats.items()}
+
+
+def _encode(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def _path(digest):
+    return os.path.join(CACHE_DIR, digest[:2], digest)
+
+
+def _read(digest):
+    client = get_client()
+    if client:
+        try:
+            raw = client.get(KEY_PREFIX + digest)
+            return None if raw is None else _decode(base64.b64decode(raw))
+        except Exception as e:
+            print(f"[llm_cache] Redis read failed: {e}")
+            return None
+    try:
+        with open(_path(digest), 'rb') as f:
+            expires_at = int.from_bytes(f.read(8), 'big')
+            blob = f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[llm_cache] Disk read failed: {e}")
+        return None
+    if expires_at < time.time():
+        try:
+            os.remove(_path(digest))
+        except OSError:
+            pass
+        return None
+    return _decode(blob)
+
+
+def _write(digest, value, ttl):
+    blob = _encode(value)
+    client = get_client()
+    if client:
+        try:
+            client.setex(KEY_PREFIX + digest, ttl, base64.b64encode(blob).decode('ascii'))
+        except Exception as e:
+            print(f"[llm_cache] Redis write failed: {e}")
+        return
+    try:
+        path = _path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(int(time.time() + ttl).to_bytes(8, 'big'))
+            f.write(blob)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[llm_cache] Disk write failed: {e}")
+
+
+def get_or_create(site, request, produce, bypass=False):
+    """
+    Return the cached result for `request`, or produce() it and cache it.
+
+    site: call site name, selecting the TTL and the LLM_CACHE_BYPASS switch
+    request: JSON-serializable dict of everything that determines the response
+    produce: zero-argument callable making the call and returning the parsed,
+        JSON-serializable result; it should raise if the output is unusable
+    bypass: skip the lookup (the fresh result still replaces the cached one)
+    """
+    if not ENABLED:
+        return produce()
+    digest = request_key(request)
+    if bypass or site in BYPASS or 'all' in BYPASS:
+        _count(site, 'bypassed')
+    else:
+        hit = _read(digest)
+        if hit is not None:
+            _count(site, 'hits')
+            return hit
+        _count(site, 'misses')
+
+    value = produce()
+    _write(digest, value, ttl_for(site))
+    _count(site, 'stored')
+    return value
@@ -0,0 +1,27 @@
+"""
+Structured, sampled logging for hot request paths.
+
+Each event is printed as one JSON line ({"tag", "event", "level", ...fields}).
+Info events on hot paths are sampled at LOG_SAMPLE_RATE and carry the rate,
+so log aggregation can scale counts back up; warnings and errors are always
+printed.
+"""
+
+import json
+import os
+import random
+import time
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))
+
+
+def log_event(tag, event, level='info', **fields):
+    """Print one structured log line. Info events are sampled; warnings and errors never are."""
+    sample_rate = LOG_SAMPLE_RATE if level == 'info' else 1.0
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    record = {'ts': round(time.time(), 3), 'tag': tag, 'event': event, 'level': level}
+    if sample_rate < 1.0:
+        record['sample_rate'] = sample_rate
+    record.update(fields)
+    print(json.dumps(record, default=str))
@@ -0,0 +1,59 @@
+"""
+Concurrent fan-out for independent Supabase reads inside route handlers.
+
+A single bounded thread pool per worker process runs the calls. Each task
+runs in a copy of the caller's context, so the Flask request, app context
+and g are available inside it. Exceptions are re-raised in the caller.
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+QUERY_POOL_SIZE = int(os.getenv("QUERY_POOL_SIZE", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=QUERY_POOL_SIZE, thread_name_prefix="query")
+_in_pool = threading.local()
+
+
+def _run_in_pool(fn, args):
+    _in_pool.active = True
+    try:
+        return fn(*args)
+    finally:
+        _in_pool.active = False
+
+
+def submit(fn, *args):
+    """Schedule fn(*args) on the shared pool with the caller's context. Returns a Future."""
+    ctx = contextvars.copy_context()
+    return _executor.submit(ctx.run, _run_in_pool, fn, args)
+
+
+def run_parallel(*calls):
+    """
+    Run zero-argument callables concurrently and return their results in order.
+
+    If any call raises, the remaining calls are cancelled where possible and
+    the first exception is re-raised. Calls made from inside a pool task run
+    inline, so nested fan-outs cannot exhaust the pool and deadlock.
+    """
+    if len(calls) <= 1 or getattr(_in_pool, 'active', False):
+        return [call() for call in calls]
+
+    futures = [submit(call) for call in calls]
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for future in done:
+        if future.exception() is not None:
+            for p in pending:
+                p.cancel()
+            raise future.exception()
+    return [future.result() for future in futures]
+
+
+def fan_out(**calls):
+    """Keyword form of run_parallel: fan_out(nodes=fn, edges=fn) -> {'nodes': ..., 'edges': ...}."""
+    names = list(calls)
+    results = run_parallel(*(calls[name] for name in names))
+    return dict(zip(names, results))
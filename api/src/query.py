@@ -0,0 +1,200 @@
+"""
+IN-list and keyset pagination query helpers.
+
+PostgREST encodes `.in_()` filters into the URL and caps rows per response,
+so unbounded id lists can fail or silently truncate. These helpers split the
+list into size-bounded chunks, run the chunks concurrently, page through
+each chunk's rows, and merge the results.
+
+Growing feeds (transcripts, messages) are paged by keyset on
+(created_at, id) instead: clients pass back the cursor of the last row they
+saw and only newer rows are read, so each poll costs the same however long
+the feed gets.
+
+created_at defaults to NOW(), the start of the inserting transaction, not its
+commit. A row whose transaction started earlier but committed after a reader
+moved past its created_at is never returned to that reader. Feed polls accept
+this (a late chunk is rare and the next full load shows it); code that must
+not miss rows (e.g. lecture coverage) has to track ids itself.
+"""
+
+import os
+import re
+from datetime import datetime
+
+from .db import supabase
+from .parallel import run_parallel
+
+IN_CHUNK_SIZE = int(os.getenv("IN_CHUNK_SIZE", "100"))
+PAGE_SIZE = 1000  # PostgREST default max-rows
+KEYSET_PAGE_SIZE = 200
+KEYSET_MAX_PAGE_SIZE = 500
+
+
+def chunked(values, size=None):
+    """Distinct values split into lists of at most `size` (IN_CHUNK_SIZE by default)."""
+    size = size or IN_CHUNK_SIZE
+    unique = list(dict.fromkeys(values))
+    return [unique[i:i + size] for i in range(0, len(unique), size)]
+
+
+def _fetch_chunk(table, columns, column, chunk, filters, order, desc, limit, key):
+    def build():
+        query = supabase.table(table).select(columns).in_(column, chunk)
+        if filters:
+            query = filters(query)
+        if order:
+            query = query.order(order, desc=desc)
+        # Without a unique tiebreak Postgres may return rows in a different order per page
+        for key_column in key.split(','):
+            query = query.order(key_column.strip())
+        return query
+
+    if limit is not None and limit <= PAGE_SIZE:
+        return build().limit(limit).execute().data
+
+    # Page past the server row cap until a short page comes back
+    rows = []
+    while limit is None or len(rows) < limit:
+        page = build().range(len(rows), len(rows) + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+    return rows if limit is None else rows[:limit]
+
+
+def select_all(build, order='id'):
+    """
+    Every row of build()'s query, paged past the server row cap.
+
+    order must be a unique column, so consecutive pages neither overlap nor skip rows.
+    """
+    rows = []
+    while True:
+        page = build().order(order).range(len(rows), len(rows) + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def select_in(table, columns, column, values, *, filters=None, order=None, desc=False,
+              sort_key=None, limit=None, chunk_size=None, key='id'):
+    """
+    SELECT columns FROM table WHERE column IN values, chunked and run concurrently.
+
+    filters: optional callable(query) -> query applied to every chunk (eq, neq, joins...)
+    order/desc: server-side ordering per chunk; the merged rows are re-sorted by
+        sort_key (defaults to the order column) so the result is globally ordered
+    limit: applied per chunk and again after the merge, so the top-N is exact
+    key: the table's unique key (comma-separated if composite), appended to
+        every ORDER BY so paging is stable
+    """
+    if not values:
+        return []
+
+    chunks = chunked(values, chunk_size)
+    results = run_parallel(*(
+        (lambda chunk=chunk: _fetch_chunk(table, columns, column, chunk, filters, order, desc, limit, key))
+        for chunk in chunks
+    ))
+    rows = [row for chunk_rows in results for row in chunk_rows]
+
+    if len(chunks) > 1:
+        if sort_key is None and order and '(' not in order:
+            sort_key = lambda row: (row.get(order) is None, row.get(order))
+        if sort_key is not None:
+            rows.sort(key=sort_key, reverse=desc)
+        if limit is not None:
+            rows = rows[:limit]
+    return rows
+
+
+def delete_in(table, column, values, *, filters=None, chunk_size=None):
+    """DELETE FROM table WHERE column IN values, chunked and run concurrently."""
+    if not values:
+        return
+
+    def delete_chunk(chunk):
+        query = supabase.table(table).delete().in_(column, chunk)
+        if filters:
+            query = filters(query)
+        query.execute()
+
+    run_parallel(*(
+        (lambda chunk=chunk: delete_chunk(chunk))
+        for chunk in chunked(values, chunk_size)
+    ))
+
+
+UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+
+def page_limit(raw, default=KEYSET_PAGE_SIZE, maximum=KEYSET_MAX_PAGE_SIZE):
+    """Clamp a requested page size to 1..maximum. Raises ValueError for non-integers."""
+    if raw is None or raw == '':
+        return default
+    return max(1, min(int(raw), maximum))
+
+
+def make_cursor(row):
+    """Opaque keyset cursor for a row: '<created_at>,<id>'."""
+    return f"{row['created_at']},{row['id']}"
+
+
+def _check_timestamp(value):
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('Invalid cursor timestamp') from None
+    return value
+
+
+def parse_cursor(table, after):
+    """
+    Resolve an `after` value to (created_at, id_or_None).
+
+    Accepts a cursor from make_cursor(), a row id from `table`, or a bare
+    ISO timestamp. Raises ValueError if it cannot be resolved.
+    """
+    after = after.strip().replace(' ', '+')  # unencoded '+' in a tz offset arrives as a space
+    if ',' in after:
+        created_at, row_id = after.split(',', 1)
+        if not UUID_RE.match(row_id):
+            raise ValueError('Invalid cursor')
+        return _check_timestamp(created_at), row_id
+    if UUID_RE.match(after):
+        rows = supabase.table(table).select('created_at').eq('id', after).execute().data
+        if not rows:
+            raise ValueError('Cursor row not found')
+        return rows[0]['created_at'], after
+    if not re.match(r'^\d{4}-\d{2}-\d{2}', after):
+        raise ValueError('after must be a cursor, a row id or a timestamp')
+    return _check_timestamp(after), None
+
+
+def after_cursor(query, cursor):
+    """
+    Restrict a query to rows strictly after a parsed cursor in (created_at, id) order.
+    Both halves are checked before they are spliced into the filter; raises ValueError.
+    """
+    created_at, row_id = cursor
+    _check_timestamp(str(created_at))
+    if row_id is None:
+        return query.gt('created_at', created_at)
+    if not UUID_RE.match(str(row_id)):
+        raise ValueError('Invalid cursor')
+    return query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})')
+
+
+def keyset_page(build, cursor, limit):
+    """
+    Read up to `limit` rows after `cursor` in ascending (created_at, id) order.
+
+    build: callable() -> filtered query; must select created_at and id
+    Returns (rows, has_more).
+    """
+    query = build()
+    if cursor:
+        query = after_cursor(query, cursor)
+    rows = query.order('created_at').order('id').limit(limit + 1).execute().data
+    return rows[:limit], len(rows) > limit
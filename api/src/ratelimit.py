@@ -0,0 +1,189 @@
+"""
+Per-provider throttling for outbound model calls (Anthropic, Perplexity).
+
+Each call takes a token from its provider's bucket first: PROVIDER_RPM
+requests per minute, bursting up to BURST_SECONDS worth. With Redis the
+bucket is one hash per provider (`ratelimit:{provider}`) updated under WATCH,
+so every thread, worker and process shares one budget; without Redis each
+process keeps its own.
+
+A rate-limit response (429, or 529 overloaded) pauses the whole provider for
+its Retry-After, or an exponential backoff when there is none, and halves the
+bucket's rate. The pause is written even if it keeps losing WATCH races. Every success wins back a step of the rate (AIMD), so under
+sustained throttling the budget settles just below what the provider allows.
+"""
+
+import os
+import random
+import threading
+import time
+
+import redis
+
+from .cache import get_client
+
+PROVIDER_RPM = {
+    'anthropic': int(os.getenv("ANTHROPIC_RPM", "50")),
+    'perplexity': int(os.getenv("PERPLEXITY_RPM", "20")),
+}
+BURST_SECONDS = 5
+MIN_RATE_FACTOR = 0.1
+RECOVERY_STEP = 0.05
+RATE_LIMIT_RETRIES = 4
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+MAX_SLEEP_SECONDS = 5  # re-check the shared state at least this often while waiting
+STATE_TTL = 3600
+WATCH_RETRIES = 5
+RATE_LIMIT_STATUSES = (429, 529)
+
+_lock = threading.Lock()
+_local = {}  # provider -> state, used without Redis
+
+
+class RateLimited(Exception):
+    """Raised by call sites that detect a rate-limit response themselves (e.g. plain HTTP clients)."""
+
+    def __init__(self, provider, retry_after=None):
+        super().__init__(f"{provider} rate limited")
+        self.retry_after = retry_after
+
+
+def _key(provider):
+    return f"ratelimit:{provider}"
+
+
+def _rate(provider, state):
+    """Tokens per second for a provider at its current adaptive factor."""
+    return PROVIDER_RPM.get(provider, 60) / 60.0 * state['factor']
+
+
+def _initial(provider, now):
+    return {'tokens': PROVIDER_RPM.get(provider, 60) / 60.0 * BURST_SECONDS, 'ts': now,
+            'factor': 1.0, 'paused_until': 0.0}
+
+
+def _take(provider, state, now):
+    """Try to take one token. Returns (new_state, seconds_to_wait); 0 means the token was taken."""
+    if state['paused_until'] > now:
+        return state, state['paused_until'] - now
+    rate = _rate(provider, state)
+    burst = PROVIDER_RPM.get(provider, 60) / 60.0 * BURST_SECONDS
+    tokens = min(burst, state['tokens'] + (now - state['ts']) * rate)
+    if tokens >= 1:
+        return dict(state, tokens=tokens - 1, ts=now), 0.0
+    return dict(state, tokens=tokens, ts=now), (1 - tokens) / rate
+
+
+def _throttled(provider, state, now, delay):
+    return dict(state, tokens=0.0, ts=now, factor=max(MIN_RATE_FACTOR, state['factor'] / 2),
+                paused_until=max(state['paused_until'], now + delay))
+
+
+def _recovered(provider, state, now):
+    return dict(state, factor=min(1.0, state['factor'] + RECOVERY_STEP))
+
+
+def _apply(provider, step, raw, now, args):
+    """Run a step on a stored state (a Redis hash, a local dict, or nothing yet). Returns (state, result)."""
+    state = {k: float(v) for k, v in raw.items()} if raw else _initial(provider, now)
+    outcome = step(provider, state, now, *args)
+    return outcome if isinstance(outcome, tuple) else (outcome, None)
+
+
+def _update(provider, step, *args, force=False):
+    """
+    Apply step(provider, state, now, *args) -> state or (state, result) atomically. Returns the result.
+
+    When every WATCH attempt loses a race the update is dropped and None is
+    returned, unless force: then the step is applied to a fresh read and
+    written unconditionally (a concurrent update may be overwritten, which
+    beats losing a rate-limit pause).
+    """
+    client = get_client()
+    if client:
+        try:
+            for _ in range(WATCH_RETRIES):
+                with client.pipeline() as pipe:
+                    try:
+                        pipe.watch(_key(provider))
+                        now = time.time()
+                        new_state, result = _apply(provider, step, pipe.hgetall(_key(provider)), now, args)
+                        pipe.multi()
+                        pipe.hset(_key(provider), mapping=new_state)
+                        pipe.expire(_key(provider), STATE_TTL)
+                        pipe.execute()
+                        return result
+                    except redis.WatchError:
+                        continue
+            if not force:
+                return None
+            print(f"[ratelimit] {provider}: {step.__name__} lost {WATCH_RETRIES} WATCH races; writing unconditionally")
+            now = time.time()
+            new_state, result = _apply(provider, step, client.hgetall(_key(provider)), now, args)
+            pipe = client.pipeline()
+            pipe.hset(_key(provider), mapping=new_state)
+            pipe.expire(_key(provider), STATE_TTL)
+            pipe.execute()
+            return result
+        except Exception as e:
+            print(f"[ratelimit] Redis unavailable ({e}); throttling {provider} in-process")
+    with _lock:
+        now = time.time()
+        _local[provider], result = _apply(provider, step, _local.get(provider), now, args)
+        return result
+
+
+def acquire(provider):
+    """Block until the provider's bucket grants a call."""
+    while True:
+        wait = _update(provider, _take)
+        if wait is None:
+            wait = 0.05  # lost every WATCH race; try again shortly
+        if wait <= 0:
+            return
+        time.sleep(min(wait, MAX_SLEEP_SECONDS))
+
+
+def backoff(attempt):
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.8, 1.2)
+
+
+def retry_after_seconds(headers):
+    """Seconds from a Retry-After header, or None when absent or not in seconds."""
+    value = headers.get('retry-after') if headers is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
+
+
+def rate_limit_info(error):
+    """(is_rate_limited, retry_after_seconds_or_None) for an exception from a provider call."""
+    if isinstance(error, RateLimited):
+        return True, error.retry_after
+    if getattr(error, 'status_code', None) in RATE_LIMIT_STATUSES:
+        response = getattr(error, 'response', None)
+        return True, retry_after_seconds(getattr(response, 'headers', None))
+    return False, None
+
+
+def call(provider, fn, *args, **kwargs):
+    """
+    Run fn under the provider's budget. Rate-limit errors pause the provider
+    and retry up to RATE_LIMIT_RETRIES times; other errors propagate at once.
+    """
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        acquire(provider)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            limited, retry_after = rate_limit_info(e)
+            if not limited or attempt == RATE_LIMIT_RETRIES:
+                raise
+            delay = retry_after if retry_after is not None else backoff(attempt)
+            print(f"[ratelimit] {provider} rate limited; pausing {delay:.1f}s (attempt {attempt + 1})")
+            _update(provider, _throttled, delay, force=True)
+            continue
+        _update(provider, _recovered)
+        return result
@@ -0,0 +1,52 @@
+from flask import request, jsonify, Blueprint
+
+from ..middleware.auth import optional_auth
+from ..services.analytics_cube import DIMENSIONS, load_cube, roll_up
+
+analytics = Blueprint("analytics", __name__)
+
+# Query parameter -> cube dimension it filters
+FILTER_PARAMS = {
+    'concept_id': 'concept',
+    'category': 'category',
+    'lecture_id': 'lecture',
+    'cohort': 'cohort',
+}
+
+
+@analytics.route('/api/courses/<course_id>/analytics', methods=['GET'])
+@optional_auth
+def get_course_analytics(course_id):
+    """
+    Class-wide mastery roll-up.
+
+    ?group_by=concept,category,lecture,cohort (any subset, default concept)
+    ?category=&cohort=&concept_id=&lecture_id= filters (comma-separated values)
+    ?refresh=true rebuilds the cube from student_mastery
+    """
+    try:
+        group_by = [d.strip() for d in request.args.get('group_by', 'concept').split(',') if d.strip()]
+        unknown = [d for d in group_by if d not in DIMENSIONS]
+        if unknown:
+            return jsonify({'error': f"Unknown group_by dimension(s): {', '.join(unknown)}"}), 400
+        group_by = list(dict.fromkeys(group_by))
+
+        filters = {}
+        for param, dimension in FILTER_PARAMS.items():
+            raw = request.args.get(param)
+            if raw:
+                filters[dimension] = {v.strip() for v in raw.split(',') if v.strip()}
+
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        dims, cells, built_at = load_cube(course_id, refresh=refresh)
+
+        return jsonify({
+            'course_id': course_id,
+            'group_by': group_by,
+            'filters': {d: sorted(v) for d, v in filters.items()},
+            'built_at': built_at,
+            'groups': roll_up(dims, cells, group_by, filters),
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,17 +1,20 @@
 from flask import request, jsonify, Blueprint
-import os
 from dotenv import load_dotenv
-from anthropic import Anthropic
 
 from ..db import supabase
 from ..middleware.auth import optional_auth
 from ..cache import cache_get, cache_set
+from ..query import select_in
+from ..services.mastery import apply_mastery_op
+from ..services.concept_detector import get_detector
+from ..llm import available
+from ..services.content_tasks import generate_concept_page, generate_concept_quiz, CONCEPT_CONTENT, try_enqueue_course_content
 
 load_dotenv()
 concepts = Blueprint("concepts", __name__)
 
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else None
+
+MAX_DETECT_TEXTS = 500
 
 
 @concepts.route('/api/concepts/<concept_id>', methods=['GET'])
@@ -34,8 +37,27 @@ def get_concepts():
     if not ids:
         return jsonify([]), 200
 
-    result = supabase.table('concept_nodes').select('id, label, description').in_('id', ids).execute()
-    return jsonify(result.data), 200
+    return jsonify(select_in('concept_nodes', 'id, label, description', 'id', ids)), 200
+
+
+@concepts.route('/api/courses/<course_id>/concepts/detect', methods=['POST'])
+@optional_auth
+def detect_concepts(course_id):
+    """Tag text with the course's concepts using the lexical detector (no LLM call)."""
+    data = request.json or {}
+    texts = data.get('texts')
+    if texts is None and isinstance(data.get('text'), str):
+        texts = [data['text']]
+    if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({'error': 'Provide text or a non-empty texts list'}), 400
+    if len(texts) > MAX_DETECT_TEXTS:
+        return jsonify({'error': f'At most {MAX_DETECT_TEXTS} texts per request'}), 400
+
+    detector = get_detector(course_id)
+    results = [detector.find(text) for text in texts]
+    if 'texts' not in data:
+        return jsonify({'concepts': results[0]}), 200
+    return jsonify({'results': [{'concepts': r} for r in results]}), 200
 
 
 @concepts.route('/api/concepts/<concept_id>/learning-page', methods=['GET'])
@@ -134,22 +156,12 @@ def submit_quiz(concept_id):
 
     # Update student mastery
     try:
-        # Get current confidence
-        current = supabase.table('student_mastery').select('confidence').eq(
-            'student_id', student_id
-        ).eq('concept_id', concept_id).execute()
-
-        if not current.data:
+        result = apply_mastery_op(student_id, concept_id, 'delta', confidence_delta)
+        if result is None:
             return jsonify({'error': 'Mastery record not found'}), 404
 
-        old_confidence = current.data[0]['confidence']
-        new_confidence = min(1.0, old_confidence + confidence_delta)
-
-        # Update confidence
-        supabase.table('student_mastery').update({
-            'confidence': new_confidence,
-            'last_updated': 'NOW()'
-        }).eq('student_id', student_id).eq('concept_id', concept_id).execute()
+        old_confidence = result['old_confidence']
+        new_confidence = result['confidence']
 
         # Compute colors
         def confidence_to_color(conf):
@@ -177,159 +189,31 @@ def submit_quiz(concept_id):
         return jsonify({'error': str(e)}), 500
 
 
-def _generate_learning_page_content(concept_id):
-    """Helper function to generate learning page content."""
-    # Get concept details
-    concept_result = supabase.table('concept_nodes').select('label, description, category').eq('id', concept_id).execute()
-    if not concept_result.data:
-        raise ValueError('Concept not found')
-
-    concept = concept_result.data[0]
-
-    # Generate learning page using Claude
-    prompt = f"""Create a comprehensive learning page for the concept: {concept['label']}
-
-Description: {concept.get('description', 'N/A')}
-Category: {concept.get('category', 'N/A')}
-
-Generate a well-structured markdown document that includes:
-1. A clear explanation of what the concept is
-2. Key points and important details
-3. Mathematical formulas using LaTeX notation ($inline$ and $$display$$)
-4. Practical examples or applications
-5. Common pitfalls or misconceptions
-
-Keep it concise but thorough (aim for 200-400 words). Use markdown formatting with headers (##, ###), bold, lists, and LaTeX for math.
-
-Return ONLY the markdown content, no additional commentary."""
-
-    response = anthropic_client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    content = response.content[0].text
-
-    # Check if already exists
-    existing = supabase.table('concept_learning_pages').select('id').eq('concept_id', concept_id).execute()
-
-    if existing.data:
-        # Update existing
-        supabase.table('concept_learning_pages').update({
-            'content': content
-        }).eq('concept_id', concept_id).execute()
-    else:
-        # Insert new
-        supabase.table('concept_learning_pages').insert({
-            'concept_id': concept_id,
-            'content': content
-        }).execute()
-
-    return {'concept_id': concept_id, 'concept_label': concept['label'], 'content': content}
-
-
 @concepts.route('/api/concepts/<concept_id>/learning-page/generate', methods=['POST'])
 @optional_auth
 def generate_learning_page(concept_id):
-    """Generate and store learning page content for a concept using Claude."""
-    if not anthropic_client:
+    """Generate and store learning page content for a concept using Claude. ?refresh=true skips the response cache."""
+    if not available('anthropic'):
         return jsonify({'error': 'Anthropic API not configured'}), 500
 
     try:
-        result = _generate_learning_page_content(concept_id)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        result = generate_concept_page(concept_id, bypass_cache=refresh)
         return jsonify({**result, 'status': 'generated'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-def _generate_quiz_questions(concept_id):
-    """Helper function to generate quiz questions."""
-    import json
-
-    # Get concept details
-    concept_result = supabase.table('concept_nodes').select('label, description, category').eq('id', concept_id).execute()
-    if not concept_result.data:
-        raise ValueError('Concept not found')
-
-    concept = concept_result.data[0]
-
-    # Generate quiz questions using Claude
-    prompt = f"""Create 5 multiple choice quiz questions for the concept: {concept['label']}
-
-Description: {concept.get('description', 'N/A')}
-Category: {concept.get('category', 'N/A')}
-
-Generate 5 questions that test understanding of this concept. Each question should:
-- Have 4 options (A, B, C, D)
-- Have exactly one correct answer
-- Include a brief explanation of why the answer is correct
-- Range from basic understanding to deeper application
-
-Return your response as a JSON array with this exact structure:
-[
-  {{
-    "question": "Question text here?",
-    "option_a": "First option",
-    "option_b": "Second option",
-    "option_c": "Third option",
-    "option_d": "Fourth option",
-    "correct_answer": 0,
-    "explanation": "Explanation of the correct answer"
-  }}
-]
-
-Note: correct_answer is 0 for A, 1 for B, 2 for C, 3 for D.
-Return ONLY the JSON array, no additional text."""
-
-    response = anthropic_client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=2500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-
-    content = response.content[0].text
-
-    # Parse JSON response (handle markdown code blocks)
-    if '```json' in content:
-        content = content.split('```json')[1].split('```')[0].strip()
-    elif '```' in content:
-        content = content.split('```')[1].split('```')[0].strip()
-
-    questions = json.loads(content)
-
-    if not isinstance(questions, list) or len(questions) != 5:
-        raise ValueError('Invalid response format from Claude')
-
-    # Delete existing questions for this concept
-    supabase.table('concept_quiz_questions').delete().eq('concept_id', concept_id).execute()
-
-    # Insert new questions
-    for idx, q in enumerate(questions):
-        supabase.table('concept_quiz_questions').insert({
-            'concept_id': concept_id,
-            'question': q['question'],
-            'option_a': q['option_a'],
-            'option_b': q['option_b'],
-            'option_c': q['option_c'],
-            'option_d': q['option_d'],
-            'correct_answer': q['correct_answer'],
-            'explanation': q['explanation'],
-            'question_order': idx
-        }).execute()
-
-    return {'concept_id': concept_id, 'concept_label': concept['label'], 'questions_generated': len(questions)}
-
-
 @concepts.route('/api/concepts/<concept_id>/quiz/generate', methods=['POST'])
 @optional_auth
 def generate_quiz(concept_id):
-    """Generate and store quiz questions for a concept using Claude."""
-    if not anthropic_client:
+    """Generate and store quiz questions for a concept using Claude. ?refresh=true skips the response cache."""
+    if not available('anthropic'):
         return jsonify({'error': 'Anthropic API not configured'}), 500
 
     try:
-        result = _generate_quiz_questions(concept_id)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        result = generate_concept_quiz(concept_id, bypass_cache=refresh)
         return jsonify({**result, 'status': 'generated'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -338,48 +222,20 @@ def generate_quiz(concept_id):
 @concepts.route('/api/courses/<course_id>/generate-learning-content', methods=['POST'])
 @optional_auth
 def generate_course_learning_content(course_id):
-    """Generate learning pages and quizzes for all concepts in a course."""
-    if not anthropic_client:
+    """Queue learning page and quiz generation for all concepts in a course."""
+    if not available('anthropic'):
         return jsonify({'error': 'Anthropic API not configured'}), 500
 
     try:
-        # Get all concepts for this course
-        concepts_result = supabase.table('concept_nodes').select('id, label').eq('course_id', course_id).execute()
+        concepts_result = supabase.table('concept_nodes').select('id').eq('course_id', course_id).execute()
 
         if not concepts_result.data:
             return jsonify({'error': 'No concepts found for this course'}), 404
 
-        concepts = concepts_result.data
-        results = {
-            'total': len(concepts),
-            'generated': [],
-            'failed': []
-        }
-
-        # Generate content for each concept
-        for concept in concepts:
-            print(f"Generating content for: {concept['label']}")
-            try:
-                # Generate learning page
-                _generate_learning_page_content(concept['id'])
-
-                # Generate quiz
-                _generate_quiz_questions(concept['id'])
-
-                results['generated'].append({
-                    'concept_id': concept['id'],
-                    'label': concept['label']
-                })
-
-            except Exception as e:
-                print(f"Failed to generate content for {concept['label']}: {str(e)}")
-                results['failed'].append({
-                    'concept_id': concept['id'],
-                    'label': concept['label'],
-                    'error': str(e)
-                })
-
-        return jsonify(results), 200
+        generation = try_enqueue_course_content(course_id, [c['id'] for c in concepts_result.data], CONCEPT_CONTENT)
+        if 'error' in generation:
+            return jsonify({'total': len(concepts_result.data), 'generation': generation}), 503
+        return jsonify({'total': len(concepts_result.data), **generation}), 202
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
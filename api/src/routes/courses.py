@@ -6,13 +6,16 @@ import random
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import hashlib
-import threading
 
 from ..db import supabase
 
 from ..services.create_kg import create_kg, parse_kg, calculate_importance
 from ..middleware.auth import optional_auth, require_auth
 from ..cache import cache_delete_pattern
+from ..snapshot import invalidate_course_snapshot
+from ..services.analytics_cube import invalidate_cube
+from ..query import select_in, delete_in
+from ..services.content_tasks import COURSE_CONTENT, try_enqueue_course_content
 
 load_dotenv()
 courses = Blueprint("courses", __name__)
@@ -71,8 +74,7 @@ def get_courses():
         students = supabase.table('students').select('course_id').eq('auth_id', g.user['sub']).execute().data
         if students:
             course_ids = [s['course_id'] for s in students]
-            result = supabase.table('courses').select('*').in_('id', course_ids).execute()
-            return jsonify(result.data), 200
+            return jsonify(select_in('courses', '*', 'id', course_ids)), 200
 
     # No auth or no profile: return all (backward compat)
     result = supabase.table('courses').select('*').execute()
@@ -129,15 +131,9 @@ def enroll_student():
         'auth_id': auth_id,
     }).execute().data[0]
 
-    # Bulk-insert mastery rows for all concepts in the course
-    concepts = supabase.table('concept_nodes').select('id').eq('course_id', course_row['id']).execute().data
-    mastery_rows = [{
-        'student_id': student['id'],
-        'concept_id': c['id'],
-        'confidence': 0.0,
-    } for c in concepts]
-    if mastery_rows:
-        supabase.table('student_mastery').insert(mastery_rows).execute()
+    # Mastery is sparse: no rows until the student touches a concept (missing = 0.0)
+    invalidate_course_snapshot(course_row['id'])
+    invalidate_cube(course_row['id'])
 
     return jsonify({
         'student_id': student['id'],
@@ -208,10 +204,7 @@ def upload_course_pdf(course_id):
     # Delete mastery rows for old concepts
     old_concepts = supabase.table('concept_nodes').select('id').eq('course_id', course_id).execute().data
     if old_concepts:
-        old_ids = [c['id'] for c in old_concepts]
-        for i in range(0, len(old_ids), 100):
-            batch = old_ids[i:i+100]
-            supabase.table('student_mastery').delete().in_('concept_id', batch).execute()
+        delete_in('student_mastery', 'concept_id', [c['id'] for c in old_concepts])
     supabase.table('concept_nodes').delete().eq('course_id', course_id).execute()
 
     # Insert nodes
@@ -233,93 +226,18 @@ def upload_course_pdf(course_id):
                 'target_id': node_id_map[target_label]
             }).execute()
 
-    # Re-create eager mastery rows for all students in this course
-    students = supabase.table('students').select('id').eq('course_id', course_id).execute().data
-    if students and node_id_map:
-        mastery_rows = [
-            {'student_id': s['id'], 'concept_id': cid, 'confidence': 0.0}
-            for s in students for cid in node_id_map.values()
-        ]
-        for i in range(0, len(mastery_rows), 500):
-            supabase.table('student_mastery').insert(mastery_rows[i:i+500]).execute()
+    # No mastery rows for the new concepts: missing rows read as 0.0 (gray)
 
     # Invalidate graph cache for this course
     cache_delete_pattern(f"graph:{course_id}:*")
+    invalidate_course_snapshot(course_id)
+    invalidate_cube(course_id)
+
+    # Queue content generation for every concept; the job workers pick it up. The graph is
+    # already stored by now, so a queue failure is reported alongside it rather than as a 500
+    generation = try_enqueue_course_content(course_id, list(node_id_map.values()), COURSE_CONTENT)
+    if 'error' in generation:
+        return jsonify({**graph_data, 'generation': generation}), 200
+    print(f"[upload] Queued {generation['enqueued']} content jobs for {len(node_id_map)} concepts", flush=True)
 
-    # Trigger async content generation for all concepts
-    def generate_content_async():
-        """Background thread to generate learning content"""
-        from ..services.generate_content import generate_learning_page, generate_practice_quiz, get_further_reading
-        import sys
-
-        print(f"[async] Starting content generation for course {course_id}", file=sys.stderr, flush=True)
-
-        concepts_result = supabase.table('concept_nodes').select('id, label, description').eq('course_id', course_id).execute()
-
-        for concept in concepts_result.data:
-            concept_id = concept['id']
-            label = concept['label']
-            description = concept.get('description', '')
-
-            try:
-                # Generate learning page
-                page_result = generate_learning_page(
-                    concept_label=label,
-                    concept_description=description,
-                    past_mistakes=[],
-                    current_confidence=0.5
-                )
-
-                further_reading = get_further_reading(label, description)
-
-                # Insert learning page
-                supabase.table('learning_pages').insert({
-                    'student_id': None,
-                    'concept_id': concept_id,
-                    'title': page_result['title'],
-                    'content': page_result['content'],
-                    'further_reading': further_reading
-                }).execute()
-
-                # Generate quiz
-                quiz_result = generate_practice_quiz(
-                    concept_label=label,
-                    concept_description=description,
-                    past_mistakes=[],
-                    current_confidence=0.5
-                )
-
-                # Create quiz
-                quiz_resp = supabase.table('practice_quizzes').insert({
-                    'student_id': None,
-                    'concept_id': concept_id,
-                    'page_id': None,
-                    'status': 'template'
-                }).execute()
-
-                quiz_id = quiz_resp.data[0]['id']
-
-                # Insert questions
-                for q_idx, q in enumerate(quiz_result['questions']):
-                    supabase.table('quiz_questions').insert({
-                        'quiz_id': quiz_id,
-                        'question_text': q['question_text'],
-                        'options': q['options'],
-                        'correct_answer': q['correct_answer'],
-                        'explanation': q['explanation'],
-                        'question_order': q_idx + 1
-                    }).execute()
-
-                print(f"[async] ✓ Generated content for {label}", file=sys.stderr, flush=True)
-
-            except Exception as e:
-                print(f"[async] ✗ Failed for {label}: {str(e)}", file=sys.stderr, flush=True)
-
-        print(f"[async] Content generation complete for course {course_id}", file=sys.stderr, flush=True)
-
-    # Start background thread
-    thread = threading.Thread(target=generate_content_async, daemon=True)
-    thread.start()
-    print(f"[upload] Started async content generation for {len(node_id_map)} concepts", flush=True)
-
-    return jsonify(graph_data), 200
+    return jsonify({**graph_data, 'generation': {k: generation[k] for k in ('enqueued', 'skipped')}}), 200
@@ -0,0 +1,158 @@
+import hashlib
+import json
+
+from flask import request, jsonify, Blueprint
+
+from ..db import supabase
+from ..middleware.auth import optional_auth
+from ..cache import cache_get, cache_set
+from ..snapshot import load_course_snapshot
+from ..parallel import submit
+from ..query import select_in
+from ..log import log_event
+from ..services.lecture_coverage import load_coverage, coverage_timeline
+from .graph import build_importance
+from .heatmap import build_heatmap
+from .students import build_students_summary
+
+dashboard = Blueprint("dashboard", __name__)
+
+SECTIONS = ('graph', 'heatmap', 'students', 'lectures', 'polls', 'transcript', 'coverage')
+MAX_TRANSCRIPT_LIMIT = 200
+
+
+def _section_version(payload):
+    """Short content hash so clients can tell which sections changed between loads."""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+def _current_lecture_id(lectures):
+    """Prefer a live lecture; otherwise the most recently started one."""
+    for lecture in lectures:
+        if lecture.get('status') == 'live':
+            return lecture['id']
+    return lectures[0]['id'] if lectures else None
+
+
+def _fetch_course_mastery(student_ids):
+    return select_in('student_mastery', 'student_id, concept_id, confidence', 'student_id', student_ids)
+
+
+def _fetch_polls(lecture_id):
+    return supabase.table('poll_questions').select('*').eq('lecture_id', lecture_id).execute().data
+
+
+def _fetch_transcript(lecture_id, limit):
+    rows = supabase.table('transcript_chunks').select(
+        'id, text, timestamp_sec, speaker_name, created_at'
+    ).eq('lecture_id', lecture_id).order('created_at', desc=True).limit(limit).execute().data
+    return list(reversed(rows))
+
+
+def _graph_section(course_id, snapshot):
+    cache_key = f"graph:{course_id}:none"
+    hit = cache_get(cache_key)
+    if hit is not None:
+        return hit
+
+    nodes = [dict(n) for n in snapshot['concepts']]
+    importance = build_importance(nodes, snapshot['edges'])
+    for node in nodes:
+        node['importance'] = importance.get(node['label'], 0.5)
+
+    result = {'nodes': nodes, 'edges': snapshot['edges']}
+    cache_set(cache_key, result, ttl_seconds=60)
+    return result
+
+
+@dashboard.route('/api/courses/<course_id>/dashboard', methods=['GET'])
+@optional_auth
+def get_dashboard(course_id):
+    """Everything the professor dashboard needs, gathered concurrently in one request."""
+    sections_param = request.args.get('sections', '')
+    requested = [s.strip() for s in sections_param.split(',') if s.strip()] or list(SECTIONS)
+    unknown = [s for s in requested if s not in SECTIONS]
+    if unknown:
+        return jsonify({'error': f"Unknown sections: {', '.join(unknown)}"}), 400
+
+    transcript_limit = max(1, min(request.args.get('transcript_limit', 50, type=int), MAX_TRANSCRIPT_LIMIT))
+
+    snapshot = load_course_snapshot(course_id)
+
+    lecture_id = request.args.get('lecture_id')
+    if not lecture_id and any(s in requested for s in ('polls', 'transcript', 'coverage')):
+        lecture_id = _current_lecture_id(snapshot['lectures'])
+
+    # Serve heatmap/students from their endpoint caches when warm
+    heatmap_hit = cache_get(f"heatmap:{course_id}") if 'heatmap' in requested else None
+    summary_hit = cache_get(f"students_summary:{course_id}") if 'students' in requested else None
+    need_mastery = ('heatmap' in requested and heatmap_hit is None) or \
+                   ('students' in requested and summary_hit is None)
+
+    # Independent reads run concurrently; latency is bounded by the slowest one
+    futures = {}
+    if need_mastery:
+        student_ids = [s['id'] for s in snapshot['students']]
+        futures['mastery'] = submit(_fetch_course_mastery, student_ids)
+    if 'polls' in requested and lecture_id:
+        futures['polls'] = submit(_fetch_polls, lecture_id)
+    if 'transcript' in requested and lecture_id:
+        futures['transcript'] = submit(_fetch_transcript, lecture_id, transcript_limit)
+    if 'coverage' in requested and lecture_id:
+        futures['coverage'] = submit(load_coverage, lecture_id)
+
+    fetched = {}
+    errors = {}
+    for name, future in futures.items():
+        try:
+            fetched[name] = future.result()
+        except Exception as e:
+            log_event('dashboard', 'fetch_failed', level='error', course_id=course_id, section=name, error=str(e))
+            errors[name] = str(e)
+
+    sections = {}
+    for name in requested:
+        try:
+            if name == 'graph':
+                sections[name] = _graph_section(course_id, snapshot)
+            elif name == 'heatmap':
+                if heatmap_hit is None and 'mastery' in fetched:
+                    heatmap_hit = build_heatmap(snapshot['concepts'], len(snapshot['students']), fetched['mastery'])
+                    cache_set(f"heatmap:{course_id}", heatmap_hit, ttl_seconds=5)
+                if heatmap_hit is not None:
+                    sections[name] = heatmap_hit
+            elif name == 'students':
+                if summary_hit is None and 'mastery' in fetched:
+                    by_student = {}
+                    for m in fetched['mastery']:
+                        by_student.setdefault(m['student_id'], []).append(m['confidence'])
+                    summary_hit = build_students_summary(snapshot['students'], by_student, len(snapshot['concepts']))
+                    cache_set(f"students_summary:{course_id}", summary_hit, ttl_seconds=10)
+                if summary_hit is not None:
+                    sections[name] = summary_hit
+            elif name == 'lectures':
+                sections[name] = snapshot['lectures']
+            elif name in ('polls', 'transcript'):
+                if not lecture_id:
+                    sections[name] = []
+                elif name in fetched:
+                    sections[name] = fetched[name]
+            elif name == 'coverage':
+                if fetched.get('coverage'):
+                    sections[name] = coverage_timeline(fetched['coverage'], snapshot['concepts'])
+                elif not lecture_id or 'coverage' in fetched:
+                    sections[name] = None
+        except Exception as e:
+            log_event('dashboard', 'section_failed', level='error', course_id=course_id, section=name, error=str(e))
+            errors[name] = str(e)
+
+    result = {
+        'course_id': course_id,
+        'lecture_id': lecture_id,
+        'sections': sections,
+        'versions': {name: _section_version(payload) for name, payload in sections.items()},
+    }
+    if errors:
+        result['errors'] = errors
+    return jsonify(result), 200
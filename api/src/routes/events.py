@@ -0,0 +1,31 @@
+from flask import jsonify, Blueprint, Response, stream_with_context
+
+from ..db import supabase
+from ..middleware.auth import optional_auth
+from ..events import open_stream, sse_lines
+
+events = Blueprint("events", __name__)
+
+STREAM_RETRY_AFTER = 5
+
+
+@events.route('/api/courses/<course_id>/events', methods=['GET'])
+@optional_auth
+def stream_course_events(course_id):
+    """
+    Server-Sent Events stream of a course's changes: mastery, heatmap cells,
+    transcript chunks and poll status. Load the dashboard once, then apply these.
+    """
+    if not supabase.table('courses').select('id').eq('id', course_id).execute().data:
+        return jsonify({'error': 'Course not found'}), 404
+
+    q = open_stream(course_id)
+    if q is None:
+        response = jsonify({'error': 'Too many open event streams, retry shortly'})
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response, 503
+
+    response = Response(stream_with_context(sse_lines(course_id, q)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # keep nginx from buffering the stream
+    return response
@@ -0,0 +1,39 @@
+from flask import jsonify, Blueprint
+
+from ..db import supabase
+from ..middleware.auth import optional_auth
+from ..jobs import course_progress, get_job
+from ..llm import metrics, PROVIDER_OVERRIDE, MODELS
+from ..llm_cache import stats as cache_stats
+
+generation = Blueprint("generation", __name__)
+
+
+@generation.route('/api/courses/<course_id>/generation', methods=['GET'])
+@optional_auth
+def get_generation_progress(course_id):
+    """Progress of the course's content generation jobs (latest job per concept and content type)."""
+    if not supabase.table('courses').select('id').eq('id', course_id).execute().data:
+        return jsonify({'error': 'Course not found'}), 404
+    return jsonify(course_progress(course_id)), 200
+
+
+@generation.route('/api/generation-jobs/<job_id>', methods=['GET'])
+@optional_auth
+def get_generation_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
+@generation.route('/api/llm/metrics', methods=['GET'])
+@optional_auth
+def get_llm_metrics():
+    """Model call metrics per call site for this process, with response cache hit counts."""
+    return jsonify({
+        'provider_override': PROVIDER_OVERRIDE or None,
+        'models': MODELS,
+        'sites': metrics(),
+        'cache': cache_stats(),
+    }), 200
@@ -3,6 +3,8 @@ from ..db import supabase
 from ..services.create_kg import calculate_importance
 from ..middleware.auth import optional_auth
 from ..cache import cache_get, cache_set
+from ..parallel import run_parallel
+from ..services import mastery_buffer
 
 graph = Blueprint("graph", __name__)
 
@@ -18,6 +20,27 @@ def confidence_to_color(confidence):
         return "green"
 
 
+def build_importance(nodes, edges):
+    """Importance by concept label, calculated from the graph structure."""
+    node_map = {n['id']: n['label'] for n in nodes}
+    graph_data = {
+        'nodes': {n['label']: n.get('description', '') for n in nodes},
+        'edges': [(node_map[e['source_id']], node_map[e['target_id']])
+                  for e in edges
+                  if e['source_id'] in node_map and e['target_id'] in node_map]
+    }
+    return calculate_importance(graph_data)
+
+
+def _with_pending_mastery(result, student_id):
+    """Layer buffered (not yet flushed) mastery writes over a student's graph."""
+    if not student_id or not mastery_buffer.ENABLED:
+        return result
+    nodes = mastery_buffer.apply_pending(student_id, result['nodes'], key='id')
+    nodes = [dict(n, color=confidence_to_color(n['confidence'])) for n in nodes]
+    return dict(result, nodes=nodes)
+
+
 @graph.route('/api/courses/<course_id>/graph', methods=['GET'])
 @optional_auth
 def get_graph(course_id):
@@ -27,22 +50,17 @@ def get_graph(course_id):
     cache_key = f"graph:{course_id}:{student_id or 'none'}"
     hit = cache_get(cache_key)
     if hit is not None:
-        return jsonify(hit), 200
-
-    nodes = supabase.table('concept_nodes').select('*').eq('course_id', course_id).execute().data
-    edges = supabase.table('concept_edges').select('*').eq('course_id', course_id).execute().data
+        return jsonify(_with_pending_mastery(hit, student_id)), 200
 
-    # Build graph for importance calculation
-    node_map = {n['id']: n['label'] for n in nodes}
-    graph_data = {
-        'nodes': {n['label']: n.get('description', '') for n in nodes},
-        'edges': [(node_map[e['source_id']], node_map[e['target_id']])
-                  for e in edges
-                  if e['source_id'] in node_map and e['target_id'] in node_map]
-    }
+    # Nodes, edges and the student's mastery are independent reads: run them together
+    nodes, edges, mastery = run_parallel(
+        lambda: supabase.table('concept_nodes').select('*').eq('course_id', course_id).execute().data,
+        lambda: supabase.table('concept_edges').select('*').eq('course_id', course_id).execute().data,
+        lambda: supabase.table('student_mastery').select('concept_id, confidence').eq(
+            'student_id', student_id).execute().data if student_id else [],
+    )
 
-    # Calculate importance from graph structure
-    importance = calculate_importance(graph_data)
+    importance = build_importance(nodes, edges)
 
     # Add importance to response
     for node in nodes:
@@ -50,8 +68,6 @@ def get_graph(course_id):
 
     # Add mastery if student_id provided
     if student_id:
-        mastery = supabase.table('student_mastery').select('concept_id, confidence').eq('student_id',
-                                                                                        student_id).execute().data
         mastery_map = {m['concept_id']: m['confidence'] for m in mastery}
 
         for node in nodes:
@@ -63,4 +79,4 @@ def get_graph(course_id):
     result = {'nodes': nodes, 'edges': edges}
     # Cache with student mastery for 10s, without for 60s (structure changes rarely)
     cache_set(cache_key, result, ttl_seconds=10 if student_id else 60)
-    return jsonify(result), 200
\ No newline at end of file
+    return jsonify(_with_pending_mastery(result, student_id)), 200
\ No newline at end of file
@@ -3,6 +3,8 @@ from flask import request, jsonify, Blueprint
 from ..db import supabase
 from ..middleware.auth import optional_auth
 from ..cache import cache_get, cache_set
+from ..parallel import run_parallel
+from ..query import select_all
 
 load_dotenv()
 heatmap = Blueprint("heatmap", __name__)
@@ -19,34 +21,15 @@ def confidence_to_color(confidence):
         return "green"
 
 
-@heatmap.route('/api/courses/<course_id>/heatmap', methods=['GET'])
-@optional_auth
-def get_heatmap(course_id):
-    # Check Redis cache
-    cache_key = f"heatmap:{course_id}"
-    hit = cache_get(cache_key)
-    if hit is not None:
-        return jsonify(hit), 200
-
-    # Get all concepts for the course
-    concepts = supabase.table('concept_nodes').select('id, label, category').eq('course_id', course_id).execute().data
-
-    # Get all students in the course
-    students = supabase.table('students').select('id').eq('course_id', course_id).execute().data
-    total_students = len(students)
-
-    if not concepts:
-        return jsonify({"concepts": [], "total_students": total_students}), 200
-
-    # Batch: fetch ALL mastery records for all concepts in one query
-    concept_ids = [c['id'] for c in concepts]
-    all_mastery = supabase.table('student_mastery').select('concept_id, confidence').in_(
-        'concept_id', concept_ids
-    ).limit(5000).execute().data
+def build_heatmap(concepts, total_students, mastery_rows):
+    """
+    Aggregate mastery rows into a per-concept color distribution and average.
 
+    Mastery is sparse: students without a row for a concept count as 0.0 (gray).
+    """
     # Group mastery records by concept_id in Python
     mastery_by_concept = {}
-    for record in all_mastery:
+    for record in mastery_rows:
         cid = record['concept_id']
         mastery_by_concept.setdefault(cid, []).append(record['confidence'])
 
@@ -61,8 +44,9 @@ def get_heatmap(course_id):
         for conf in confidences:
             distribution[confidence_to_color(conf)] += 1
             total_confidence += conf
+        distribution["gray"] += max(0, total_students - len(confidences))
 
-        avg_confidence = total_confidence / len(confidences) if confidences else 0.0
+        avg_confidence = total_confidence / max(total_students, len(confidences)) if confidences else 0.0
 
         heatmap_data.append({
             "id": concept_id,
@@ -72,9 +56,35 @@ def get_heatmap(course_id):
             "avg_confidence": round(avg_confidence, 2)
         })
 
-    result = {
+    return {
         "concepts": heatmap_data,
         "total_students": total_students
     }
+
+
+@heatmap.route('/api/courses/<course_id>/heatmap', methods=['GET'])
+@optional_auth
+def get_heatmap(course_id):
+    # Check Redis cache
+    cache_key = f"heatmap:{course_id}"
+    hit = cache_get(cache_key)
+    if hit is not None:
+        return jsonify(hit), 200
+
+    # Concepts, students and mastery are independent: mastery is filtered by the
+    # concept's course through an inner join rather than a concept id list.
+    # Roster and mastery are paged in full so large courses are not cut off.
+    concepts, students, all_mastery = run_parallel(
+        lambda: supabase.table('concept_nodes').select('id, label, category').eq('course_id', course_id).execute().data,
+        lambda: select_all(lambda: supabase.table('students').select('id').eq('course_id', course_id)),
+        lambda: select_all(lambda: supabase.table('student_mastery').select(
+            'concept_id, confidence, concept_nodes!inner(course_id)').eq('concept_nodes.course_id', course_id)),
+    )
+    total_students = len(students)
+
+    if not concepts:
+        return jsonify({"concepts": [], "total_students": total_students}), 200
+
+    result = build_heatmap(concepts, total_students, all_mastery)
     cache_set(cache_key, result, ttl_seconds=5)
     return jsonify(result), 200
\ No newline at end of file
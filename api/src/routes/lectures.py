@@ -2,10 +2,21 @@ from flask import request, jsonify, Blueprint
 
 from ..db import supabase
 from ..middleware.auth import optional_auth
+from ..snapshot import load_course_snapshot, invalidate_course_snapshot
+from ..query import (select_in, page_limit, parse_cursor, make_cursor, keyset_page, PAGE_SIZE,
+                     KEYSET_PAGE_SIZE, KEYSET_MAX_PAGE_SIZE)
+from ..services.lecture_coverage import load_coverage, coverage_timeline
+from ..events import publish
 
 lectures = Blueprint("lectures", __name__)
 
 
+def _publish_lecture(lecture):
+    """Tell the course's dashboards that a lecture started or changed status."""
+    publish(lecture['course_id'], 'lecture', {'lecture_id': lecture['id'], 'status': lecture.get('status'),
+                                              'started_at': lecture.get('started_at')})
+
+
 # --- P1 CRUD endpoints ---
 
 @lectures.route('/api/lectures', methods=['POST'])
@@ -18,6 +29,9 @@ def create_lecture():
         'status': data.get('status', 'live')
     }).execute()
 
+    invalidate_course_snapshot(data['course_id'])
+    _publish_lecture(result.data[0])
+
     return jsonify(result.data[0]), 201
 
 
@@ -48,6 +62,9 @@ def update_lecture(lecture_id):
     if not result.data:
         return jsonify({'error': 'Lecture not found'}), 404
 
+    invalidate_course_snapshot(result.data[0]['course_id'])
+    _publish_lecture(result.data[0])
+
     return jsonify(result.data[0]), 200
 
 
@@ -56,45 +73,71 @@ def update_lecture(lecture_id):
 @lectures.route('/api/lectures/<lecture_id>/transcript-chunks', methods=['GET'])
 @optional_auth
 def get_transcript_chunks(lecture_id):
-    limit = request.args.get('limit', type=int)
-    query = supabase.table('transcript_chunks').select('text, timestamp_sec').eq('lecture_id', lecture_id).order('created_at', desc=True)
-    if limit:
-        query = query.limit(limit)
-    result = query.execute()
-    return jsonify(result.data), 200
+    """
+    Newest chunks first. With `after`, only chunks stored after the cursor (a
+    bounded page, still newest first); X-Next-Cursor is the cursor for the next poll.
+    """
+    after = request.args.get('after')
+    try:
+        limit = page_limit(request.args.get('limit'), default=None if after is None else KEYSET_PAGE_SIZE,
+                           maximum=PAGE_SIZE if after is None else KEYSET_MAX_PAGE_SIZE)
+        cursor = parse_cursor('transcript_chunks', after) if after else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    build = lambda: supabase.table('transcript_chunks').select('id, text, timestamp_sec, created_at').eq(
+        'lecture_id', lecture_id)
+    if cursor is None:
+        query = build().order('created_at', desc=True).order('id', desc=True)
+        if limit:
+            query = query.limit(limit)
+        rows, has_more = query.execute().data, None
+        next_cursor = make_cursor(rows[0]) if rows else None
+    else:
+        # Keyset pages run oldest-first so the cursor advances; flip for the response
+        rows, has_more = keyset_page(build, cursor, limit)
+        next_cursor = make_cursor(rows[-1]) if rows else after
+        rows.reverse()
+
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if has_more is not None:
+        response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    return response, 200
 
 
 @lectures.route('/api/lectures/<lecture_id>/recent-concept', methods=['GET'])
 @optional_auth
 def get_recent_concept(lecture_id):
-    result = supabase.table('transcript_concepts').select(
-        'concept_id, transcript_chunks!inner(lecture_id, created_at)'
-    ).eq(
-        'transcript_chunks.lecture_id', lecture_id
-    ).order(
-        'transcript_chunks(created_at)', desc=True
-    ).limit(1).execute()
-
-    if not result.data:
+    coverage = load_coverage(lecture_id)
+    if not coverage or not coverage['recent_concept_id']:
         return jsonify({'error': 'No concepts detected yet'}), 404
 
-    return jsonify({'concept_id': result.data[0]['concept_id']}), 200
+    return jsonify({'concept_id': coverage['recent_concept_id']}), 200
 
 
 @lectures.route('/api/lectures/<lecture_id>/covered-concepts', methods=['GET'])
 @optional_auth
 def get_covered_concepts(lecture_id):
     """Get unique concept IDs detected in a lecture's transcript."""
-    result = supabase.table('transcript_concepts').select(
-        'concept_id, transcript_chunks!inner(lecture_id)'
-    ).eq(
-        'transcript_chunks.lecture_id', lecture_id
-    ).execute()
-
-    concept_ids = list(set(row['concept_id'] for row in result.data))
+    coverage = load_coverage(lecture_id)
+    concept_ids = list(coverage['concepts']) if coverage else []
     return jsonify({'concept_ids': concept_ids}), 200
 
 
+@lectures.route('/api/lectures/<lecture_id>/coverage', methods=['GET'])
+@optional_auth
+def get_lecture_coverage(lecture_id):
+    """Per-concept first/last mention, mention count and time spent, ordered by first mention."""
+    coverage = load_coverage(lecture_id)
+    if not coverage:
+        return jsonify({'error': 'Lecture not found'}), 404
+
+    concepts = load_course_snapshot(coverage['course_id'])['concepts']
+    return jsonify(coverage_timeline(coverage, concepts)), 200
+
+
 @lectures.route('/api/lectures/<lecture_id>/transcript-excerpts', methods=['GET'])
 @optional_auth
 def get_transcript_excerpts(lecture_id):
@@ -106,28 +149,25 @@ def get_transcript_excerpts(lecture_id):
     if not concept_ids:
         return jsonify([]), 200
 
-    # Fetch lecture details (course_id needed to determine lecture number)
-    lecture_result = supabase.table('lecture_sessions').select('title, course_id, started_at').eq('id', lecture_id).execute()
-    if not lecture_result.data:
+    # Lecture number (1-indexed position among course lectures by start time) is kept in the coverage
+    coverage = load_coverage(lecture_id)
+    if not coverage:
         return jsonify([]), 200
-    lecture = lecture_result.data[0]
-
-    # Compute lecture number (1-indexed position among course lectures by start time)
-    all_lectures = supabase.table('lecture_sessions').select('id').eq('course_id', lecture['course_id']).order('started_at').execute()
-    lecture_number = next((i + 1 for i, l in enumerate(all_lectures.data) if l['id'] == lecture_id), 1)
-    lecture_title = f"Lecture {lecture_number}"
+    lecture_title = f"Lecture {coverage['ordinal']}"
 
     # Filter by lecture_id (BUG FIX: was previously returning chunks from ALL lectures)
-    result = supabase.table('transcript_concepts').select(
-        'concept_id, transcript_chunks!inner(text, timestamp_sec, lecture_id)'
-    ).eq(
-        'transcript_chunks.lecture_id', lecture_id
-    ).in_('concept_id', concept_ids).order(
-        'transcript_chunks(timestamp_sec)'
-    ).limit(20).execute()
+    rows = select_in(
+        'transcript_concepts', 'concept_id, transcript_chunks!inner(text, timestamp_sec, lecture_id)',
+        'concept_id', concept_ids,
+        filters=lambda q: q.eq('transcript_chunks.lecture_id', lecture_id),
+        order='transcript_chunks(timestamp_sec)',
+        sort_key=lambda row: row['transcript_chunks'].get('timestamp_sec') or 0,
+        limit=20,
+        key='transcript_chunk_id,concept_id',
+    )
 
     excerpts = []
-    for row in result.data:
+    for row in rows:
         chunk = row.get('transcript_chunks', {})
         excerpts.append({
             'text': chunk.get('text', ''),
@@ -2,32 +2,40 @@ from dotenv import load_dotenv
 from flask import Blueprint, request, jsonify
 from ..db import supabase
 from ..services.generate_content import generate_learning_page, generate_practice_quiz, get_further_reading
+from ..services.content_tasks import COURSE_CONTENT, try_enqueue_course_content
 from ..middleware.auth import optional_auth
+from ..query import select_in
+from ..services.mastery import apply_mastery_op
+from ..llm import MODELS, ProviderError, available, complete
 from datetime import datetime
 
 load_dotenv()
 pages = Blueprint('pages', __name__)
 
 
+def _wrong_quiz_responses(student_id, concept_id, limit=10):
+    """Incorrect practice quiz responses for a student on a concept (most recent quizzes first)."""
+    quizzes = supabase.table('practice_quizzes').select('id').eq('student_id', student_id).eq(
+        'concept_id', concept_id).execute().data
+    return select_in(
+        'quiz_responses', 'misconception, quiz_questions!inner(question_text, explanation)',
+        'quiz_id', [q['id'] for q in quizzes],
+        filters=lambda q: q.eq('is_correct', False),
+        limit=limit,
+    )
+
+
 @pages.route('/api/debug/test-claude', methods=['GET'])
 @optional_auth
 def test_claude():
     """Debug endpoint to test Claude directly"""
-    import anthropic
-    import os
-
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=100,
-        messages=[{"role": "user", "content": "Return only JSON: {\"test\": \"hello\"}"}]
-    )
+    completion = complete('test', [{"role": "user", "content": "Return only JSON: {\"test\": \"hello\"}"}],
+                          MODELS['content'], 100)
 
     return jsonify({
-        "raw_response": message.content[0].text,
-        "response_length": len(message.content[0].text),
-        "api_key_set": bool(os.getenv("ANTHROPIC_API_KEY"))
+        "raw_response": completion.text,
+        "response_length": len(completion.text),
+        "api_key_set": available('anthropic')
     }), 200
 
 
@@ -58,24 +66,13 @@ def generate_page(student_id):
 
     # Get past quiz mistakes
     past_mistakes = []
-    responses_resp = supabase.table('quiz_responses') \
-        .select('misconception, quiz_questions!inner(question_text)') \
-        .eq('is_correct', False) \
-        .in_('quiz_id',
-             supabase.table('practice_quizzes') \
-             .select('id') \
-             .eq('student_id', student_id) \
-             .eq('concept_id', concept_id) \
-             .execute().data
-             ) \
-        .limit(10) \
-        .execute()
-
-    if responses_resp.data:
-        past_mistakes = [r['misconception'] for r in responses_resp.data if r.get('misconception')]
-
-    if responses_resp.data:
-        past_mistakes = [r['quiz_questions']['explanation'] for r in responses_resp.data if r.get('quiz_questions')]
+    wrong_responses = _wrong_quiz_responses(student_id, concept_id)
+
+    if wrong_responses:
+        past_mistakes = [r['misconception'] for r in wrong_responses if r.get('misconception')]
+
+    if wrong_responses:
+        past_mistakes = [r['quiz_questions']['explanation'] for r in wrong_responses if r.get('quiz_questions')]
 
     # Generate page using Claude
     result = generate_learning_page(
@@ -152,27 +149,17 @@ def generate_quiz(page_id):
     concept_id = page['concept_id']
 
     # Get student mastery
-    mastery_resp = supabase.table('student_mastery').select('confidence').eq('student_id', student_id).eq('concept_id',
-                                                                                                          concept_id).single().execute()
-    current_confidence = mastery_resp.data['confidence'] if mastery_resp.data else 0.0
+    # Mastery is sparse: no row means the concept is untouched (0.0)
+    mastery_rows = supabase.table('student_mastery').select('confidence').eq('student_id', student_id).eq(
+        'concept_id', concept_id).execute().data
+    current_confidence = mastery_rows[0]['confidence'] if mastery_rows else 0.0
 
     # Get past mistakes
     past_mistakes = []
-    responses_resp = supabase.table('quiz_responses') \
-        .select('misconception, quiz_questions!inner(question_text)') \
-        .eq('is_correct', False) \
-        .in_('quiz_id',
-             supabase.table('practice_quizzes') \
-             .select('id') \
-             .eq('student_id', student_id) \
-             .eq('concept_id', concept_id) \
-             .execute().data
-             ) \
-        .limit(10) \
-        .execute()
-
-    if responses_resp.data:
-        past_mistakes = [r['misconception'] for r in responses_resp.data if r.get('misconception')]
+    wrong_responses = _wrong_quiz_responses(student_id, concept_id)
+
+    if wrong_responses:
+        past_mistakes = [r['misconception'] for r in wrong_responses if r.get('misconception')]
 
     # Generate quiz using Claude
     result = generate_practice_quiz(
@@ -228,6 +215,41 @@ def get_quiz(quiz_id):
     return jsonify(quiz.data), 200
 
 
+def _grade_quiz(quiz_id, questions, answers):
+    """Grade every question in memory. Returns (response_rows, correct_count)."""
+    responses = []
+    correct_count = 0
+    for question in questions:
+        selected = answers.get(question['id'], '')
+        is_correct = selected == question['correct_answer']
+        if is_correct:
+            correct_count += 1
+
+        # Generate misconception for wrong answers
+        misconception = None
+        if not is_correct and selected:
+            index = ord(selected[0]) - 65
+            if 0 <= index < len(question['options']):
+                misconception = f"Chose '{question['options'][index]}' instead of correct answer. {question['explanation']}"
+
+        responses.append({
+            'quiz_id': quiz_id,
+            'question_id': question['id'],
+            'selected_answer': selected,
+            'is_correct': is_correct,
+            'misconception': misconception
+        })
+    return responses, correct_count
+
+
+def _score_to_confidence(score):
+    if score >= 0.8:
+        return 0.85
+    elif score >= 0.6:
+        return 0.60
+    return 0.30
+
+
 @pages.route('/api/quizzes/<quiz_id>/submit', methods=['POST'])
 @optional_auth
 def submit_quiz(quiz_id):
@@ -235,7 +257,7 @@ def submit_quiz(quiz_id):
     data = request.json
     answers = data.get('answers', {})  # {question_id: "A", ...}
 
-    # Get quiz
+    # One read: quiz plus its answer key
     quiz = supabase.table('practice_quizzes').select('*, quiz_questions(*)').eq('id', quiz_id).single().execute()
 
     if not quiz.data:
@@ -244,74 +266,44 @@ def submit_quiz(quiz_id):
     if quiz.data['status'] == 'completed':
         return jsonify({'error': 'Quiz already completed'}), 400
 
-    # Grade answers
-    correct_count = 0
-    total_questions = len(quiz.data['quiz_questions'])
-
-    for question in quiz.data['quiz_questions']:
-        question_id = question['id']
-        selected = answers.get(question_id, '')
-        is_correct = selected == question['correct_answer']
-
-        if is_correct:
-            correct_count += 1
-
-        # Generate misconception for wrong answers
-        misconception = None
-        if not is_correct and selected:
-            misconception = f"Chose '{question['options'][ord(selected) - 65]}' instead of correct answer. {question['explanation']}"
-
-        # Save response
-        supabase.table('quiz_responses').insert({
-            'quiz_id': quiz_id,
-            'question_id': question_id,
-            'selected_answer': selected,
-            'is_correct': is_correct,
-            'misconception': misconception
-        }).execute()
-
-    # Calculate score
+    questions = quiz.data['quiz_questions']
+    responses, correct_count = _grade_quiz(quiz_id, questions, answers)
+    total_questions = len(questions)
     score = correct_count / total_questions if total_questions > 0 else 0.0
 
-    # Update quiz status
-    supabase.table('practice_quizzes').update({
+    # Claim first: the status update only matches a quiz that is not completed yet,
+    # so it doubles as the double-submit guard
+    completed_at = datetime.utcnow().isoformat()
+    claimed = supabase.table('practice_quizzes').update({
         'status': 'completed',
         'score': score,
-        'completed_at': datetime.utcnow().isoformat()
-    }).eq('id', quiz_id).execute()
-
-    # Update student mastery based on score
-    student_id = quiz.data['student_id']
-    concept_id = quiz.data['concept_id']
+        'completed_at': completed_at
+    }).eq('id', quiz_id).neq('status', 'completed').execute().data
+    if not claimed:
+        return jsonify({'error': 'Quiz already completed'}), 400
 
-    if score >= 0.8:
-        new_confidence = 0.85
-    elif score >= 0.6:
-        new_confidence = 0.60
-    else:
-        new_confidence = 0.30
-
-    # Get current confidence
-    mastery = supabase.table('student_mastery').select('confidence').eq('student_id', student_id).eq('concept_id',
-                                                                                                     concept_id).single().execute()
-    current = mastery.data['confidence'] if mastery.data else 0.0
-
-    # Only update if new score is better
-    if new_confidence > current:
-        supabase.table('student_mastery').update({
-            'confidence': new_confidence,
-            'attempts':
-                supabase.table('student_mastery').select('attempts').eq('student_id', student_id).eq('concept_id',
-                                                                                                     concept_id).single().execute().data[
-                    'attempts'] + 1
-        }).eq('student_id', student_id).eq('concept_id', concept_id).execute()
+    try:
+        if responses:
+            supabase.table('quiz_responses').insert(responses).execute()
+    except Exception as e:
+        # Release the claim so the student can resubmit instead of being locked out
+        supabase.table('practice_quizzes').update({
+            'status': quiz.data['status'],
+            'score': quiz.data.get('score'),
+            'completed_at': quiz.data.get('completed_at')
+        }).eq('id', quiz_id).eq('completed_at', completed_at).execute()
+        print(f"[submit_quiz] Failed to store responses for quiz {quiz_id}: {e}")
+        return jsonify({'error': 'Failed to save quiz responses, please resubmit'}), 500
+
+    # Mastery only after this submission won the claim, so a losing duplicate cannot raise it
+    apply_mastery_op(quiz.data['student_id'], quiz.data['concept_id'], 'max', _score_to_confidence(score))
 
     # Return results with correct answers
     return jsonify({
         'score': score,
         'correct': correct_count,
         'total': total_questions,
-        'questions': quiz.data['quiz_questions']
+        'questions': questions
     }), 200
 
 
@@ -337,44 +329,26 @@ def delete_quiz(quiz_id):
 @optional_auth
 def perplexity_query():
     """Query Perplexity with a custom prompt"""
-    import requests
-    import os
-
     data = request.json
     prompt = data.get('prompt')
 
     if not prompt:
         return jsonify({'error': 'prompt required'}), 400
 
-    perplexity_key = os.getenv("PERPLEXITY_API_KEY")
-    if not perplexity_key:
+    if not available('perplexity'):
         return jsonify({'error': 'Perplexity API not configured'}), 500
 
     try:
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers={
-                "Authorization": f"Bearer {perplexity_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "sonar-pro",
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=30
-        )
-
-        if response.status_code != 200:
-            return jsonify({'error': 'Perplexity API failed', 'details': response.text}), response.status_code
-
-        result = response.json()
-        content = result['choices'][0]['message']['content']
+        completion = complete('perplexity_query', [{"role": "user", "content": prompt}], MODELS['search_pro'],
+                              None, provider='perplexity', timeout=30)
 
         return jsonify({
-            'response': content,
-            'citations': result['citations'] if 'citations' in result else []
+            'response': completion.text,
+            'citations': completion.extra.get('citations', [])
         }), 200
 
+    except ProviderError as e:
+        return jsonify({'error': 'Perplexity API failed', 'details': e.body}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -382,99 +356,13 @@ def perplexity_query():
 @pages.route('/api/courses/<course_id>/bulk-generate', methods=['POST'])
 @optional_auth
 def bulk_generate_course_content(course_id):
-    """Generate learning pages and quizzes for all concepts in a course"""
-    import sys
-
-    # Get all concepts for this course
-    concepts_result = supabase.table('concept_nodes').select('id, label, description').eq('course_id', course_id).execute()
+    """Queue learning page and quiz generation for all concepts in a course"""
+    concepts_result = supabase.table('concept_nodes').select('id').eq('course_id', course_id).execute()
 
     if not concepts_result.data:
         return jsonify({'error': 'No concepts found for this course'}), 404
 
-    concepts = concepts_result.data
-    results = {
-        'total': len(concepts),
-        'success': [],
-        'failed': []
-    }
-
-    for concept in concepts:
-        concept_id = concept['id']
-        label = concept['label']
-        description = concept.get('description', '')
-
-        print(f"Generating content for: {label}", file=sys.stderr, flush=True)
-
-        try:
-            # Generate learning page
-            page_result = generate_learning_page(
-                concept_label=label,
-                concept_description=description,
-                past_mistakes=[],
-                current_confidence=0.5
-            )
-
-            # Get further reading
-            further_reading = get_further_reading(label, description)
-
-            # Check if general page exists
-            existing_page = supabase.table('learning_pages').select('id').eq('concept_id', concept_id).is_('student_id', 'null').execute()
-
-            if existing_page.data:
-                supabase.table('learning_pages').update({
-                    'title': page_result['title'],
-                    'content': page_result['content'],
-                    'further_reading': further_reading
-                }).eq('concept_id', concept_id).is_('student_id', 'null').execute()
-            else:
-                supabase.table('learning_pages').insert({
-                    'student_id': None,
-                    'concept_id': concept_id,
-                    'title': page_result['title'],
-                    'content': page_result['content'],
-                    'further_reading': further_reading
-                }).execute()
-
-            # Generate quiz
-            quiz_result = generate_practice_quiz(
-                concept_label=label,
-                concept_description=description,
-                past_mistakes=[],
-                current_confidence=0.5
-            )
-
-            # Delete existing general quiz
-            existing_quizzes = supabase.table('practice_quizzes').select('id').eq('concept_id', concept_id).is_('student_id', 'null').execute()
-            for quiz in existing_quizzes.data:
-                supabase.table('practice_quizzes').delete().eq('id', quiz['id']).execute()
-
-            # Create new quiz
-            quiz_resp = supabase.table('practice_quizzes').insert({
-                'student_id': None,
-                'concept_id': concept_id,
-                'page_id': None,
-                'status': 'template'
-            }).execute()
-
-            quiz_id = quiz_resp.data[0]['id']
-
-            # Insert questions
-            for q_idx, q in enumerate(quiz_result['questions']):
-                supabase.table('quiz_questions').insert({
-                    'quiz_id': quiz_id,
-                    'question_text': q['question_text'],
-                    'options': q['options'],
-                    'correct_answer': q['correct_answer'],
-                    'explanation': q['explanation'],
-                    'question_order': q_idx + 1
-                }).execute()
-
-            results['success'].append(label)
-            print(f"✓ {label}", file=sys.stderr, flush=True)
-
-        except Exception as e:
-            error_msg = str(e)
-            results['failed'].append({'label': label, 'error': error_msg})
-            print(f"✗ {label}: {error_msg}", file=sys.stderr, flush=True)
-
-    return jsonify(results), 200
\ No newline at end of file
+    generation = try_enqueue_course_content(course_id, [c['id'] for c in concepts_result.data], COURSE_CONTENT)
+    if 'error' in generation:
+        return jsonify({'total': len(concepts_result.data), 'generation': generation}), 503
+    return jsonify({'total': len(concepts_result.data), **generation}), 202
\ No newline at end of file
@@ -2,9 +2,27 @@ from flask import request, jsonify, Blueprint
 
 from ..db import supabase
 from ..middleware.auth import optional_auth
+from ..events import publish
+from ..idempotency import run_idempotent
+from ..log import log_event
+from ..services.poll_responses import normalize_response, store_responses, apply_poll_mastery
+from ..services.concept_detector import course_for_lecture
+from ..services.poll_tally import load_tally, reconcile, tally_view
 
 polls = Blueprint("polls", __name__)
 
+MAX_BATCH_RESPONSES = 1000
+
+
+def _publish_status(poll):
+    """Tell the course's dashboards that a poll changed status."""
+    try:
+        course_id = course_for_lecture(poll['lecture_id']) if poll.get('lecture_id') else None
+        publish(course_id, 'poll', {'poll_id': poll['id'], 'lecture_id': poll.get('lecture_id'),
+                                    'concept_id': poll.get('concept_id'), 'status': poll.get('status')})
+    except Exception as e:
+        print(f"[polls] Failed to publish status of poll {poll.get('id')}: {e}")
+
 
 # --- P1 CRUD endpoints ---
 
@@ -39,6 +57,10 @@ def update_poll(poll_id):
     if not result.data:
         return jsonify({'error': 'Poll not found'}), 404
 
+    if 'concept_id' in data or data.get('status') == 'closed':
+        reconcile(poll_id)
+    if 'status' in data:
+        _publish_status(result.data[0])
     return jsonify(result.data[0]), 200
 
 
@@ -89,8 +111,17 @@ def update_poll_status(poll_id):
             return jsonify({'error': 'Poll not found'}), 404
 
         # Fetch the updated poll to return all fields
-        poll = supabase.table('poll_questions').select('id, status, question, concept_id').eq('id', poll_id).single().execute()
-        return jsonify(poll.data), 200
+        poll = supabase.table('poll_questions').select(
+            'id, status, question, concept_id, lecture_id').eq('id', poll_id).single().execute()
+
+        body = dict(poll.data)
+        _publish_status(poll.data)
+        if data['status'] == 'closed':
+            reconcile(poll_id)
+            if data.get('apply_mastery'):
+                # One batch for every response instead of a mastery call per student
+                body['mastery'] = apply_poll_mastery(poll.data)
+        return jsonify(body), 200
     except Exception as e:
         print(f"[update_poll_status] Error: {e}")
         import traceback
@@ -101,43 +132,85 @@ def update_poll_status(poll_id):
 @polls.route('/api/polls/<poll_id>/responses', methods=['POST'])
 @optional_auth
 def create_poll_response(poll_id):
-    try:
-        data = request.json
-        print(f"[create_poll_response] Storing response for poll {poll_id}, student {data.get('student_id')}")
-
-        result = supabase.table('poll_responses').insert({
-            'question_id': poll_id,
-            'student_id': data['student_id'],
-            'answer': data['answer'],
-            'evaluation': data.get('evaluation'),
-        }).execute()
-
-        if not result.data:
-            print(f"[create_poll_response] ERROR: Supabase insert returned no data")
-            return jsonify({'error': 'Failed to create response'}), 500
-
-        print(f"[create_poll_response] SUCCESS: Response stored with id {result.data[0].get('id')}")
-        return jsonify(result.data[0]), 201
-    except Exception as e:
-        print(f"[create_poll_response] EXCEPTION: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': 'Failed to create response', 'details': str(e)}), 500
+    """
+    Store one student's response. Upserted on (poll, student), so a resubmission
+    replaces the earlier answer; an Idempotency-Key header makes retries replay.
+    """
+    def handle():
+        try:
+            row = normalize_response(poll_id, request.json)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        try:
+            stored = store_responses(poll_id, [row])
+        except Exception as e:
+            log_event('poll_responses', 'store_failed', level='error', poll_id=poll_id, error=str(e))
+            return {'error': 'Failed to create response', 'details': str(e)}, 500
+        if not stored:
+            log_event('poll_responses', 'store_empty', level='error', poll_id=poll_id)
+            return {'error': 'Failed to create response'}, 500
+        log_event('poll_responses', 'stored', poll_id=poll_id, response_id=stored[0].get('id'))
+        return stored[0], 201
+
+    return run_idempotent(f"poll_responses:{poll_id}", handle)
+
+
+@polls.route('/api/polls/<poll_id>/responses/batch', methods=['POST'])
+@optional_auth
+def create_poll_responses_batch(poll_id):
+    """Store many responses in a few bulk upserts; one row per student, last answer wins."""
+    def handle():
+        items = (request.json or {}).get('responses')
+        if not isinstance(items, list) or not items:
+            return {'error': 'responses must be a non-empty list'}, 400
+        if len(items) > MAX_BATCH_RESPONSES:
+            return {'error': f'At most {MAX_BATCH_RESPONSES} responses per request'}, 400
+
+        rows = []
+        errors = []
+        for index, item in enumerate(items):
+            try:
+                rows.append(normalize_response(poll_id, item))
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            return {'error': 'Invalid responses', 'details': errors}, 400
+
+        if not supabase.table('poll_questions').select('id').eq('id', poll_id).execute().data:
+            return {'error': 'Poll not found'}, 404
+        try:
+            stored = store_responses(poll_id, rows)
+        except Exception as e:
+            log_event('poll_responses', 'batch_failed', level='error', poll_id=poll_id, size=len(rows), error=str(e))
+            return {'error': 'Failed to store responses', 'details': str(e)}, 500
+        log_event('poll_responses', 'batch_stored', poll_id=poll_id, received=len(rows), stored=len(stored))
+        return {'stored': len(stored), 'responses': [{'id': r['id'], 'student_id': r['student_id']} for r in stored]}, 200
+
+    return run_idempotent(f"poll_responses_batch:{poll_id}", handle)
 
 
 @polls.route('/api/polls/<poll_id>/responses', methods=['GET'])
 @optional_auth
 def get_poll_responses(poll_id):
     try:
-        print(f"[get_poll_responses] Fetching responses for poll {poll_id}")
         result = supabase.table('poll_responses').select(
             'id, question_id, student_id, answer, evaluation, answered_at'
         ).eq('question_id', poll_id).execute()
 
-        print(f"[get_poll_responses] Found {len(result.data)} responses")
+        log_event('poll_responses', 'listed', poll_id=poll_id, count=len(result.data))
         return jsonify(result.data), 200
     except Exception as e:
         print(f"[get_poll_responses] ERROR: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': 'Failed to fetch responses', 'details': str(e)}), 500
+
+
+@polls.route('/api/polls/<poll_id>/tally', methods=['GET'])
+@optional_auth
+def get_poll_tally(poll_id):
+    """Response count and evaluation distribution for a poll, from live counters."""
+    fields = load_tally(poll_id)
+    if fields is None:
+        return jsonify({'error': 'Poll not found'}), 404
+    return jsonify(tally_view(poll_id, fields)), 200
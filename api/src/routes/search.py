@@ -0,0 +1,37 @@
+from flask import request, jsonify, Blueprint
+
+from ..middleware.auth import optional_auth
+from ..services import search_index
+
+search = Blueprint("search", __name__)
+
+MAX_RESULTS = 100
+
+
+@search.route('/api/courses/<course_id>/search', methods=['GET'])
+@optional_auth
+def search_course(course_id):
+    """
+    BM25 search over a course's transcripts, learning pages and tutoring messages.
+
+    ?q= query text (required)
+    ?sources=transcript,learning_page,tutoring_message (default all)
+    ?student_id= restricts learning pages and tutoring messages to that student
+    ?limit= max results (default 20, max 100)
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+
+    sources = [s.strip() for s in request.args.get('sources', '').split(',') if s.strip()] or None
+    unknown = [s for s in sources or [] if s not in search_index.SOURCES]
+    if unknown:
+        return jsonify({'error': f"Unknown sources: {', '.join(unknown)}", 'valid': list(search_index.SOURCES)}), 400
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_RESULTS))
+        results = search_index.search(course_id, query, sources=sources, student_id=request.args.get('student_id'), limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'query': query, 'results': results}), 200
@@ -1,10 +1,19 @@
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, Response, stream_with_context
+import json
 import os
 from dotenv import load_dotenv
 
 from ..db import supabase
 from ..middleware.auth import optional_auth
-from ..cache import cache_get, cache_set, cache_delete_pattern
+from ..cache import cache_get, cache_set
+from ..snapshot import load_course_snapshot, invalidate_course_snapshot
+from ..query import select_in
+from ..parallel import run_parallel
+from ..log import log_event
+from ..services.analytics_cube import invalidate_cube, record_mastery_changes
+from ..services.mastery import (parse_op, apply_rule, apply_mastery_op, batch_update, invalidate_mastery,
+                                load_mastery, upsert_mastery_rows, publish_mastery_changes, courses_for)
+from ..services import mastery_buffer, roster_import
 
 load_dotenv()
 students = Blueprint("students", __name__)
@@ -25,6 +34,27 @@ def confidence_to_color(confidence):
         return "green"
 
 
+def build_students_summary(students_data, confidences_by_student, num_concepts):
+    """
+    Per-student mastery color distribution from {student_id: [confidence, ...]}.
+
+    Mastery is sparse: concepts without a row count as gray.
+    """
+    result = []
+    for s in students_data:
+        confidences = confidences_by_student.get(s['id'], [])
+        dist = {'green': 0, 'lime': 0, 'yellow': 0, 'orange': 0, 'gray': 0}
+        for conf in confidences:
+            dist[confidence_to_color(conf)] += 1
+        dist['gray'] += max(0, num_concepts - len(confidences))
+        result.append({
+            'id': s['id'],
+            'name': s['name'],
+            'masteryDistribution': dist,
+        })
+    return result
+
+
 @students.route('/api/courses/<course_id>/students', methods=['GET'])
 @optional_auth
 def get_students(course_id):
@@ -41,32 +71,20 @@ def get_students_summary(course_id):
     if hit is not None:
         return jsonify(hit), 200
 
-    students_data = supabase.table('students').select('id, name').eq('course_id', course_id).limit(500).execute().data
+    # Roster and concept count come from the shared course snapshot
+    snapshot = load_course_snapshot(course_id)
+    students_data = snapshot['students']
     if not students_data:
         return jsonify([]), 200
 
     student_ids = [s['id'] for s in students_data]
 
-    # Batch mastery queries in groups of 50 to stay under Supabase row/URL limits
+    # Chunked to stay under Supabase row/URL limits; chunks run concurrently
     by_student = {}
-    batch_size = 50
-    for i in range(0, len(student_ids), batch_size):
-        batch_ids = student_ids[i:i + batch_size]
-        rows = supabase.table('student_mastery').select('student_id, confidence').in_('student_id', batch_ids).limit(2000).execute().data
-        for m in rows:
-            by_student.setdefault(m['student_id'], []).append(m['confidence'])
+    for m in select_in('student_mastery', 'student_id, confidence', 'student_id', student_ids):
+        by_student.setdefault(m['student_id'], []).append(m['confidence'])
 
-    result = []
-    for s in students_data:
-        confidences = by_student.get(s['id'], [])
-        dist = {'green': 0, 'lime': 0, 'yellow': 0, 'orange': 0, 'gray': 0}
-        for conf in confidences:
-            dist[confidence_to_color(conf)] += 1
-        result.append({
-            'id': s['id'],
-            'name': s['name'],
-            'masteryDistribution': dist,
-        })
+    result = build_students_summary(students_data, by_student, len(snapshot['concepts']))
 
     cache_set(cache_key, result, ttl_seconds=10)
     return jsonify(result), 200
@@ -78,25 +96,70 @@ def create_student(course_id):
     data = request.json
 
     # Create student
-    student = supabase.table('students').insert({
+    row = {
         'name': data['name'],
         'email': data.get('email'),
         'course_id': course_id
-    }).execute().data[0]
+    }
+    if data.get('cohort'):
+        row['cohort'] = data['cohort']
+    student = supabase.table('students').insert(row).execute().data[0]
 
-    # Create mastery rows for all concepts
-    concepts = supabase.table('concept_nodes').select('id').eq('course_id', course_id).execute().data
+    # Mastery is sparse: rows appear as the student touches concepts (missing = 0.0)
+    invalidate_course_snapshot(course_id)
+    invalidate_cube(course_id)
 
-    mastery_rows = [{
-        'student_id': student['id'],
-        'concept_id': concept['id'],
-        'confidence': 0.0
-    } for concept in concepts]
+    return jsonify(student), 201
 
-    if mastery_rows:
-        supabase.table('student_mastery').insert(mastery_rows).execute()
 
-    return jsonify(student), 201
+@students.route('/api/courses/<course_id>/students/import', methods=['POST'])
+@optional_auth
+def import_students(course_id):
+    """
+    Bulk-create students from a CSV or NDJSON roster (columns: name, email, cohort).
+
+    Send the roster as the raw body or as a multipart 'file'. The body is parsed
+    as it is read and students are inserted in chunks. With ?stream=true (or
+    Accept: application/x-ndjson) progress lines are streamed as NDJSON,
+    otherwise a single summary is returned.
+    """
+    upload = request.files.get('file')
+    if upload:
+        source, content_type, filename = upload.stream, upload.mimetype, upload.filename
+    else:
+        source, content_type, filename = request.stream, request.mimetype, None
+
+    fmt = request.args.get('format') or roster_import.detect_format(content_type, filename)
+    if fmt not in roster_import.FORMATS:
+        return jsonify({'error': 'Roster must be CSV or NDJSON (set Content-Type or ?format=csv|ndjson)'}), 400
+
+    course = supabase.table('courses').select('id').eq('id', course_id).execute().data
+    if not course:
+        return jsonify({'error': 'Course not found'}), 404
+
+    def run_import():
+        try:
+            for event in roster_import.import_roster(course_id, roster_import.iter_roster_rows(source, fmt)):
+                if event['type'] == 'done':
+                    log_event('import_students', 'done', level='warning' if event['failed'] else 'info',
+                              course_id=course_id, format=fmt, created=event['created'],
+                              skipped=event['skipped_duplicates'], failed=event['failed'])
+                yield event
+        finally:
+            invalidate_course_snapshot(course_id)
+            invalidate_cube(course_id)
+
+    stream = request.args.get('stream', '').lower() == 'true' or \
+        'application/x-ndjson' in request.headers.get('Accept', '')
+    if stream:
+        lines = (json.dumps(event) + '\n' for event in run_import())
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson'), 200
+
+    summary = None
+    for summary in run_import():
+        pass
+    summary.pop('type', None)
+    return jsonify(summary), 201 if summary['created'] else 200
 
 
 @students.route('/api/students/<student_id>/mastery', methods=['GET'])
@@ -104,17 +167,24 @@ def create_student(course_id):
 def get_mastery(student_id):
     cache_key = f"mastery:{student_id}"
     hit = cache_get(cache_key)
-    if hit is not None:
-        return jsonify(hit), 200
-
-    result = supabase.table('student_mastery').select('concept_id, confidence, attempts').eq('student_id',
-                                                                                             student_id).execute()
-
-    mastery = result.data
-    for m in mastery:
-        m['color'] = confidence_to_color(m['confidence'])
-
-    cache_set(cache_key, mastery, ttl_seconds=10)
+    if hit is None:
+        student, rows = run_parallel(
+            lambda: supabase.table('students').select('course_id').eq('id', student_id).execute().data,
+            lambda: supabase.table('student_mastery').select('concept_id, confidence, attempts').eq(
+                'student_id', student_id).execute().data,
+        )
+        # Mastery is sparse: untouched concepts have no row and read as 0.0
+        hit = rows
+        if student and student[0].get('course_id'):
+            concepts = load_course_snapshot(student[0]['course_id'])['concepts']
+            seen = {r['concept_id'] for r in rows}
+            hit = rows + [{'concept_id': c['id'], 'confidence': 0.0, 'attempts': 0}
+                          for c in concepts if c['id'] not in seen]
+        cache_set(cache_key, hit, ttl_seconds=10)
+
+    # Cache holds database values; buffered writes are layered on per request
+    mastery = mastery_buffer.apply_pending(student_id, hit)
+    mastery = [dict(m, color=confidence_to_color(m['confidence'])) for m in mastery]
     return jsonify(mastery), 200
 
 
@@ -123,51 +193,42 @@ def get_mastery(student_id):
 def update_mastery(student_id, concept_id):
     data = request.json
 
-    # Get current mastery (fetch confidence and attempts in one query)
-    current = supabase.table('student_mastery').select('confidence, attempts').eq('student_id', student_id).eq('concept_id',
-                                                                                                     concept_id).execute().data
-
-    if not current:
+    try:
+        op, value = parse_op(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if mastery_buffer.ENABLED:
+        # The flush would drop ops for unknown pairs silently, so reject them here
+        course_id = courses_for([student_id])[student_id]
+        if not course_id or concept_id not in {c['id'] for c in load_course_snapshot(course_id)['concepts']}:
+            return jsonify({'error': 'Mastery record not found'}), 404
+
+        current = supabase.table('student_mastery').select('confidence, attempts').eq(
+            'student_id', student_id).eq('concept_id', concept_id).execute().data
+        base = current[0] if current else {'confidence': 0.0, 'attempts': 0}
+
+        # Write-behind: start from the value including still-buffered ops, then buffer this one
+        row = mastery_buffer.apply_pending(student_id, [dict(base, concept_id=concept_id)])[0]
+        new_confidence, _ = apply_rule(row['confidence'], op, value)
+        mastery_buffer.enqueue(student_id, concept_id, op, value)
+        return jsonify({
+            'concept_id': concept_id,
+            'old_color': confidence_to_color(row['confidence']),
+            'new_color': confidence_to_color(new_confidence),
+            'confidence': new_confidence
+        }), 200
+
+    # Read, rule and write happen in one atomic call; caches are invalidated inside
+    result = apply_mastery_op(student_id, concept_id, op, value)
+    if result is None:
         return jsonify({'error': 'Mastery record not found'}), 404
 
-    old_confidence = current[0]['confidence']
-    old_attempts = current[0]['attempts']
-    old_color = confidence_to_color(old_confidence)
-
-    # Calculate new confidence
-    if 'confidence' in data:
-        new_confidence = max(0.0, min(1.0, data['confidence']))
-    elif 'eval_result' in data:
-        if data['eval_result'] == 'correct':
-            new_confidence = max(old_confidence, 0.85)
-        elif data['eval_result'] == 'partial':
-            new_confidence = max(old_confidence, 0.50)
-        else:  # wrong
-            new_confidence = 0.20 if old_confidence == 0.0 else min(old_confidence, 0.20)
-    elif 'delta' in data:
-        new_confidence = max(0.0, min(1.0, old_confidence + data['delta']))
-    else:
-        return jsonify({'error': 'Must provide confidence, eval_result, or delta'}), 400
-
-    new_color = confidence_to_color(new_confidence)
-
-    # Update (no nested query — reuse attempts from the first read)
-    supabase.table('student_mastery').update({
-        'confidence': new_confidence,
-        'attempts': old_attempts + (1 if 'eval_result' in data else 0)
-    }).eq('student_id', student_id).eq('concept_id', concept_id).execute()
-
-    # Invalidate caches affected by mastery change
-    cache_delete_pattern(f"mastery:{student_id}")
-    cache_delete_pattern(f"graph:*:{student_id}")
-    cache_delete_pattern("heatmap:*")
-    cache_delete_pattern("students_summary:*")
-
     return jsonify({
         'concept_id': concept_id,
-        'old_color': old_color,
-        'new_color': new_color,
-        'confidence': new_confidence
+        'old_color': confidence_to_color(result['old_confidence']),
+        'new_color': confidence_to_color(result['confidence']),
+        'confidence': result['confidence']
     }), 200
 
 
@@ -181,29 +242,87 @@ def attendance_boost():
     if not student_ids or not concept_ids:
         return jsonify({'updated': 0}), 200
 
-    # Batch read: fetch all relevant mastery rows in one query
-    all_mastery = supabase.table('student_mastery').select('id, student_id, concept_id, confidence').in_(
-        'student_id', student_ids
-    ).in_('concept_id', concept_ids).execute().data
+    # One concurrent read of existing rows plus id validation; the concept list is bounded by the course size
+    current, known_students, known_concepts = load_mastery(student_ids, concept_ids)
 
-    # Calculate which rows need updating
+    # Mastery is sparse: pairs without a row start from 0.0 and are inserted by the upsert
     to_update = []
-    for row in all_mastery:
-        old_conf = row['confidence']
-        if old_conf < 0.3:
-            new_conf = min(old_conf + 0.05, 0.3)
-            if new_conf != old_conf:
-                to_update.append({'id': row['id'], 'confidence': new_conf})
+    changes = []
+    for sid in dict.fromkeys(student_ids):
+        if sid not in known_students:
+            continue
+        for cid in dict.fromkeys(concept_ids):
+            if cid not in known_concepts:
+                continue
+            row = current.get((sid, cid))
+            old_conf = row['confidence'] if row else 0.0
+            if old_conf < 0.3:
+                new_conf = min(old_conf + 0.05, 0.3)
+                if new_conf != old_conf:
+                    to_update.append({'student_id': sid, 'concept_id': cid, 'confidence': new_conf})
+                    changes.append((sid, cid, old_conf, new_conf))
 
     # Batch update using upsert
     if to_update:
-        supabase.table('student_mastery').upsert(to_update).execute()
+        upsert_mastery_rows(to_update)
+        record_mastery_changes(changes)
 
         # Invalidate caches for all affected students
-        for sid in student_ids:
-            cache_delete_pattern(f"mastery:{sid}")
-            cache_delete_pattern(f"graph:*:{sid}")
-        cache_delete_pattern("heatmap:*")
-        cache_delete_pattern("students_summary:*")
+        invalidate_mastery(student_ids)
+        publish_mastery_changes(changes)
+
+    return jsonify({'updated': len(to_update)}), 200
+
+
+MAX_BATCH_UPDATES = 10000
 
-    return jsonify({'updated': len(to_update)}), 200
\ No newline at end of file
+
+@students.route('/api/mastery/batch', methods=['POST'])
+@optional_auth
+def batch_update_mastery():
+    """
+    Apply many mastery operations in one request.
+
+    Body: {"updates": [{"student_id", "concept_id", "confidence" | "eval_result" | "delta"}, ...]}
+    Operations follow the same rules as PUT /api/students/<sid>/mastery/<cid>.
+    """
+    data = request.json or {}
+    updates = data.get('updates')
+    if not isinstance(updates, list):
+        return jsonify({'error': 'updates must be a list'}), 400
+    if len(updates) > MAX_BATCH_UPDATES:
+        return jsonify({'error': f'At most {MAX_BATCH_UPDATES} updates per request'}), 400
+
+    # Validate everything up front so a bad entry never leaves the batch half-applied
+    parsed = []
+    errors = []
+    for index, entry in enumerate(updates):
+        if not isinstance(entry, dict) or not entry.get('student_id') or not entry.get('concept_id'):
+            errors.append({'index': index, 'error': 'student_id and concept_id are required'})
+            continue
+        try:
+            op, value = parse_op(entry)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        parsed.append((entry['student_id'], entry['concept_id'], op, value))
+    if errors:
+        return jsonify({'error': 'Invalid updates', 'details': errors}), 400
+
+    try:
+        if mastery_buffer.ENABLED:
+            # Land buffered single-row writes first so ops apply in arrival order
+            mastery_buffer.flush()
+        outcome = batch_update(parsed)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    for r in outcome['results']:
+        r['old_color'] = confidence_to_color(r['old_confidence'])
+        r['new_color'] = confidence_to_color(r['confidence'])
+
+    return jsonify({
+        'updated': len(outcome['results']),
+        'results': outcome['results'],
+        'not_found': outcome['not_found'],
+    }), 200
@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 from ..db import supabase
 from ..middleware.auth import optional_auth
 from ..cache import cache_get, cache_set, cache_delete_pattern
+from ..parallel import run_parallel
+from ..query import select_in
+from ..snapshot import load_course_snapshot
 
 load_dotenv()
 study_groups = Blueprint("study_groups", __name__)
@@ -83,9 +86,10 @@ def _find_match(student_id, course_id, concept_ids):
     Returns match details dict or None.
     """
     # Fetch student's mastery for their selected concepts
-    my_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-        'student_id', student_id
-    ).in_('concept_id', concept_ids).execute().data
+    my_mastery_rows = select_in(
+        'student_mastery', 'concept_id, confidence', 'concept_id', concept_ids,
+        filters=lambda q: q.eq('student_id', student_id),
+    )
 
     my_mastery = {row['concept_id']: row['confidence'] for row in my_mastery_rows}
 
@@ -125,29 +129,31 @@ def _find_match(student_id, course_id, concept_ids):
         }).execute().data[0]
 
         # Fetch concept labels for shared concepts
-        concept_labels_rows = supabase.table('concept_nodes').select('id, label').in_('id', shared_concepts).execute().data
+        concept_labels_rows = select_in('concept_nodes', 'id, label', 'id', shared_concepts)
         labels = [c['label'] for c in concept_labels_rows]
         concept_nodes_map = {c['id']: c for c in concept_labels_rows}
 
-        # For fallback: use partner's 3 weakest concepts as proxy for their selections
+        # For fallback: use partner's 3 weakest concepts as proxy for their selections.
+        # Mastery is sparse, so untouched course concepts count as 0.0 (the weakest).
         partner_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
             'student_id', partner_student['id']
         ).execute().data
         partner_mastery = {row['concept_id']: row['confidence'] for row in partner_mastery_rows}
-        partner_weakest = sorted(partner_mastery_rows, key=lambda r: r['confidence'])[:3]
-        partner_concept_ids = [r['concept_id'] for r in partner_weakest]
+        course_concept_ids = [c['id'] for c in load_course_snapshot(course_id)['concepts']]
+        partner_concept_ids = sorted(course_concept_ids, key=lambda cid: partner_mastery.get(cid, 0.0))[:3]
 
         # Fetch labels for partner concepts too (union with shared)
         all_comparison_ids = list(set(concept_ids) | set(partner_concept_ids))
-        all_nodes_rows = supabase.table('concept_nodes').select('id, label').in_('id', all_comparison_ids).execute().data
+        all_nodes_rows = select_in('concept_nodes', 'id, label', 'id', all_comparison_ids)
         concept_nodes_map = {c['id']: c for c in all_nodes_rows}
 
         # Extend my_mastery to cover partner concepts
         extra_ids = [cid for cid in partner_concept_ids if cid not in my_mastery]
         if extra_ids:
-            extra_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-                'student_id', student_id
-            ).in_('concept_id', extra_ids).execute().data
+            extra_rows = select_in(
+                'student_mastery', 'concept_id, confidence', 'concept_id', extra_ids,
+                filters=lambda q: q.eq('student_id', student_id),
+            )
             for row in extra_rows:
                 my_mastery[row['concept_id']] = row['confidence']
 
@@ -168,20 +174,22 @@ def _find_match(student_id, course_id, concept_ids):
             'complementarityScore': 0.5
         }
 
+    # Fetch mastery for every overlapping candidate in one chunked read
+    overlapping = [e for e in pool_entries if set(concept_ids) & set(e['concept_ids'])]
+    mastery_by_candidate = {}
+    for row in select_in(
+        'student_mastery', 'student_id, concept_id, confidence', 'student_id',
+        [e['student_id'] for e in overlapping],
+        filters=lambda q: q.in_('concept_id', concept_ids),
+    ):
+        mastery_by_candidate.setdefault(row['student_id'], {})[row['concept_id']] = row['confidence']
+
     # Calculate complementarity for each candidate
     candidates = []
-    for entry in pool_entries:
+    for entry in overlapping:
         # Find overlapping concepts
         overlap = set(concept_ids) & set(entry['concept_ids'])
-        if not overlap:
-            continue  # no shared concepts = no match
-
-        # Fetch candidate's mastery
-        candidate_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-            'student_id', entry['student_id']
-        ).in_('concept_id', list(overlap)).execute().data
-
-        candidate_mastery = {row['concept_id']: row['confidence'] for row in candidate_mastery_rows}
+        candidate_mastery = mastery_by_candidate.get(entry['student_id'], {})
 
         # Calculate score
         score = calculate_complementarity(my_mastery, candidate_mastery, list(overlap))
@@ -247,20 +255,22 @@ def _find_match(student_id, course_id, concept_ids):
 
     # Build concept comparison data
     all_comparison_ids = list(set(concept_ids) | set(best.get('partner_concept_ids', [])))
-    all_nodes_rows = supabase.table('concept_nodes').select('id, label').in_('id', all_comparison_ids).execute().data
+    all_nodes_rows = select_in('concept_nodes', 'id, label', 'id', all_comparison_ids)
     concept_nodes_map = {c['id']: c for c in all_nodes_rows}
 
     # Fetch full mastery for both students across all comparison concepts
-    partner_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-        'student_id', partner_id
-    ).in_('concept_id', all_comparison_ids).execute().data
+    partner_mastery_rows = select_in(
+        'student_mastery', 'concept_id, confidence', 'concept_id', all_comparison_ids,
+        filters=lambda q: q.eq('student_id', partner_id),
+    )
     partner_mastery = {row['concept_id']: row['confidence'] for row in partner_mastery_rows}
 
     extra_ids = [cid for cid in all_comparison_ids if cid not in my_mastery]
     if extra_ids:
-        extra_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-            'student_id', student_id
-        ).in_('concept_id', extra_ids).execute().data
+        extra_rows = select_in(
+            'student_mastery', 'concept_id, confidence', 'concept_id', extra_ids,
+            filters=lambda q: q.eq('student_id', student_id),
+        )
         for row in extra_rows:
             my_mastery[row['concept_id']] = row['confidence']
 
@@ -324,9 +334,10 @@ def opt_in(course_id):
         return jsonify({'error': 'Must select at least one concept'}), 400
 
     # Validate concepts belong to course
-    valid_concepts = supabase.table('concept_nodes').select('id').eq('course_id', course_id).in_(
-        'id', concept_ids
-    ).execute().data
+    valid_concepts = select_in(
+        'concept_nodes', 'id', 'id', concept_ids,
+        filters=lambda q: q.eq('course_id', course_id),
+    )
 
     if len(valid_concepts) != len(concept_ids):
         return jsonify({'error': 'Invalid concept IDs'}), 400
@@ -344,7 +355,7 @@ def opt_in(course_id):
     }).execute().data[0]
 
     # Fetch concept labels
-    concept_labels_rows = supabase.table('concept_nodes').select('label').in_('id', concept_ids).execute().data
+    concept_labels_rows = select_in('concept_nodes', 'label', 'id', concept_ids)
     labels = [c['label'] for c in concept_labels_rows]
 
     # Skip matching if this is a seed operation
@@ -439,37 +450,39 @@ def get_status(course_id):
     if matches:
         match = matches[0]
         partner_id = match['student2_id'] if match['student1_id'] == student_id else match['student1_id']
-        partner = supabase.table('students').select('id, name, email').eq('id', partner_id).execute().data[0]
-
-        concept_labels_rows = supabase.table('concept_nodes').select('id, label').in_('id', match['concept_ids']).execute().data
+        # Partner, match concept labels and both students' pool entries (for their
+        # original concept selections) are independent reads
+        partner_rows, concept_labels_rows, my_pool, partner_pool = run_parallel(
+            lambda: supabase.table('students').select('id, name, email').eq('id', partner_id).execute().data,
+            lambda: select_in('concept_nodes', 'id, label', 'id', match['concept_ids']),
+            lambda: supabase.table('study_group_pool').select('concept_ids').eq(
+                'student_id', student_id
+            ).eq('course_id', course_id).order('created_at', desc=True).limit(1).execute().data,
+            lambda: supabase.table('study_group_pool').select('concept_ids').eq(
+                'student_id', partner_id
+            ).eq('course_id', course_id).order('created_at', desc=True).limit(1).execute().data,
+        )
+        partner = partner_rows[0]
         labels = [c['label'] for c in concept_labels_rows]
-        concept_nodes_map = {c['id']: c for c in concept_labels_rows}
-
-        # Look up both students' pool entries to get their original concept selections
-        my_pool = supabase.table('study_group_pool').select('concept_ids').eq(
-            'student_id', student_id
-        ).eq('course_id', course_id).order('created_at', desc=True).limit(1).execute().data
-        partner_pool = supabase.table('study_group_pool').select('concept_ids').eq(
-            'student_id', partner_id
-        ).eq('course_id', course_id).order('created_at', desc=True).limit(1).execute().data
 
         my_concept_ids = my_pool[0]['concept_ids'] if my_pool else match['concept_ids']
         partner_concept_ids = partner_pool[0]['concept_ids'] if partner_pool else match['concept_ids']
 
-        # Fetch labels for all concepts in union
+        # Fetch labels for all concepts in union, and mastery for both students
         all_comparison_ids = list(set(my_concept_ids) | set(partner_concept_ids))
-        all_nodes_rows = supabase.table('concept_nodes').select('id, label').in_('id', all_comparison_ids).execute().data
+        all_nodes_rows, my_mastery_rows, partner_mastery_rows = run_parallel(
+            lambda: select_in('concept_nodes', 'id, label', 'id', all_comparison_ids),
+            lambda: select_in(
+                'student_mastery', 'concept_id, confidence', 'concept_id', all_comparison_ids,
+                filters=lambda q: q.eq('student_id', student_id),
+            ),
+            lambda: select_in(
+                'student_mastery', 'concept_id, confidence', 'concept_id', all_comparison_ids,
+                filters=lambda q: q.eq('student_id', partner_id),
+            ),
+        )
         concept_nodes_map = {c['id']: c for c in all_nodes_rows}
-
-        # Fetch mastery for both students
-        my_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-            'student_id', student_id
-        ).in_('concept_id', all_comparison_ids).execute().data
         my_mastery = {row['concept_id']: row['confidence'] for row in my_mastery_rows}
-
-        partner_mastery_rows = supabase.table('student_mastery').select('concept_id, confidence').eq(
-            'student_id', partner_id
-        ).in_('concept_id', all_comparison_ids).execute().data
         partner_mastery = {row['concept_id']: row['confidence'] for row in partner_mastery_rows}
 
         my_labels = [concept_nodes_map[cid]['label'] for cid in my_concept_ids if cid in concept_nodes_map]
@@ -497,7 +510,7 @@ def get_status(course_id):
 
     if pool:
         entry = pool[0]
-        concept_labels_rows = supabase.table('concept_nodes').select('label').in_('id', entry['concept_ids']).execute().data
+        concept_labels_rows = select_in('concept_nodes', 'label', 'id', entry['concept_ids'])
         labels = [c['label'] for c in concept_labels_rows]
 
         result = {
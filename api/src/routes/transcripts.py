@@ -1,42 +1,101 @@
 from flask import request, jsonify, Blueprint
 from ..db import supabase
 from ..middleware.auth import optional_auth
+from ..query import select_in, page_limit, parse_cursor, make_cursor, keyset_page
+from ..services import transcript_ingest
+from ..services.concept_detector import AUTO_DETECT
 
 transcripts = Blueprint("transcripts", __name__)
 
+MAX_BATCH_CHUNKS = 500
+
 
 @transcripts.route('/api/lectures/<lecture_id>/transcripts', methods=['POST'])
 @optional_auth
 def create_transcript(lecture_id):
     data = request.json
 
-    # Insert transcript chunk
-    chunk = supabase.table('transcript_chunks').insert({
-        'lecture_id': lecture_id,
-        'text': data['text'],
-        'timestamp_sec': data.get('timestamp_sec'),
-        'speaker_name': data.get('speaker_name')
-    }).execute().data[0]
+    try:
+        entry = transcript_ingest.normalize_chunk(lecture_id, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Without concept_ids, optionally tag the chunk with the course's lexical detector
+    entries = transcript_ingest.tag_missing(lecture_id, [entry], data.get('detect', AUTO_DETECT))
+
+    # Chunk and concept links go through the same bulk path as the batch endpoint
+    chunk = transcript_ingest.write_chunks(entries)[0]
+    return jsonify(dict(chunk, concept_ids=entries[0][1])), 201
+
+
+@transcripts.route('/api/lectures/<lecture_id>/transcripts/batch', methods=['POST'])
+@optional_auth
+def create_transcripts_batch(lecture_id):
+    """Queue many chunks for a background bulk write. Returns 429 with Retry-After when the queue is full."""
+    data = request.json or {}
+    items = data.get('chunks')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'chunks must be a non-empty list'}), 400
+    if len(items) > MAX_BATCH_CHUNKS:
+        return jsonify({'error': f'At most {MAX_BATCH_CHUNKS} chunks per request'}), 400
+
+    entries = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            entries.append(transcript_ingest.normalize_chunk(lecture_id, item))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        return jsonify({'error': 'Invalid chunks', 'details': errors}), 400
 
-    # Link detected concepts if provided
-    if 'concept_ids' in data:
-        links = [{
-            'transcript_chunk_id': chunk['id'],
-            'concept_id': concept_id
-        } for concept_id in data['concept_ids']]
+    entries = transcript_ingest.tag_missing(lecture_id, entries, data.get('detect', AUTO_DETECT))
 
-        if links:
-            supabase.table('transcript_concepts').insert(links).execute()
+    try:
+        transcript_ingest.enqueue(entries)
+    except transcript_ingest.QueueFull:
+        response = jsonify({'error': 'Transcript ingest queue is full, retry shortly'})
+        response.headers['Retry-After'] = str(transcript_ingest.INGEST_RETRY_AFTER)
+        return response, 429
 
-    return jsonify(chunk), 201
+    return jsonify({'queued': len(entries), 'queue_depth': transcript_ingest.queue_depth()}), 202
 
 
 @transcripts.route('/api/lectures/<lecture_id>/transcripts', methods=['GET'])
 @optional_auth
 def get_transcripts(lecture_id):
-    result = supabase.table('transcript_chunks').select('*').eq('lecture_id', lecture_id).order(
-        'timestamp_sec').execute()
-    return jsonify(result.data), 200
+    """
+    Without `after`/`limit`: the whole transcript, ordered by timestamp_sec.
+    With them: one bounded page of chunks stored after the cursor, oldest first.
+    X-Next-Cursor carries the cursor to pass as `after` on the next poll.
+    """
+    after = request.args.get('after')
+    if after is None and 'limit' not in request.args:
+        rows = supabase.table('transcript_chunks').select('*').eq('lecture_id', lecture_id).order(
+            'timestamp_sec').execute().data
+        newest = max(rows, key=lambda r: (r['created_at'], r['id']), default=None)
+        response = jsonify(rows)
+        if newest:
+            response.headers['X-Next-Cursor'] = make_cursor(newest)
+        return response, 200
+
+    try:
+        limit = page_limit(request.args.get('limit'))
+        cursor = parse_cursor('transcript_chunks', after) if after else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows, has_more = keyset_page(
+        lambda: supabase.table('transcript_chunks').select('*').eq('lecture_id', lecture_id), cursor, limit)
+    next_cursor = make_cursor(rows[-1]) if rows else after
+
+    # Chunks from one batch share created_at; show them in spoken order
+    rows.sort(key=lambda r: (r['created_at'], r.get('timestamp_sec') is None, r.get('timestamp_sec')))
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    return response, 200
 
 
 @transcripts.route('/api/transcripts/<chunk_id>/concepts', methods=['GET'])
@@ -46,7 +105,7 @@ def get_transcript_concepts(chunk_id):
     concept_ids = [r['concept_id'] for r in result.data]
 
     if concept_ids:
-        concepts = supabase.table('concept_nodes').select('id, label').in_('id', concept_ids).execute()
-        return jsonify(concepts.data), 200
+        concepts = select_in('concept_nodes', 'id, label', 'id', concept_ids)
+        return jsonify(concepts), 200
 
     return jsonify([]), 200
\ No newline at end of file
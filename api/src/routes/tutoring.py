@@ -2,6 +2,9 @@ from flask import request, jsonify, Blueprint
 
 from ..db import supabase
 from ..middleware.auth import optional_auth
+from ..query import page_limit, parse_cursor, make_cursor, keyset_page
+from ..services.tutoring_history import load_history, schedule_refresh
+from ..services.tutoring_context import load_context
 
 tutoring = Blueprint("tutoring", __name__)
 
@@ -67,23 +70,72 @@ def create_messages(session_id):
 
     if not result.data:
         return jsonify({'error': 'Failed to create messages'}), 500
+    # Folds older turns into the session summary once enough have piled up
+    schedule_refresh(session_id)
     return jsonify(result.data), 201
 
 
 @tutoring.route('/api/tutoring/sessions/<session_id>/messages', methods=['GET'])
 @optional_auth
 def get_messages(session_id):
+    """
+    Without `after`/`limit`: the whole history, oldest first.
+    With them: one bounded page of messages stored after the cursor.
+    X-Next-Cursor carries the cursor to pass as `after` next time.
+    """
     exclude_role = request.args.get('exclude_role')
 
-    query = supabase.table('tutoring_messages').select(
-        'id, role, content, concept_id, created_at'
-    ).eq('session_id', session_id).order('created_at')
+    def build():
+        query = supabase.table('tutoring_messages').select(
+            'id, role, content, concept_id, created_at'
+        ).eq('session_id', session_id)
+        if exclude_role:
+            query = query.neq('role', exclude_role)
+        return query
+
+    after = request.args.get('after')
+    if after is None and 'limit' not in request.args:
+        rows = build().order('created_at').execute().data
+        newest = max(rows, key=lambda r: (r['created_at'], r['id']), default=None)
+        response = jsonify(rows)
+        if newest:
+            response.headers['X-Next-Cursor'] = make_cursor(newest)
+        return response, 200
+
+    try:
+        limit = page_limit(request.args.get('limit'))
+        cursor = parse_cursor('tutoring_messages', after) if after else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows, has_more = keyset_page(build, cursor, limit)
+    next_cursor = make_cursor(rows[-1]) if rows else after
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    return response, 200
+
+
+@tutoring.route('/api/tutoring/sessions/<session_id>/history', methods=['GET'])
+@optional_auth
+def get_history(session_id):
+    """System prompt, rolling summary and the messages not yet summarized: a bounded prompt."""
+    history = load_history(session_id)
+    if history is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(history), 200
 
-    if exclude_role:
-        query = query.neq('role', exclude_role)
 
-    result = query.execute()
-    return jsonify(result.data), 200
+@tutoring.route('/api/tutoring/sessions/<session_id>/context', methods=['GET'])
+@optional_auth
+def get_context(session_id):
+    """Target concepts, prerequisite mastery, transcript excerpts and misconceptions for one prompt."""
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    bundle = load_context(session_id, refresh=refresh)
+    if bundle is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(bundle), 200
 
 
 @tutoring.route('/api/tutoring/messages/<message_id>', methods=['PUT'])
@@ -0,0 +1,309 @@
+"""
+Class-wide mastery analytics cube.
+
+Cells are keyed by (concept, cohort) and hold a 21-bin confidence histogram
+(bin 0 is exactly 0.0 / unvisited, bins 1-20 are 0.05 wide) plus the sum of
+confidences. Category and lecture coverage are attributes of the concept,
+so any roll-up over concept, category, lecture and cohort can be answered
+by merging histograms, without scanning student_mastery.
+
+In Redis the cells live in one hash per course and are adjusted in place
+(HINCRBY/HINCRBYFLOAT) on every mastery write, but only while the hash is a
+complete build (it has `built_at`): increments run under WATCH after that
+check, so a write never recreates a dropped or expired cube as a fragment.
+Without Redis the cube is built on demand for each query.
+"""
+
+import time
+
+import redis
+
+from ..db import supabase
+from ..cache import get_client, cache_get, cache_set, cache_delete
+from ..parallel import fan_out
+from ..query import select_in, select_all
+
+NUM_BINS = 21
+CUBE_TTL = 24 * 60 * 60
+DIMS_TTL = 60
+STUDENT_INDEX_KEY = "cube_students"
+DEFAULT_COHORT = "all"
+DIMENSIONS = ('concept', 'category', 'lecture', 'cohort')
+PERCENTILES = (25, 50, 75, 90)
+WATCH_RETRIES = 5
+
+
+def _cube_key(course_id):
+    return f"cube:{course_id}"
+
+
+def _dims_key(course_id):
+    return f"cube_dims:{course_id}"
+
+
+def confidence_bin(confidence):
+    """Histogram bin for a confidence value; boundaries line up with the heatmap colors."""
+    if confidence <= 0.0:
+        return 0
+    return min(NUM_BINS - 1, int(confidence * 20 + 1e-9) + 1)
+
+
+def _bin_color(index):
+    if index == 0:
+        return "gray"
+    elif index <= 8:
+        return "red"
+    elif index <= 14:
+        return "yellow"
+    return "green"
+
+
+def _load_dimensions(course_id):
+    """Concept attributes (label, category, covering lectures) and student cohorts."""
+    hit = cache_get(_dims_key(course_id))
+    if hit is not None:
+        return hit
+
+    data = fan_out(
+        concepts=lambda: supabase.table('concept_nodes').select('id, label, category').eq(
+            'course_id', course_id).execute().data,
+        students=lambda: select_all(lambda: supabase.table('students').select('id, cohort').eq(
+            'course_id', course_id)),
+        lectures=lambda: supabase.table('lecture_sessions').select('id, title').eq(
+            'course_id', course_id).execute().data,
+    )
+
+    lecture_ids = [l['id'] for l in data['lectures']]
+    links = select_in(
+        'transcript_concepts', 'concept_id, transcript_chunks!inner(lecture_id)',
+        'transcript_chunks.lecture_id', lecture_ids, key='transcript_chunk_id,concept_id',
+    )
+    lectures_by_concept = {}
+    for link in links:
+        lectures_by_concept.setdefault(link['concept_id'], set()).add(link['transcript_chunks']['lecture_id'])
+
+    dims = {
+        'concepts': {
+            c['id']: {
+                'label': c['label'],
+                'category': c.get('category') or '',
+                'lectures': sorted(lectures_by_concept.get(c['id'], [])),
+            }
+            for c in data['concepts']
+        },
+        'cohorts': {s['id']: s.get('cohort') or DEFAULT_COHORT for s in data['students']},
+        'lecture_titles': {l['id']: l['title'] for l in data['lectures']},
+    }
+    cache_set(_dims_key(course_id), dims, ttl_seconds=DIMS_TTL)
+    return dims
+
+
+def _build_cells(course_id, dims):
+    """Scan the course's mastery once and bin every (student, concept) pair; missing rows count as 0.0."""
+    student_ids = list(dims['cohorts'])
+    rows = select_in('student_mastery', 'student_id, concept_id, confidence', 'student_id', student_ids)
+    mastery = {(r['student_id'], r['concept_id']): r['confidence'] for r in rows}
+
+    cells = {}
+    for sid, cohort in dims['cohorts'].items():
+        for cid in dims['concepts']:
+            conf = mastery.get((sid, cid), 0.0)
+            cell = cells.setdefault((cid, cohort), {'bins': [0] * NUM_BINS, 'sum': 0.0})
+            cell['bins'][confidence_bin(conf)] += 1
+            cell['sum'] += conf
+    return cells
+
+
+def _store_cells(course_id, dims, cells):
+    client = get_client()
+    if not client:
+        return
+    try:
+        mapping = {'built_at': time.time()}
+        for (cid, cohort), cell in cells.items():
+            for index, count in enumerate(cell['bins']):
+                if count:
+                    mapping[f"{cid}|{cohort}|{index}"] = count
+            mapping[f"{cid}|{cohort}|sum"] = cell['sum']
+
+        pipe = client.pipeline()
+        key = _cube_key(course_id)
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, CUBE_TTL)
+        index = {sid: f"{course_id}|{cohort}" for sid, cohort in dims['cohorts'].items()}
+        if index:
+            pipe.hset(STUDENT_INDEX_KEY, mapping=index)
+        pipe.execute()
+    except Exception as e:
+        print(f"[cube] Failed to store cube for course {course_id}: {e}")
+
+
+def _read_cells(course_id):
+    client = get_client()
+    if not client:
+        return None, None
+    try:
+        raw = client.hgetall(_cube_key(course_id))
+    except Exception:
+        return None, None
+    if 'built_at' not in raw:
+        return None, None  # missing, or a fragment left by increments after a drop
+
+    built_at = float(raw.pop('built_at'))
+    cells = {}
+    for field, value in raw.items():
+        cid, cohort, slot = field.rsplit('|', 2)
+        cell = cells.setdefault((cid, cohort), {'bins': [0] * NUM_BINS, 'sum': 0.0})
+        if slot == 'sum':
+            cell['sum'] = float(value)
+        else:
+            cell['bins'][int(slot)] = int(value)
+    return cells, built_at
+
+
+def load_cube(course_id, refresh=False):
+    """Return (dims, cells, built_at), building and storing the cube if it is missing."""
+    dims = _load_dimensions(course_id)
+    cells, built_at = (None, None) if refresh else _read_cells(course_id)
+    if cells is None:
+        cells = _build_cells(course_id, dims)
+        built_at = time.time()
+        _store_cells(course_id, dims, cells)
+    return dims, cells, built_at
+
+
+def invalidate_cube(course_id):
+    """Drop a course's cube after roster or concept changes; the next query rebuilds it."""
+    client = get_client()
+    if client:
+        try:
+            client.delete(_cube_key(course_id))
+            # The rebuild re-indexes the current roster; drop entries that may be stale
+            prefix = f"{course_id}|"
+            stale = [sid for sid, entry in client.hscan_iter(STUDENT_INDEX_KEY) if entry.startswith(prefix)]
+            if stale:
+                client.hdel(STUDENT_INDEX_KEY, *stale)
+        except Exception:
+            pass
+    cache_delete(_dims_key(course_id))
+
+
+def record_mastery_changes(changes):
+    """
+    Apply mastery writes to any built cubes in place.
+
+    changes: iterable of (student_id, concept_id, old_confidence, new_confidence).
+    Students that are not in a built cube are skipped; that cube is rebuilt on
+    its next query after invalidate_cube().
+    """
+    client = get_client()
+    changes = [c for c in changes if c[2] != c[3]]
+    if not client or not changes:
+        return
+    try:
+        student_ids = list({c[0] for c in changes})
+        located = dict(zip(student_ids, client.hmget(STUDENT_INDEX_KEY, student_ids)))
+
+        by_course = {}
+        for student_id, concept_id, old, new in changes:
+            entry = located.get(student_id)
+            if entry:
+                course_id, cohort = entry.split('|', 1)
+                by_course.setdefault(course_id, []).append((concept_id, cohort, old, new))
+        for course_id, course_changes in by_course.items():
+            _increment_cube(client, course_id, course_changes)
+    except Exception as e:
+        print(f"[cube] Incremental update failed: {e}")
+
+
+def _increment_cube(client, course_id, changes):
+    """Apply [(concept_id, cohort, old, new)] to a course's cube if it is built; drop it if that keeps racing."""
+    key = _cube_key(course_id)
+    for _ in range(WATCH_RETRIES):
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if not pipe.hexists(key, 'built_at'):
+                    return  # not built; the next query builds it with these writes included
+                pipe.multi()
+                for concept_id, cohort, old, new in changes:
+                    old_bin, new_bin = confidence_bin(old), confidence_bin(new)
+                    if old_bin != new_bin:
+                        pipe.hincrby(key, f"{concept_id}|{cohort}|{old_bin}", -1)
+                        pipe.hincrby(key, f"{concept_id}|{cohort}|{new_bin}", 1)
+                    pipe.hincrbyfloat(key, f"{concept_id}|{cohort}|sum", new - old)
+                pipe.execute()
+                return
+            except redis.WatchError:
+                continue
+    client.delete(key)
+
+
+def _percentile(bins, total, pct):
+    """Approximate percentile from the histogram by interpolating within the bin."""
+    if total == 0:
+        return 0.0
+    target = total * pct / 100.0
+    seen = 0
+    for index, count in enumerate(bins):
+        if count and seen + count >= target:
+            if index == 0:
+                return 0.0
+            low = (index - 1) / 20.0
+            return round(low + 0.05 * (target - seen) / count, 3)
+        seen += count
+    return 1.0
+
+
+def summarize(bins, total_sum):
+    """Count, average, heatmap color distribution and percentiles for a merged histogram."""
+    total = sum(bins)
+    distribution = {"green": 0, "yellow": 0, "red": 0, "gray": 0}
+    for index, count in enumerate(bins):
+        distribution[_bin_color(index)] += count
+    return {
+        'count': total,
+        'avg_confidence': round(total_sum / total, 3) if total else 0.0,
+        'distribution': distribution,
+        'percentiles': {f"p{p}": _percentile(bins, total, p) for p in PERCENTILES},
+    }
+
+
+def roll_up(dims, cells, group_by, filters):
+    """
+    Merge cells into groups keyed by the requested dimensions.
+
+    filters: {dimension: set_of_allowed_values}. A concept covered by several
+    lectures contributes to each lecture's group; uncovered concepts fall
+    under lecture None.
+    """
+    groups = {}
+    for (cid, cohort), cell in cells.items():
+        concept = dims['concepts'].get(cid)
+        if concept is None:
+            continue
+        # Collect distinct group keys first so a cell is merged once per group,
+        # even when several of its lectures collapse into the same key
+        keys = set()
+        for lecture_id in concept['lectures'] or [None]:
+            values = {'concept': cid, 'category': concept['category'], 'lecture': lecture_id, 'cohort': cohort}
+            if any(values[d] not in allowed for d, allowed in filters.items()):
+                continue
+            keys.add(tuple(values[d] for d in group_by))
+        for key in keys:
+            group = groups.setdefault(key, {'bins': [0] * NUM_BINS, 'sum': 0.0})
+            group['bins'] = [a + b for a, b in zip(group['bins'], cell['bins'])]
+            group['sum'] += cell['sum']
+
+    result = []
+    for key, group in groups.items():
+        entry = dict(zip(group_by, key))
+        if 'concept' in entry:
+            entry['label'] = dims['concepts'][entry['concept']]['label']
+        if 'lecture' in entry and entry['lecture']:
+            entry['lecture_title'] = dims['lecture_titles'].get(entry['lecture'], '')
+        entry.update(summarize(group['bins'], group['sum']))
+        result.append(entry)
+    result.sort(key=lambda e: tuple(str(e.get(d) or '') for d in group_by))
+    return result
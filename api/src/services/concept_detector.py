@@ -0,0 +1,188 @@
+"""
+Lexical concept detector for transcript chunks.
+
+A course's concept labels, synonyms and aliases (parenthesised terms and
+acronyms of long labels) are compiled into one Aho–Corasick automaton over
+normalised word tokens, so a chunk is tagged in a single pass over its
+words however many concepts the course has. Matching on tokens keeps hits
+on word boundaries ("AI" never matches inside "said").
+
+Compiled detectors are kept per process. The course snapshot is reloaded
+only when its version changes or DETECTOR_MAX_AGE seconds after the last
+check (SNAPSHOT_TTL without Redis, where there is no version), and the
+detector is rebuilt only if a fingerprint of the concept rows changed. A
+re-upload therefore rebuilds on the next call, a synonym edit within
+DETECTOR_MAX_AGE.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from ..db import supabase
+from ..snapshot import SNAPSHOT_TTL, load_course_snapshot, snapshot_version
+
+AUTO_DETECT = os.getenv("AUTO_DETECT_CONCEPTS", "false").lower() == "true"
+MIN_TERM_CHARS = 3
+DETECTOR_MAX_AGE = 300
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+_ALIAS_RE = re.compile(r"\(([^()]{2,40})\)")
+
+_lock = threading.Lock()
+_detectors = {}  # course_id -> (snapshot version, checked_at, fingerprint, ConceptDetector)
+_lecture_courses = {}  # lecture_id -> course_id (never changes)
+
+
+def _stem(word):
+    # Light plural folding so "networks" matches "network"; keeps "loss", "class"
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercase word tokens with plural folding, as (token, start, end) character spans."""
+    return [(_stem(m.group().replace('’', "'")), m.start(), m.end()) for m in _WORD_RE.finditer((text or '').lower())]
+
+
+def _terms_for(concept):
+    """Surface forms for one concept: label, synonyms, parenthesised aliases, acronym of long labels."""
+    label = concept.get('label') or ''
+    terms = [_ALIAS_RE.sub(' ', label)]
+    explicit = list(concept.get('synonyms') or [])
+    for source in (label, concept.get('description') or ''):
+        explicit.extend(a for a in _ALIAS_RE.findall(source) if len(a.split()) <= 4)
+    words = _WORD_RE.findall(_ALIAS_RE.sub(' ', label).lower())
+    if len(words) >= 3:
+        explicit.append(''.join(w[0] for w in words))
+    return terms, explicit
+
+
+class ConceptDetector:
+    """Aho–Corasick automaton over token sequences mapping each term to its concept ids."""
+
+    def __init__(self, concepts):
+        self.labels = {c['id']: c.get('label') for c in concepts}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # node -> [(term_length, concept_ids)]
+        terms = {}
+        for concept in concepts:
+            label_terms, explicit = _terms_for(concept)
+            for term in label_terms + explicit:
+                tokens = tuple(t for t, _, _ in tokenize(term))
+                # Single short tokens are too noisy unless someone listed them as a synonym
+                if not tokens or (term not in explicit and len(tokens) == 1 and len(tokens[0]) < MIN_TERM_CHARS):
+                    continue
+                terms.setdefault(tokens, set()).add(concept['id'])
+        for tokens, concept_ids in terms.items():
+            self._add(tokens, frozenset(concept_ids))
+        self._build_failure_links()
+        self.term_count = len(terms)
+
+    def _add(self, tokens, concept_ids):
+        node = 0
+        for token in tokens:
+            nxt = self._goto[node].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(tokens), concept_ids))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = 0 if node == 0 else self._goto[fallback].get(token, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text):
+        """
+        Return [{'concept_id', 'label', 'matched'}] in order of first mention.
+        Matches nested inside a longer match (e.g. "neural network" inside
+        "convolutional neural network") are dropped.
+        """
+        tokens = tokenize(text)
+        matches = []  # (start_token, end_token, concept_ids)
+        node = 0
+        for i, (token, _, _) in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for length, concept_ids in self._out[node]:
+                matches.append((i - length + 1, i, concept_ids))
+        if not matches:
+            return []
+
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        found = {}
+        covered_until = -1
+        for start, end, concept_ids in matches:
+            if end <= covered_until:
+                continue
+            covered_until = max(covered_until, end)
+            matched = text[tokens[start][1]:tokens[end][2]]
+            for concept_id in sorted(concept_ids):
+                found.setdefault(concept_id, {'concept_id': concept_id, 'label': self.labels.get(concept_id),
+                                              'matched': matched})
+        return list(found.values())
+
+    def concept_ids(self, text):
+        return [m['concept_id'] for m in self.find(text)]
+
+
+def _fingerprint(concepts):
+    digest = hashlib.sha1()
+    for c in sorted(concepts, key=lambda c: c['id']):
+        digest.update(repr((c['id'], c.get('label'), c.get('description'), c.get('synonyms'))).encode())
+    return digest.hexdigest()
+
+
+def get_detector(course_id):
+    """Compiled detector for a course's current concepts (rebuilt when they change)."""
+    # Read the version before the snapshot, so a detector is never tagged newer than its concepts
+    version = snapshot_version(course_id)
+    now = time.monotonic()
+    cached = _detectors.get(course_id)
+    max_age = DETECTOR_MAX_AGE if version is not None else SNAPSHOT_TTL
+    if cached and cached[0] == version and now - cached[1] < max_age:
+        return cached[3]
+
+    concepts = load_course_snapshot(course_id)['concepts']
+    fingerprint = _fingerprint(concepts)
+    detector = cached[3] if cached and cached[2] == fingerprint else ConceptDetector(concepts)
+    with _lock:
+        _detectors[course_id] = (version, now, fingerprint, detector)
+    return detector
+
+
+def course_for_lecture(lecture_id):
+    course_id = _lecture_courses.get(lecture_id)
+    if course_id is None:
+        rows = supabase.table('lecture_sessions').select('course_id').eq('id', lecture_id).execute().data
+        if not rows:
+            return None
+        course_id = _lecture_courses[lecture_id] = rows[0]['course_id']
+    return course_id
+
+
+def detect_for_lecture(lecture_id, texts):
+    """Concept ids for each text, using the lecture's course detector. Empty lists if the lecture is unknown."""
+    course_id = course_for_lecture(lecture_id)
+    if not course_id:
+        return [[] for _ in texts]
+    detector = get_detector(course_id)
+    return [detector.concept_ids(text) for text in texts]
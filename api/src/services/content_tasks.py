@@ -0,0 +1,301 @@
+"""
+Content generation tasks run by the job worker, one concept at a time.
+
+Each content type maps to a handler that generates and stores one piece of
+course-wide content for a concept, replacing whatever was there before:
+
+    learning_page   general learning page (learning_pages, student_id null) with further reading
+    practice_quiz   template practice quiz (practice_quizzes + quiz_questions)
+    concept_page    markdown page in concept_learning_pages
+    concept_quiz    5 multiple choice questions in concept_quiz_questions
+
+Handlers raise on failure so the worker can retry the job; ConceptGone means
+the concept was deleted (e.g. by a re-upload) and UnknownJobType that no
+handler exists for the content type, so retrying either is pointless.
+
+enqueue_course_content() queues them prerequisites first: concepts are ranked
+by depth in the prerequisite graph, then by how many concepts build on them,
+so the foundations of a course are ready before what depends on them.
+try_enqueue_course_content() is the variant for routes that must answer even
+when the queue is unavailable.
+"""
+
+import json
+
+from dotenv import load_dotenv
+
+from ..db import supabase
+from ..llm import MODELS, cached
+from ..jobs import enqueue, queue_missing
+from ..log import log_event
+from ..snapshot import load_course_snapshot
+from .generate_content import generate_learning_page, generate_practice_quiz, get_further_reading
+
+load_dotenv()
+
+# What an upload or bulk request generates for every concept
+COURSE_CONTENT = ('learning_page', 'practice_quiz')
+CONCEPT_CONTENT = ('concept_page', 'concept_quiz')
+
+
+class ConceptGone(LookupError):
+    pass
+
+
+class UnknownJobType(LookupError):
+    pass
+
+
+def _load_concept(concept_id):
+    rows = supabase.table('concept_nodes').select('id, label, description, category').eq(
+        'id', concept_id).execute().data
+    if not rows:
+        raise ConceptGone('Concept not found')
+    return rows[0]
+
+
+def generate_general_page(concept_id):
+    """Generate the course-wide learning page for a concept and store it (update or insert)."""
+    concept = _load_concept(concept_id)
+    description = concept.get('description') or ''
+    page_result = generate_learning_page(
+        concept_label=concept['label'],
+        concept_description=description,
+        past_mistakes=[],
+        current_confidence=0.5
+    )
+    further_reading = get_further_reading(concept['label'], description)
+
+    existing_page = supabase.table('learning_pages').select('id').eq('concept_id', concept_id).is_(
+        'student_id', 'null').execute()
+    if existing_page.data:
+        supabase.table('learning_pages').update({
+            'title': page_result['title'],
+            'content': page_result['content'],
+            'further_reading': further_reading
+        }).eq('concept_id', concept_id).is_('student_id', 'null').execute()
+    else:
+        supabase.table('learning_pages').insert({
+            'student_id': None,
+            'concept_id': concept_id,
+            'title': page_result['title'],
+            'content': page_result['content'],
+            'further_reading': further_reading
+        }).execute()
+    return {'concept_id': concept_id, 'concept_label': concept['label'], 'title': page_result['title']}
+
+
+def generate_template_quiz(concept_id):
+    """Generate the template practice quiz for a concept, replacing the previous one."""
+    concept = _load_concept(concept_id)
+    quiz_result = generate_practice_quiz(
+        concept_label=concept['label'],
+        concept_description=concept.get('description') or '',
+        past_mistakes=[],
+        current_confidence=0.5
+    )
+
+    supabase.table('practice_quizzes').delete().eq('concept_id', concept_id).is_('student_id', 'null').execute()
+    quiz_resp = supabase.table('practice_quizzes').insert({
+        'student_id': None,
+        'concept_id': concept_id,
+        'page_id': None,
+        'status': 'template'
+    }).execute()
+    quiz_id = quiz_resp.data[0]['id']
+
+    supabase.table('quiz_questions').insert([{
+        'quiz_id': quiz_id,
+        'question_text': q['question_text'],
+        'options': q['options'],
+        'correct_answer': q['correct_answer'],
+        'explanation': q['explanation'],
+        'question_order': q_idx + 1
+    } for q_idx, q in enumerate(quiz_result['questions'])]).execute()
+    return {'concept_id': concept_id, 'concept_label': concept['label'], 'quiz_id': quiz_id}
+
+
+def generate_concept_page(concept_id, bypass_cache=False):
+    """Generate and store the markdown learning page in concept_learning_pages."""
+    concept = _load_concept(concept_id)
+
+    prompt = f"""Create a comprehensive learning page for the concept: {concept['label']}
+
+Description: {concept.get('description', 'N/A')}
+Category: {concept.get('category', 'N/A')}
+
+Generate a well-structured markdown document that includes:
+1. A clear explanation of what the concept is
+2. Key points and important details
+3. Mathematical formulas using LaTeX notation ($inline$ and $$display$$)
+4. Practical examples or applications
+5. Common pitfalls or misconceptions
+
+Keep it concise but thorough (aim for 200-400 words). Use markdown formatting with headers (##, ###), bold, lists, and LaTeX for math.
+
+Return ONLY the markdown content, no additional commentary."""
+
+    request = {
+        'provider': 'anthropic',
+        'model': MODELS['concept_content'],
+        'max_tokens': 2000,
+        'messages': [{"role": "user", "content": prompt}],
+    }
+    content = cached('concept_page', request, bypass=bypass_cache)
+
+    # concept_id is unique, so this replaces any previous page
+    supabase.table('concept_learning_pages').upsert({
+        'concept_id': concept_id,
+        'content': content
+    }, on_conflict='concept_id').execute()
+
+    return {'concept_id': concept_id, 'concept_label': concept['label'], 'content': content}
+
+
+def generate_concept_quiz(concept_id, bypass_cache=False):
+    """Generate 5 quiz questions and store them in concept_quiz_questions, replacing the old set."""
+    concept = _load_concept(concept_id)
+
+    prompt = f"""Create 5 multiple choice quiz questions for the concept: {concept['label']}
+
+Description: {concept.get('description', 'N/A')}
+Category: {concept.get('category', 'N/A')}
+
+Generate 5 questions that test understanding of this concept. Each question should:
+- Have 4 options (A, B, C, D)
+- Have exactly one correct answer
+- Include a brief explanation of why the answer is correct
+- Range from basic understanding to deeper application
+
+Return your response as a JSON array with this exact structure:
+[
+  {{
+    "question": "Question text here?",
+    "option_a": "First option",
+    "option_b": "Second option",
+    "option_c": "Third option",
+    "option_d": "Fourth option",
+    "correct_answer": 0,
+    "explanation": "Explanation of the correct answer"
+  }}
+]
+
+Note: correct_answer is 0 for A, 1 for B, 2 for C, 3 for D.
+Return ONLY the JSON array, no additional text."""
+
+    request = {
+        'provider': 'anthropic',
+        'model': MODELS['concept_content'],
+        'max_tokens': 2500,
+        'messages': [{"role": "user", "content": prompt}],
+    }
+
+    def parse(content):
+        # Parse JSON response (handle markdown code blocks)
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0].strip()
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0].strip()
+
+        questions = json.loads(content)
+
+        if not isinstance(questions, list) or len(questions) != 5:
+            raise ValueError('Invalid response format from Claude')
+        return questions
+
+    questions = cached('concept_quiz', request, parse, bypass=bypass_cache)
+
+    supabase.table('concept_quiz_questions').delete().eq('concept_id', concept_id).execute()
+    supabase.table('concept_quiz_questions').insert([{
+        'concept_id': concept_id,
+        'question': q['question'],
+        'option_a': q['option_a'],
+        'option_b': q['option_b'],
+        'option_c': q['option_c'],
+        'option_d': q['option_d'],
+        'correct_answer': q['correct_answer'],
+        'explanation': q['explanation'],
+        'question_order': idx
+    } for idx, q in enumerate(questions)]).execute()
+
+    return {'concept_id': concept_id, 'concept_label': concept['label'], 'questions_generated': len(questions)}
+
+
+HANDLERS = {
+    'learning_page': generate_general_page,
+    'practice_quiz': generate_template_quiz,
+    'concept_page': generate_concept_page,
+    'concept_quiz': generate_concept_quiz,
+}
+
+
+def run_task(content_type, concept_id):
+    handler = HANDLERS.get(content_type)
+    if handler is None:
+        raise UnknownJobType(f'Unknown content type: {content_type}')
+    return handler(concept_id)
+
+
+def generation_order(concept_ids, edges):
+    """
+    Concept ids sorted prerequisites first: by depth (longest prerequisite
+    chain below the concept), then by number of transitive dependents, most first.
+    edges: [(source_id, target_id)] where source is a prerequisite of target.
+    """
+    ids = list(dict.fromkeys(concept_ids))
+    known = set(ids)
+    edges = [(s, t) for s, t in edges if s in known and t in known and s != t]
+    dependents = {cid: [] for cid in ids}
+    pending = {cid: 0 for cid in ids}
+    for source, target in edges:
+        dependents[source].append(target)
+        pending[target] += 1
+
+    depth = {}
+    frontier = [cid for cid in ids if pending[cid] == 0]
+    level = 0
+    while frontier:
+        following = []
+        for cid in frontier:
+            depth[cid] = level
+            for target in dependents[cid]:
+                pending[target] -= 1
+                if pending[target] == 0:
+                    following.append(target)
+        frontier = following
+        level += 1
+    for cid in ids:
+        depth.setdefault(cid, level)  # part of a cycle: after everything that resolved
+
+    def reach(cid):
+        seen, stack = set(), list(dependents[cid])
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(dependents[node])
+        return len(seen)
+
+    reach_counts = {cid: reach(cid) for cid in ids}
+    return sorted(ids, key=lambda cid: (depth[cid], -reach_counts[cid]))
+
+
+def enqueue_course_content(course_id, concept_ids, content_types):
+    """Queue content_types for each concept, foundational concepts first. Returns jobs.enqueue()'s summary."""
+    edges = [(e['source_id'], e['target_id']) for e in load_course_snapshot(course_id)['edges']]
+    priorities = {(cid, content_type): rank * len(content_types) + n
+                  for rank, cid in enumerate(generation_order(concept_ids, edges))
+                  for n, content_type in enumerate(content_types)}
+    return enqueue(course_id, concept_ids, content_types, priorities)
+
+
+def try_enqueue_course_content(course_id, concept_ids, content_types):
+    """enqueue_course_content() that never raises: on failure logs it and returns {'error': message}."""
+    try:
+        return enqueue_course_content(course_id, concept_ids, content_types)
+    except Exception as e:
+        log_event('content_tasks', 'enqueue_failed', level='error', course_id=course_id,
+                  concepts=len(concept_ids), error=str(e))
+        if queue_missing(e):
+            return {'error': 'Generation queue is not installed (run scripts/migration_generation_jobs.sql)'}
+        return {'error': f'Content generation could not be queued: {e}'}
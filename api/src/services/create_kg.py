@@ -2,12 +2,13 @@ import math
 import tempfile
 
 from PyPDF2 import PdfReader, PdfWriter
-import anthropic
 import os
 import base64
 
+from ..llm import MODELS, cached
 
-def create_kg(file_path: str) -> str:
+
+def create_kg(file_path: str, bypass_cache: bool = False) -> str:
     # Extract first 10 pages
     reader = PdfReader(file_path)
     writer = PdfWriter()
@@ -27,11 +28,6 @@ def create_kg(file_path: str) -> str:
 
     os.remove(tmp_path)
 
-    client = anthropic.Anthropic(
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-        timeout=120.0,
-    )
-
     prompt = """Analyze this course document and create a prerequisite knowledge graph.
 
 STRICT CONSTRAINT: Produce exactly 30-40 concept nodes. NEVER exceed 40 nodes.
@@ -84,10 +80,11 @@ Requirements:
 Return ONLY the JSON object.
 """
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=8192,
-        messages=[
+    request = {
+        'provider': 'anthropic',
+        'model': MODELS['content'],
+        'max_tokens': 8192,
+        'messages': [
             {
                 "role": "user",
                 "content": [
@@ -105,10 +102,15 @@ Return ONLY the JSON object.
                     }
                 ]
             }
-        ]
-    )
+        ],
+    }
+
+    def validated(text):
+        parse_kg(text)  # raises on malformed output, which must not be cached
+        return text
 
-    return message.content[0].text
+    # The same PDF pages (e.g. a re-upload) hash to the same request
+    return cached('knowledge_graph', request, validated, bypass=bypass_cache)
 
 
 def parse_kg(markdown: str) -> dict:
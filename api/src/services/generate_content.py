@@ -1,15 +1,14 @@
-import anthropic
-import os
 import json
 
 from dotenv import load_dotenv
 
+from ..llm import MODELS, available, cached, complete
+
 load_dotenv()
 
 def generate_learning_page(concept_label: str, concept_description: str,
-                           past_mistakes: list, current_confidence: float) -> dict:
-    """Generate personalized learning page using Claude"""
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+                           past_mistakes: list, current_confidence: float, bypass_cache: bool = False) -> dict:
+    """Generate personalized learning page using Claude (cached per identical prompt)"""
 
     mistakes_context = ""
     if past_mistakes:
@@ -22,7 +21,7 @@ def generate_learning_page(concept_label: str, concept_description: str,
     prompt = f"""Create a concise learning page for the concept: {concept_label}
 
 Concept description: {concept_description}
-Student's current level: {confidence_level} (confidence: {current_confidence})
+Student's current level: {confidence_level}
 {mistakes_context}
 
 Return ONLY valid JSON with this structure:
@@ -38,28 +37,34 @@ Requirements:
 - No fluff or excessive motivation
 - Return ONLY valid JSON, no markdown code blocks"""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    request = {
+        'provider': 'anthropic',
+        'model': MODELS['content'],
+        'max_tokens': 2000,
+        'messages': [{"role": "user", "content": prompt}],
+    }
 
-    response_text = message.content[0].text.strip()
+    def parse(text):
+        response_text = text.strip()
 
-    if response_text.startswith('```'):
-        lines = response_text.split('\n')
-        lines = lines[1:]
-        if lines and lines[-1].strip() == '```':
-            lines = lines[:-1]
-        response_text = '\n'.join(lines).strip()
+        if response_text.startswith('```'):
+            lines = response_text.split('\n')
+            lines = lines[1:]
+            if lines and lines[-1].strip() == '```':
+                lines = lines[:-1]
+            response_text = '\n'.join(lines).strip()
 
-    return json.loads(response_text)
+        result = json.loads(response_text)
+        if not result.get('title') or not result.get('content'):
+            raise ValueError('Learning page response is missing title or content')
+        return result
+
+    return cached('learning_page', request, parse, bypass=bypass_cache)
 
 
 def generate_practice_quiz(concept_label: str, concept_description: str,
-                           past_mistakes: list, current_confidence: float) -> dict:
-    """Generate 5-question practice quiz using Claude"""
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+                           past_mistakes: list, current_confidence: float, bypass_cache: bool = False) -> dict:
+    """Generate 5-question practice quiz using Claude (cached per identical prompt)"""
 
     mistakes_context = ""
     if past_mistakes:
@@ -72,7 +77,7 @@ def generate_practice_quiz(concept_label: str, concept_description: str,
     prompt = f"""Create a 5-question multiple choice quiz for: {concept_label}
 
 Concept description: {concept_description}
-Student's level: {confidence_level} (confidence: {current_confidence})
+Student's level: {confidence_level}
 {mistakes_context}
 
 Return ONLY valid JSON with this structure:
@@ -96,32 +101,36 @@ Requirements:
 - Options should be roughly same length
 - Return ONLY valid JSON, no markdown code blocks"""
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=3000,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    request = {
+        'provider': 'anthropic',
+        'model': MODELS['content'],
+        'max_tokens': 3000,
+        'messages': [{"role": "user", "content": prompt}],
+    }
 
-    response_text = message.content[0].text.strip()
+    def parse(text):
+        response_text = text.strip()
 
-    if response_text.startswith('```'):
-        lines = response_text.split('\n')
-        lines = lines[1:]
-        if lines and lines[-1].strip() == '```':
-            lines = lines[:-1]
-        response_text = '\n'.join(lines).strip()
+        if response_text.startswith('```'):
+            lines = response_text.split('\n')
+            lines = lines[1:]
+            if lines and lines[-1].strip() == '```':
+                lines = lines[:-1]
+            response_text = '\n'.join(lines).strip()
+
+        result = json.loads(response_text)
+        if not isinstance(result.get('questions'), list) or not result['questions']:
+            raise ValueError('Quiz response has no questions')
+        return result
 
-    return json.loads(response_text)
+    return cached('practice_quiz', request, parse, bypass=bypass_cache)
 
 
 def get_further_reading(concept_label: str, concept_description: str) -> list:
     """Get 3 relevant links using Perplexity"""
-    import requests
     import sys
 
-    perplexity_key = os.getenv("PERPLEXITY_API_KEY")
-
-    if not perplexity_key:
+    if not available('perplexity'):
         print("[ERROR] No Perplexity API key", file=sys.stderr)
         return []
 
@@ -143,25 +152,9 @@ Return ONLY valid JSON:
 ]"""
 
     try:
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers={
-                "Authorization": f"Bearer {perplexity_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "sonar",
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            timeout=15
-        )
-
-        if response.status_code != 200:
-            print(f"[ERROR] Perplexity failed: {response.text}", file=sys.stderr)
-            return []
-
-        result = response.json()
-        content = result['choices'][0]['message']['content'].strip()
+        completion = complete('further_reading', [{"role": "user", "content": prompt}], MODELS['search'],
+                              None, provider='perplexity', timeout=15)
+        content = completion.text.strip()
 
         # Remove markdown if present
         if content.startswith('```'):
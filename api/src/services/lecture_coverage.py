@@ -0,0 +1,276 @@
+"""
+Per-lecture concept coverage, maintained at transcript ingest.
+
+For each lecture the coverage holds, per concept, the first and last mention
+(transcript seconds), the mention count and the time spent (the gap to the
+next chunk, capped at MAX_GAP_SEC, credited to the concepts of the chunk
+being spoken), plus the most recent concept and the lecture's ordinal in
+its course.
+
+It is one JSON value in Redis (`coverage:{lecture_id}`). Ingest applies new
+chunks under WATCH. The value keeps the ids of the chunks it has counted, so
+a replayed chunk is skipped and a chunk whose transaction committed after
+newer ones (created_at is the transaction start) is still counted. On a miss
+the coverage is rebuilt from transcript_chunks with the same rules. A
+per-lecture sequence number stops a rebuild that raced with an ingest from
+caching a stale result.
+
+Without Redis the same state is kept in process memory for up to
+COVERAGE_MEMORY_TTL seconds (ingest in this process updates it directly;
+the TTL bounds staleness from ingest handled by other processes).
+"""
+
+import collections
+import copy
+import json
+import os
+import threading
+import time
+
+import redis
+
+from ..db import supabase
+from ..cache import get_client
+from ..query import PAGE_SIZE, after_cursor
+from ..snapshot import load_course_snapshot
+from .concept_detector import course_for_lecture
+
+COVERAGE_TTL = 7 * 24 * 3600
+COVERAGE_MEMORY_TTL = float(os.getenv("COVERAGE_MEMORY_TTL", "30"))
+MEMORY_LECTURES = 100
+MAX_GAP_SEC = 60.0
+WATCH_RETRIES = 5
+
+_memory_lock = threading.Lock()
+_memory = collections.OrderedDict()  # lecture_id -> (stored_at, state), least recently used first
+_memory_seq = {}  # lecture_id -> ingest count, for cached or in-flight lectures
+_in_flight = collections.Counter()  # lecture_id -> rebuilds running
+
+
+def _key(lecture_id):
+    return f"coverage:{lecture_id}"
+
+
+def _seq_key(lecture_id):
+    return f"coverage_seq:{lecture_id}"
+
+
+def _empty(lecture_id, course_id, ordinal):
+    return {
+        'lecture_id': lecture_id,
+        'course_id': course_id,
+        'ordinal': ordinal,
+        'recent_concept_id': None,
+        'chunk_count': 0,
+        'last_sec': None,
+        'last_concepts': [],
+        'chunk_ids': [],
+        'concepts': {},
+    }
+
+
+def _apply_chunks(state, chunks_with_concepts):
+    """
+    Fold [(chunk_row, concept_ids)] into the coverage in the given (spoken) order.
+    Chunks whose id is already in the coverage were counted before.
+    """
+    counted = set(state['chunk_ids'])
+    for chunk, concept_ids in chunks_with_concepts:
+        if chunk['id'] in counted:
+            continue
+        counted.add(chunk['id'])
+        state['chunk_ids'].append(chunk['id'])
+        _apply_chunk(state, chunk, concept_ids or [])
+
+
+def _apply_chunk(state, chunk, concept_ids):
+    state['chunk_count'] += 1
+
+    ts = chunk.get('timestamp_sec')
+    in_order = ts is None or state['last_sec'] is None or ts >= state['last_sec']
+    if ts is not None and state['last_sec'] is not None and in_order:
+        gap = min(ts - state['last_sec'], MAX_GAP_SEC)
+        for concept_id in state['last_concepts']:
+            if concept_id in state['concepts']:
+                state['concepts'][concept_id]['time_sec'] += gap
+
+    for concept_id in concept_ids:
+        entry = state['concepts'].setdefault(
+            concept_id, {'first_sec': ts, 'last_sec': ts, 'mentions': 0, 'time_sec': 0.0})
+        entry['mentions'] += 1
+        if ts is not None:
+            entry['first_sec'] = ts if entry['first_sec'] is None else min(entry['first_sec'], ts)
+            entry['last_sec'] = ts if entry['last_sec'] is None else max(entry['last_sec'], ts)
+
+    if in_order:
+        if ts is not None:
+            state['last_sec'] = ts
+        state['last_concepts'] = list(concept_ids)
+        if concept_ids:
+            state['recent_concept_id'] = concept_ids[0]
+
+
+def _lecture_ordinal(course_id, lecture_id):
+    """1-based position of the lecture among its course's lectures by start time."""
+    lectures = load_course_snapshot(course_id)['lectures']  # newest first
+    ids = [l['id'] for l in reversed(lectures)]
+    return ids.index(lecture_id) + 1 if lecture_id in ids else len(ids) + 1
+
+
+def _fetch_chunks(lecture_id):
+    rows = []
+    cursor = None
+    while True:
+        query = supabase.table('transcript_chunks').select(
+            'id, timestamp_sec, created_at, transcript_concepts(concept_id)').eq('lecture_id', lecture_id)
+        if cursor:
+            query = after_cursor(query, cursor)
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+
+
+def _rebuild(lecture_id):
+    course_id = course_for_lecture(lecture_id)
+    if not course_id:
+        return None
+    state = _empty(lecture_id, course_id, _lecture_ordinal(course_id, lecture_id))
+    chunks = _fetch_chunks(lecture_id)
+    # Chunks from one batch write share created_at; fold them in spoken order like ingest does
+    chunks.sort(key=lambda c: (c['created_at'], c.get('timestamp_sec') is None, c.get('timestamp_sec') or 0))
+    _apply_chunks(state, [(chunk, [link['concept_id'] for link in chunk.get('transcript_concepts') or []])
+                          for chunk in chunks])
+    return state
+
+
+def _load_from_memory(lecture_id):
+    with _memory_lock:
+        entry = _memory.get(lecture_id)
+        if entry and time.time() - entry[0] < COVERAGE_MEMORY_TTL:
+            _memory.move_to_end(lecture_id)
+            return copy.deepcopy(entry[1])
+        _in_flight[lecture_id] += 1
+        seq_before = _memory_seq.get(lecture_id, 0)
+
+    state = None
+    try:
+        state = _rebuild(lecture_id)
+    finally:
+        with _memory_lock:
+            _in_flight[lecture_id] -= 1
+            if not _in_flight[lecture_id]:
+                del _in_flight[lecture_id]
+            if state is not None and _memory_seq.get(lecture_id, 0) == seq_before:
+                _memory[lecture_id] = (time.time(), copy.deepcopy(state))
+                _memory.move_to_end(lecture_id)
+                while len(_memory) > MEMORY_LECTURES:
+                    evicted, _ = _memory.popitem(last=False)
+                    if evicted not in _in_flight:
+                        _memory_seq.pop(evicted, None)
+            elif lecture_id not in _memory and lecture_id not in _in_flight:
+                _memory_seq.pop(lecture_id, None)
+    return state
+
+
+def _record_in_memory(lecture_id, chunks_with_concepts):
+    with _memory_lock:
+        if lecture_id in _memory or lecture_id in _in_flight:
+            _memory_seq[lecture_id] = _memory_seq.get(lecture_id, 0) + 1
+        entry = _memory.get(lecture_id)
+        if entry:
+            _apply_chunks(entry[1], chunks_with_concepts)
+
+
+def _decode(raw):
+    """A cached coverage value, or None if it is missing or predates chunk id tracking."""
+    if raw is None:
+        return None
+    state = json.loads(raw)
+    return state if 'chunk_ids' in state else None
+
+
+def load_coverage(lecture_id):
+    """Coverage for a lecture, or None if the lecture does not exist."""
+    client = get_client()
+    if not client:
+        return _load_from_memory(lecture_id)
+    try:
+        state = _decode(client.get(_key(lecture_id)))
+        if state is not None:
+            return state
+        seq_before = client.get(_seq_key(lecture_id))
+    except Exception as e:
+        print(f"[lecture_coverage] Redis read failed, rebuilding: {e}")
+        return _rebuild(lecture_id)
+
+    state = _rebuild(lecture_id)
+    if state is None:
+        return None
+    try:
+        with client.pipeline() as pipe:
+            pipe.watch(_seq_key(lecture_id))
+            if pipe.get(_seq_key(lecture_id)) == seq_before:
+                pipe.multi()
+                pipe.setex(_key(lecture_id), COVERAGE_TTL, json.dumps(state))
+                pipe.execute()
+    except redis.WatchError:
+        pass  # an ingest landed mid-rebuild; the next read rebuilds again
+    except Exception as e:
+        print(f"[lecture_coverage] Redis write failed: {e}")
+    return state
+
+
+def record_chunks(lecture_id, chunks_with_concepts):
+    """Fold newly stored [(chunk_row, concept_ids)] into the cached coverage, if it is cached."""
+    if not chunks_with_concepts:
+        return
+    client = get_client()
+    if not client:
+        _record_in_memory(lecture_id, chunks_with_concepts)
+        return
+    key = _key(lecture_id)
+    try:
+        client.incr(_seq_key(lecture_id))
+        client.expire(_seq_key(lecture_id), COVERAGE_TTL)
+        for _ in range(WATCH_RETRIES):
+            with client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    state = _decode(pipe.get(key))
+                    if state is None:
+                        pipe.unwatch()
+                        client.delete(key)
+                        return  # not cached; the next read rebuilds from the database
+                    _apply_chunks(state, chunks_with_concepts)
+                    pipe.multi()
+                    pipe.setex(key, COVERAGE_TTL, json.dumps(state))
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+        client.delete(key)
+    except Exception as e:
+        print(f"[lecture_coverage] Update failed for lecture {lecture_id}: {e}")
+        try:
+            client.delete(key)
+        except Exception:
+            pass
+
+
+def coverage_timeline(state, concepts):
+    """Public view of a coverage state: concepts ordered by first mention, with labels."""
+    labels = {c['id']: c.get('label') for c in concepts}
+    timeline = [dict(entry, concept_id=concept_id, label=labels.get(concept_id),
+                     time_sec=round(entry['time_sec'], 1))
+                for concept_id, entry in state['concepts'].items()]
+    timeline.sort(key=lambda e: (e['first_sec'] is None, e['first_sec'] or 0))
+    return {
+        'lecture_id': state['lecture_id'],
+        'ordinal': state['ordinal'],
+        'recent_concept_id': state['recent_concept_id'],
+        'chunk_count': state['chunk_count'],
+        'last_sec': state['last_sec'],
+        'concepts': timeline,
+    }
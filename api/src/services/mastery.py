@@ -0,0 +1,399 @@
+"""
+Mastery write path shared by the single-row and batch endpoints.
+
+apply_rule() holds the scoring rules. apply_mastery_op() applies one rule
+atomically through the apply_mastery_op database function (one round-trip,
+row-locked), falling back to a compare-and-set loop with the same rules when
+the function is not installed. batch_update() sends many operations to the
+apply_mastery_ops function, which locks every touched row and applies them in
+order, so a concurrent single-row update is never overwritten; it then runs a
+single cache invalidation pass for every affected student. Every write path ends in
+publish_mastery_changes(), which pushes the deltas to the course event stream.
+"""
+
+from datetime import datetime, timezone
+
+from ..db import supabase
+from ..cache import cache_delete, cache_delete_pattern, cache_delete_where
+from ..parallel import run_parallel
+from ..query import select_in, chunked
+from ..events import publish
+from ..routes.heatmap import confidence_to_color
+from .analytics_cube import record_mastery_changes
+
+UPSERT_CHUNK_SIZE = 500
+BATCH_RPC_SIZE = 1000
+FALLBACK_CHUNK_SIZE = 100
+OPS = ('confidence', 'eval_result', 'delta', 'max')
+EVAL_RESULTS = ('correct', 'partial', 'wrong')
+CAS_RETRIES = 5
+
+# Flipped off the first time the database reports the function is missing
+_rpc_available = True
+_batch_rpc_available = True
+_student_courses = {}  # student_id -> course_id (never changes)
+
+
+def parse_op(data):
+    """Pull the mastery operation out of a request body. Returns (op, value) or raises ValueError."""
+    for op in OPS:
+        if op in data:
+            value = data[op]
+            if op == 'eval_result':
+                if value not in EVAL_RESULTS:
+                    raise ValueError(f"eval_result must be one of {', '.join(EVAL_RESULTS)}")
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{op} must be a number")
+            return op, value
+    raise ValueError('Must provide confidence, eval_result, delta, or max')
+
+
+def apply_rule(old_confidence, op, value):
+    """Return (new_confidence, attempts_increment) for one operation."""
+    if op == 'confidence':
+        return max(0.0, min(1.0, value)), 0
+    if op == 'eval_result':
+        if value == 'correct':
+            new_confidence = max(old_confidence, 0.85)
+        elif value == 'partial':
+            new_confidence = max(old_confidence, 0.50)
+        elif value == 'wrong':
+            new_confidence = 0.20 if old_confidence == 0.0 else min(old_confidence, 0.20)
+        else:
+            raise ValueError(f"Unknown eval_result: {value}")
+        return new_confidence, 1
+    if op == 'delta':
+        return max(0.0, min(1.0, old_confidence + value)), 0
+    if op == 'max':
+        new_confidence = max(old_confidence, max(0.0, min(1.0, value)))
+        return new_confidence, 1 if new_confidence > old_confidence else 0
+    raise ValueError(f"Unknown mastery op: {op}")
+
+
+def invalidate_mastery(student_ids):
+    """One invalidation pass for mastery changes affecting these students."""
+    student_ids = set(student_ids)
+    if not student_ids:
+        return
+    cache_delete(*[f"mastery:{sid}" for sid in student_ids])
+    cache_delete_where("graph:*", lambda key: key.rsplit(':', 1)[-1] in student_ids)
+    cache_delete_where("tutoring_context:*", lambda key: key.split(':')[1] in student_ids)
+    cache_delete_pattern("heatmap:*")
+    cache_delete_pattern("students_summary:*")
+
+
+def courses_for(student_ids):
+    """{student_id: course_id}, cached for the life of the worker (a student never changes course)."""
+    missing = [sid for sid in student_ids if sid not in _student_courses]
+    if missing:
+        for row in select_in('students', 'id, course_id', 'id', missing):
+            _student_courses[row['id']] = row['course_id']
+    return {sid: _student_courses.get(sid) for sid in student_ids}
+
+
+def publish_mastery_changes(changes):
+    """
+    Push (student_id, concept_id, old, new) changes to each course's event stream:
+    one 'mastery' event with the new values and one 'heatmap' event with the
+    per-concept color count and confidence-sum deltas.
+    """
+    changes = [c for c in changes if c[2] != c[3]]
+    if not changes:
+        return
+    try:
+        courses = courses_for(list({c[0] for c in changes}))
+        by_course = {}
+        for change in changes:
+            if courses.get(change[0]):
+                by_course.setdefault(courses[change[0]], []).append(change)
+
+        for course_id, course_changes in by_course.items():
+            publish(course_id, 'mastery', {'changes': [
+                {'student_id': sid, 'concept_id': cid, 'confidence': new, 'color': confidence_to_color(new)}
+                for sid, cid, _, new in course_changes
+            ]})
+            cells = {}
+            for _, cid, old, new in course_changes:
+                cell = cells.setdefault(cid, {'concept_id': cid, 'counts': {}, 'sum_delta': 0.0})
+                before, after = confidence_to_color(old), confidence_to_color(new)
+                if before != after:
+                    cell['counts'][before] = cell['counts'].get(before, 0) - 1
+                    cell['counts'][after] = cell['counts'].get(after, 0) + 1
+                cell['sum_delta'] = round(cell['sum_delta'] + new - old, 6)
+            publish(course_id, 'heatmap', {'cells': list(cells.values())})
+    except Exception as e:
+        print(f"[mastery] Failed to publish mastery changes: {e}")
+
+
+def _is_missing_function(error, name='apply_mastery_op'):
+    message = str(error)
+    return name in message and (
+        'PGRST202' in message or 'does not exist' in message or 'Could not find' in message)
+
+
+def _apply_rpc(student_id, concept_id, op, value):
+    rows = supabase.rpc('apply_mastery_op', {
+        'p_student_id': student_id,
+        'p_concept_id': concept_id,
+        'p_op': op,
+        'p_value': str(value),
+    }).execute().data
+    if not rows:
+        return None
+    row = rows[0]
+    return row['old_confidence'], row['new_confidence'], row['attempts']
+
+
+def _insert_default_row(student_id, concept_id):
+    """Insert a 0.0 row if none exists. Returns False if the student or concept does not exist."""
+    students, concepts = run_parallel(
+        lambda: supabase.table('students').select('id').eq('id', student_id).execute().data,
+        lambda: supabase.table('concept_nodes').select('id').eq('id', concept_id).execute().data,
+    )
+    if not students or not concepts:
+        return False
+    supabase.table('student_mastery').upsert(
+        {'student_id': student_id, 'concept_id': concept_id, 'confidence': 0.0, 'attempts': 0},
+        on_conflict='student_id,concept_id', ignore_duplicates=True,
+    ).execute()
+    return True
+
+
+def _apply_local(student_id, concept_id, op, value):
+    """Same rules as the database function: read, compute, then write only if the row is unchanged."""
+    for _ in range(CAS_RETRIES):
+        current = supabase.table('student_mastery').select('confidence, attempts').eq(
+            'student_id', student_id).eq('concept_id', concept_id).execute().data
+        if not current:
+            # Sparse storage: create the 0.0 row, then retry against it
+            if not _insert_default_row(student_id, concept_id):
+                return None
+            continue
+        old_confidence = current[0]['confidence'] or 0.0
+        old_attempts = current[0]['attempts'] or 0
+        new_confidence, increment = apply_rule(old_confidence, op, value)
+
+        query = supabase.table('student_mastery').update({
+            'confidence': new_confidence,
+            'attempts': old_attempts + increment,
+            'last_updated': datetime.now(timezone.utc).isoformat(),
+        }).eq('student_id', student_id).eq('concept_id', concept_id)
+        for column in ('confidence', 'attempts'):
+            query = query.is_(column, 'null') if current[0][column] is None else query.eq(column, current[0][column])
+        if query.execute().data:
+            return old_confidence, new_confidence, old_attempts + increment
+    raise RuntimeError('Mastery row kept changing; update not applied')
+
+
+def _apply_one(student_id, concept_id, op, value):
+    """(old, new, attempts) through the database function, or the local fallback; None if ids are unknown."""
+    global _rpc_available
+    if _rpc_available:
+        try:
+            return _apply_rpc(student_id, concept_id, op, value)
+        except Exception as e:
+            if not _is_missing_function(e):
+                raise
+            print("[mastery] apply_mastery_op function not installed; using local updates")
+            _rpc_available = False
+    return _apply_local(student_id, concept_id, op, value)
+
+
+def apply_mastery_op(student_id, concept_id, op, value):
+    """
+    Apply one operation atomically and return {'old_confidence', 'confidence', 'attempts'}.
+    A missing row starts from 0.0; returns None if the student or concept does not exist.
+    """
+    result = _apply_one(student_id, concept_id, op, value)
+    if result is None:
+        return None
+
+    old_confidence, new_confidence, attempts = result
+    record_mastery_changes([(student_id, concept_id, old_confidence, new_confidence)])
+    invalidate_mastery([student_id])
+    publish_mastery_changes([(student_id, concept_id, old_confidence, new_confidence)])
+    return {'old_confidence': old_confidence, 'confidence': new_confidence, 'attempts': attempts}
+
+
+def upsert_mastery_rows(rows):
+    """Chunked upsert on (student_id, concept_id); chunks run concurrently. Missing pairs are inserted."""
+    chunks = [rows[i:i + UPSERT_CHUNK_SIZE] for i in range(0, len(rows), UPSERT_CHUNK_SIZE)]
+    run_parallel(*(
+        (lambda chunk=chunk: supabase.table('student_mastery').upsert(
+            chunk, on_conflict='student_id,concept_id').execute())
+        for chunk in chunks
+    ))
+
+
+def _select_pairs(student_ids, concept_ids):
+    # Both id lists end up in the URL, so chunk the concepts as well as the students
+    return [row for part in run_parallel(*(
+        (lambda chunk=chunk: select_in(
+            'student_mastery', 'student_id, concept_id, confidence, attempts', 'student_id', student_ids,
+            filters=lambda q: q.in_('concept_id', chunk),
+        ))
+        for chunk in chunked(concept_ids)
+    )) for row in part]
+
+
+def load_mastery(student_ids, concept_ids):
+    """
+    Read mastery for the student x concept cross-product in one concurrent round.
+
+    Returns (rows_by_pair, known_student_ids, known_concept_ids). Mastery is
+    sparse, so a pair without a row is 0.0 as long as both ids exist.
+    """
+    rows, students, concepts = run_parallel(
+        lambda: _select_pairs(student_ids, concept_ids),
+        lambda: select_in('students', 'id', 'id', student_ids),
+        lambda: select_in('concept_nodes', 'id', 'id', concept_ids),
+    )
+    return (
+        {(r['student_id'], r['concept_id']): r for r in rows},
+        {s['id'] for s in students},
+        {c['id'] for c in concepts},
+    )
+
+
+class BatchIncomplete(Exception):
+    """
+    A batch stopped part-way. `remaining` lists the indexes of the ops that were
+    not written, in order; `results` has an entry per op (None for those).
+    """
+
+    def __init__(self, results, remaining, error):
+        self.applied = len(results) - len(remaining)
+        super().__init__(f"{self.applied} ops applied before the batch failed: {error}")
+        self.results = results
+        self.remaining = remaining
+        self.error = error
+
+
+def _apply_batch_rpc(updates):
+    """One apply_mastery_ops call per BATCH_RPC_SIZE ops, in order. Returns a result (or None) per op."""
+    results = [None] * len(updates)
+    for start in range(0, len(updates), BATCH_RPC_SIZE):
+        try:
+            rows = supabase.rpc('apply_mastery_ops', {'p_ops': [
+                {'student_id': sid, 'concept_id': cid, 'op': op, 'value': str(value)}
+                for sid, cid, op, value in updates[start:start + BATCH_RPC_SIZE]
+            ]}).execute().data or []
+        except Exception as e:
+            # Each call is its own transaction, so earlier chunks are committed
+            if start:
+                raise BatchIncomplete(results, list(range(start, len(updates))), e) from e
+            raise
+        for row in rows:
+            results[start + row['op_index']] = row['old_confidence'], row['new_confidence'], row['attempts']
+    return results
+
+
+def _apply_batch(updates):
+    global _batch_rpc_available
+    if _batch_rpc_available:
+        try:
+            return _apply_batch_rpc(updates)
+        except BatchIncomplete:
+            raise
+        except Exception as e:
+            if not _is_missing_function(e, 'apply_mastery_ops'):
+                raise
+            print("[mastery] apply_mastery_ops function not installed; applying batch ops pair by pair "
+                  "(run scripts/migration_mastery_batch.sql)")
+            _batch_rpc_available = False
+    return _apply_batch_local(updates)
+
+
+def _apply_batch_local(updates):
+    """
+    Fallback for _apply_batch: each op through _apply_one, FALLBACK_CHUNK_SIZE ops at a time.
+
+    Ops on one (student, concept) pair run in order in one task; different pairs
+    run concurrently. Each op is still atomic (row lock or compare-and-set).
+    """
+    results = [None] * len(updates)
+    for start in range(0, len(updates), FALLBACK_CHUNK_SIZE):
+        by_pair = {}
+        for index in range(start, min(start + FALLBACK_CHUNK_SIZE, len(updates))):
+            by_pair.setdefault(tuple(updates[index][:2]), []).append(index)
+
+        def apply_pair(indexes):
+            # Stop the pair at its first failure so its later ops are not applied out of order
+            for n, index in enumerate(indexes):
+                try:
+                    results[index] = _apply_one(*updates[index])
+                except Exception as e:
+                    return indexes[n:], e
+            return [], None
+
+        outcomes = run_parallel(*((lambda indexes=indexes: apply_pair(indexes)) for indexes in by_pair.values()))
+        failed = [outcome for outcome in outcomes if outcome[1] is not None]
+        if failed:
+            remaining = sorted(i for unapplied, _ in failed for i in unapplied)
+            remaining.extend(range(start + FALLBACK_CHUNK_SIZE, len(updates)))
+            error = failed[0][1]
+            if len(remaining) == len(updates):
+                raise error
+            raise BatchIncomplete(results, remaining, error) from error
+    return results
+
+
+def batch_update(updates):
+    """
+    Apply [(student_id, concept_id, op, value), ...] in order.
+
+    Every op is applied atomically against the stored row, so concurrent
+    single-row updates interleave instead of being overwritten. Pairs without
+    a row start from 0.0. Pairs whose student or concept does not exist are
+    reported in not_found and skipped.
+    Returns {'results': [...], 'not_found': [...]}.
+
+    If the database fails after some ops were committed, the caches and event
+    streams are still updated for those, then BatchIncomplete is raised with
+    the indexes of the ops not applied so the caller can retry only those.
+    """
+    if not updates:
+        return {'results': [], 'not_found': []}
+
+    incomplete = None
+    skipped = ()
+    try:
+        applied = _apply_batch(updates)
+    except BatchIncomplete as e:
+        applied, incomplete, skipped = e.results, e, set(e.remaining)
+
+    # pair -> [original confidence, final confidence, final attempts]
+    state = {}
+    not_found = []
+    missing = set()
+    for index, ((student_id, concept_id, _, _), result) in enumerate(zip(updates, applied)):
+        if index in skipped:
+            continue
+        pair = (student_id, concept_id)
+        if result is None:
+            if pair not in missing and pair not in state:
+                missing.add(pair)
+                not_found.append({'student_id': student_id, 'concept_id': concept_id})
+            continue
+        old_confidence, new_confidence, attempts = result
+        if pair in state:
+            state[pair][1:] = [new_confidence, attempts]
+        else:
+            state[pair] = [old_confidence, new_confidence, attempts]
+
+    if state:
+        changes = [(sid, cid, old, new) for (sid, cid), (old, new, _) in state.items()]
+        record_mastery_changes(changes)
+        invalidate_mastery(sid for sid, _ in state)
+        publish_mastery_changes(changes)
+    if incomplete:
+        raise incomplete
+
+    results = [{
+        'student_id': sid,
+        'concept_id': cid,
+        'old_confidence': old,
+        'confidence': new,
+        'attempts': attempts,
+    } for (sid, cid), (old, new, attempts) in state.items()]
+    return {'results': results, 'not_found': not_found}
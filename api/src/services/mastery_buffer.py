@@ -0,0 +1,282 @@
+"""
+Opt-in write-behind buffer for mastery updates (MASTERY_WRITE_BEHIND=true).
+
+During a live poll, single-row mastery writes arrive in bursts. Instead of a
+read-modify-write per request, operations are appended to a per-student
+buffer and a background flusher applies them with batch_update(): the
+whole flush costs one apply_mastery_ops call per 1,000 ops and one
+invalidation pass.
+
+The buffer lives in Redis when available (shared by every worker) and in
+process memory otherwise. Readers call apply_pending() on top of what they
+read from the database, so a student sees their own writes before the flush;
+ops being flushed stay readable under an in-flight key until the flush
+settles. Class-wide aggregates (heatmap, summary) catch up on the next flush.
+
+A flush first coalesces each (student, concept) run of ops into the shortest
+sequence with the same effect, confidence and attempts alike, so a burst of
+updates to one concept is a single op in the batch.
+"""
+
+import atexit
+import json
+import os
+import threading
+
+from ..cache import get_client
+from .mastery import BatchIncomplete, apply_rule, batch_update
+
+ENABLED = os.getenv("MASTERY_WRITE_BEHIND", "false").lower() == "true"
+FLUSH_INTERVAL = float(os.getenv("MASTERY_FLUSH_INTERVAL", "2.0"))
+FLUSH_THRESHOLD = int(os.getenv("MASTERY_FLUSH_THRESHOLD", "500"))
+FLUSH_BATCH_STUDENTS = 500
+# A crashed flush's in-flight ops stop showing (and blocking that student's next flush) after this
+IN_FLIGHT_TTL = 300
+
+PENDING_SET_KEY = "mastery_buffer:pending"
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_memory = {}  # student_id -> [(concept_id, op, value), ...]
+_in_flight = {}  # same shape: memory ops drained by the running flush
+_since_flush = 0
+_wake = threading.Event()
+_flusher = None
+
+
+def _buffer_key(student_id):
+    return f"mastery_buffer:{student_id}"
+
+
+def _in_flight_key(student_id):
+    return f"mastery_buffer:in_flight:{student_id}"
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="mastery-flusher", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+def _flush_loop():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"[mastery_buffer] Flush failed: {e}")
+
+
+def enqueue(student_id, concept_id, op, value):
+    """Buffer one mastery operation; it is written on the next flush."""
+    global _since_flush
+    client = get_client()
+    entry = (concept_id, op, value)
+    if client:
+        try:
+            pipe = client.pipeline()
+            pipe.rpush(_buffer_key(student_id), json.dumps(entry))
+            pipe.sadd(PENDING_SET_KEY, student_id)
+            pipe.execute()
+        except Exception as e:
+            print(f"[mastery_buffer] Redis enqueue failed, buffering in memory: {e}")
+            client = None
+    if not client:
+        with _lock:
+            _memory.setdefault(student_id, []).append(entry)
+
+    with _lock:
+        _since_flush += 1
+        if _since_flush >= FLUSH_THRESHOLD:
+            _wake.set()
+    _ensure_flusher()
+
+
+def pending_ops(student_id):
+    """Buffered [(concept_id, op, value), ...] for a student, oldest first."""
+    ops = []
+    client = get_client()
+    if client:
+        try:
+            # One MULTI, so ops moving from the buffer to in-flight are seen exactly once
+            pipe = client.pipeline()
+            pipe.lrange(_in_flight_key(student_id), 0, -1)
+            pipe.lrange(_buffer_key(student_id), 0, -1)
+            ops = [tuple(json.loads(raw)) for raws in pipe.execute() for raw in raws]
+        except Exception:
+            ops = []
+    with _lock:
+        ops.extend(_in_flight.get(student_id, []))
+        ops.extend(_memory.get(student_id, []))
+    return ops
+
+
+def apply_pending(student_id, rows, key='concept_id'):
+    """
+    Return copies of mastery rows with the student's buffered ops applied.
+
+    rows: dicts with `key` (concept id) and `confidence` (and optionally `attempts`).
+    Concepts with buffered ops but no row are left out; callers decide defaults.
+    """
+    ops = pending_ops(student_id) if ENABLED else []
+    if not ops:
+        return rows
+
+    by_concept = {}
+    for concept_id, op, value in ops:
+        by_concept.setdefault(concept_id, []).append((op, value))
+
+    result = []
+    for row in rows:
+        row_ops = by_concept.get(row[key])
+        if row_ops:
+            row = dict(row)
+            for op, value in row_ops:
+                row['confidence'], attempts = apply_rule(row['confidence'], op, value)
+                if 'attempts' in row:
+                    row['attempts'] = (row['attempts'] or 0) + attempts
+        result.append(row)
+    return result
+
+
+def _clamp(value):
+    return max(0.0, min(1.0, value))
+
+
+def _coalesce(ops):
+    """
+    Shorten a student's [(concept_id, op, value), ...] to an equivalent list, grouped by concept.
+
+    Attempts count too, so only ops that cannot change them are merged: a
+    confidence op replaces the confidence and delta ops right before it, a delta
+    folds into a preceding confidence or same-signed delta (clamping makes mixed
+    signs order-dependent), and a max that cannot raise the confidence is dropped.
+    """
+    by_concept = {}
+    for concept_id, op, value in ops:
+        out = by_concept.setdefault(concept_id, [])
+        last_op, last_value = out[-1] if out else (None, None)
+        if op == 'confidence':
+            while out and out[-1][0] in ('confidence', 'delta'):
+                out.pop()
+            out.append((op, _clamp(value)))
+        elif op == 'delta' and last_op == 'confidence':
+            out[-1] = (last_op, _clamp(last_value + value))
+        elif op == 'delta' and last_op == 'delta' and last_value * value >= 0:
+            out[-1] = (op, last_value + value)
+        elif op == 'max' and last_op in ('confidence', 'max') and _clamp(value) <= _clamp(last_value):
+            continue
+        else:
+            out.append((op, value))
+    return [(concept_id, op, value) for concept_id, out in by_concept.items() for op, value in out]
+
+
+def _drain_redis(client):
+    """Move up to FLUSH_BATCH_STUDENTS buffers to their in-flight keys. Returns ({student_id: ops}, popped)."""
+    student_ids = client.spop(PENDING_SET_KEY, FLUSH_BATCH_STUDENTS) or []
+    if not student_ids:
+        return {}, 0
+    # LRANGE + RENAMENX in one MULTI: ops pushed concurrently land in a fresh list, and
+    # the drained ones stay readable until the flush settles. RENAMENX fails while
+    # another flush still has the student in flight (or the buffer is already gone)
+    pipe = client.pipeline()
+    for sid in student_ids:
+        pipe.lrange(_buffer_key(sid), 0, -1)
+        pipe.renamenx(_buffer_key(sid), _in_flight_key(sid))
+        pipe.expire(_in_flight_key(sid), IN_FLIGHT_TTL)
+    replies = pipe.execute(raise_on_error=False)
+    drained, busy = {}, []
+    for n, sid in enumerate(student_ids):
+        raw_ops, moved = replies[3 * n], replies[3 * n + 1]
+        if moved is True:
+            drained[sid] = [tuple(json.loads(raw)) for raw in raw_ops]
+        elif raw_ops:
+            busy.append(sid)
+    if busy:
+        client.sadd(PENDING_SET_KEY, *busy)
+    return drained, len(student_ids)
+
+
+def _settle(memory_ops, redis_ops, unapplied):
+    """
+    End a flush: clear its in-flight ops and put unapplied ones back at the head of their buffers.
+
+    unapplied: [(source, (student_id, concept_id, op, value)), ...] in order,
+    source being 'memory' or 'redis'.
+    """
+    back = {'memory': {}, 'redis': {}}
+    for source, (sid, concept_id, op, value) in unapplied:
+        back[source].setdefault(sid, []).append((concept_id, op, value))
+
+    client = get_client() if redis_ops else None
+    if client:
+        try:
+            pipe = client.pipeline()
+            for sid in redis_ops:
+                ops = back['redis'].get(sid)
+                if ops:
+                    pipe.lpush(_buffer_key(sid), *[json.dumps(o) for o in reversed(ops)])
+                    pipe.sadd(PENDING_SET_KEY, sid)
+                pipe.delete(_in_flight_key(sid))
+            pipe.execute()
+            back['redis'] = {}
+        except Exception as e:
+            print(f"[mastery_buffer] Redis requeue failed, keeping ops in memory: {e}")
+    with _lock:
+        for sid in memory_ops:
+            _in_flight.pop(sid, None)
+        for source in ('redis', 'memory'):
+            for sid, ops in back[source].items():
+                _memory[sid] = ops + _memory.get(sid, [])
+
+
+def flush():
+    """Write every buffered op through batch_update. Returns the number of ops flushed."""
+    global _since_flush
+    # One flush at a time per process, so _in_flight only ever holds one flush's ops
+    with _flush_lock:
+        with _lock:
+            memory_ops = dict(_memory)
+            _in_flight.update(memory_ops)
+            _memory.clear()
+            _since_flush = 0
+
+        redis_ops = {}
+        client = get_client()
+        if client:
+            try:
+                # Bounded so a steady stream of new ops cannot keep one flush running forever
+                for _ in range(10):
+                    batch, students_popped = _drain_redis(client)
+                    redis_ops.update(batch)
+                    if students_popped < FLUSH_BATCH_STUDENTS:
+                        break
+            except Exception as e:
+                print(f"[mastery_buffer] Redis drain failed: {e}")
+
+        tagged = [(source, (sid, concept_id, op, value))
+                  for source, drained in (('memory', memory_ops), ('redis', redis_ops))
+                  for sid, ops in drained.items()
+                  for concept_id, op, value in _coalesce(ops)]
+        if not tagged:
+            _settle(memory_ops, redis_ops, [])
+            return 0
+        try:
+            outcome = batch_update([update for _, update in tagged])
+        except BatchIncomplete as e:
+            # Only e.remaining was not committed; replaying the rest would apply deltas twice
+            _settle(memory_ops, redis_ops, [tagged[i] for i in e.remaining])
+            raise
+        except Exception:
+            _settle(memory_ops, redis_ops, tagged)
+            raise
+        _settle(memory_ops, redis_ops, [])
+        if outcome['not_found']:
+            print(f"[mastery_buffer] Dropped ops for {len(outcome['not_found'])} unknown student/concept pairs")
+        return sum(len(ops) for drained in (memory_ops, redis_ops) for ops in drained.values())
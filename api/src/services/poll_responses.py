@@ -0,0 +1,108 @@
+"""
+Poll response storage shared by the single and batch endpoints.
+
+A student has at most one response per poll: rows are upserted on
+(question_id, student_id), so a retried or double-clicked submission
+overwrites the earlier answer instead of adding a row, and the tally counts
+the student once. A batch is deduplicated per student (last answer wins) and
+written in a few chunked upserts that run concurrently.
+
+apply_poll_mastery() is the close-time pass: every evaluated response becomes
+an eval_result rule on the poll's concept, all applied by one batch_update
+(one bulk read, one chunked upsert, one cache invalidation). The poll's
+mastery_applied_at is claimed first, so a poll is applied at most once.
+"""
+
+from datetime import datetime, timezone
+
+from ..db import supabase
+from ..parallel import run_parallel
+from .mastery import batch_update
+from .poll_tally import record_response, bucket_for, fetch_responses
+
+UPSERT_CHUNK_SIZE = 500
+
+
+def normalize_response(poll_id, item):
+    """Validate one response payload. Returns the row to upsert or raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('response must be an object')
+    if not item.get('student_id'):
+        raise ValueError('student_id is required')
+    if not isinstance(item.get('answer'), str) or not item['answer'].strip():
+        raise ValueError('answer is required')
+    evaluation = item.get('evaluation')
+    if evaluation is not None and not isinstance(evaluation, dict):
+        raise ValueError('evaluation must be an object')
+    return {
+        'question_id': poll_id,
+        'student_id': item['student_id'],
+        'answer': item['answer'],
+        'evaluation': evaluation,
+    }
+
+
+def store_responses(poll_id, rows):
+    """Upsert response rows for one poll and count them into its tally. Returns the stored rows."""
+    latest = {}
+    for row in rows:
+        latest.pop(row['student_id'], None)
+        latest[row['student_id']] = row
+    rows = list(latest.values())
+    if not rows:
+        return []
+
+    chunks = [rows[i:i + UPSERT_CHUNK_SIZE] for i in range(0, len(rows), UPSERT_CHUNK_SIZE)]
+    results = run_parallel(*(
+        (lambda chunk=chunk: supabase.table('poll_responses').upsert(
+            chunk, on_conflict='question_id,student_id').execute().data)
+        for chunk in chunks
+    ))
+    stored = [row for chunk in results for row in chunk]
+    for row in stored:
+        record_response(poll_id, row)
+    return stored
+
+
+def apply_poll_mastery(poll):
+    """
+    Apply every evaluated response of a closed poll to mastery for the poll's concept.
+    Returns {'applied', 'updated', 'skipped', 'not_found', 'changes'}; applied is False
+    when the poll has no concept or was already applied. changes holds each updated
+    student's old and new confidence, for notifying students.
+    """
+    if not poll.get('concept_id'):
+        return {'applied': False, 'reason': 'Poll has no concept', 'updated': 0, 'skipped': 0, 'not_found': [],
+                'changes': []}
+
+    claimed = supabase.table('poll_questions').update({
+        'mastery_applied_at': datetime.now(timezone.utc).isoformat(),
+    }).eq('id', poll['id']).is_('mastery_applied_at', 'null').execute().data
+    if not claimed:
+        return {'applied': False, 'reason': 'Already applied', 'updated': 0, 'skipped': 0, 'not_found': [],
+                'changes': []}
+
+    try:
+        responses = fetch_responses(poll['id'])
+        updates = []
+        for response in responses:
+            bucket = bucket_for(response.get('evaluation'))
+            if bucket != 'unevaluated':
+                updates.append((response['student_id'], poll['concept_id'], 'eval_result', bucket))
+        result = batch_update(updates)
+    except Exception:
+        # Let a later close retry the whole pass
+        supabase.table('poll_questions').update({'mastery_applied_at': None}).eq('id', poll['id']).execute()
+        raise
+
+    return {
+        'applied': True,
+        'updated': len(result['results']),
+        'skipped': len(responses) - len(updates),
+        'not_found': result['not_found'],
+        'changes': [{
+            'student_id': r['student_id'],
+            'old_confidence': r['old_confidence'],
+            'confidence': r['confidence'],
+        } for r in result['results']],
+    }
@@ -0,0 +1,197 @@
+"""
+Live poll tallies kept as Redis counters.
+
+Each poll has a counter hash (`poll_tally:{poll_id}`) with the response count,
+one field per evaluation bucket and the poll's concept, plus a companion hash
+(`poll_tally_seen:{poll_id}`) mapping each counted response id to its bucket.
+Storing a response moves it into its bucket under WATCH/MULTI: a new response
+adds to the count, a re-evaluated one moves between buckets, so nothing is
+counted twice. Reading a tally is one HGETALL.
+
+On a miss the tally is rebuilt from poll_responses. A per-poll sequence key
+stops a rebuild that raced with a new response from caching a short count.
+Closing a poll rebuilds unconditionally (the reconcile pass), so the final
+numbers always match the table. Without Redis every read rebuilds.
+"""
+
+import redis
+
+from ..db import supabase
+from ..cache import get_client
+from ..query import PAGE_SIZE
+
+TALLY_TTL = 24 * 3600
+WATCH_RETRIES = 5
+BUCKETS = ('correct', 'partial', 'wrong', 'unevaluated')
+
+
+def _key(poll_id):
+    return f"poll_tally:{poll_id}"
+
+
+def _seen_key(poll_id):
+    return f"poll_tally_seen:{poll_id}"
+
+
+def _seq_key(poll_id):
+    return f"poll_tally_seq:{poll_id}"
+
+
+def bucket_for(evaluation):
+    """Evaluation bucket of a response: its eval_result, or 'unevaluated'."""
+    result = evaluation.get('eval_result') if isinstance(evaluation, dict) else None
+    return result if result in BUCKETS else 'unevaluated'
+
+
+def fetch_responses(poll_id):
+    """Every response of a poll as {id, student_id, evaluation}, paged."""
+    rows = []
+    offset = 0
+    while True:
+        page = supabase.table('poll_responses').select('id, student_id, evaluation').eq(
+            'question_id', poll_id).order('id').range(offset, offset + PAGE_SIZE - 1).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+
+def _count(poll, responses):
+    """(counter hash fields, {response_id: bucket}) for a poll's stored responses."""
+    seen = {r['id']: bucket_for(r.get('evaluation')) for r in responses}
+    fields = {bucket: 0 for bucket in BUCKETS}
+    for bucket in seen.values():
+        fields[bucket] += 1
+    fields['responses'] = len(seen)
+    fields['concept_id'] = poll.get('concept_id') or ''
+    return fields, seen
+
+
+def _load_poll(poll_id):
+    rows = supabase.table('poll_questions').select('id, concept_id').eq('id', poll_id).execute().data
+    return rows[0] if rows else None
+
+
+def _rebuild(client, poll_id, force=False):
+    """
+    Count the poll from the database and cache the result. Returns the counter
+    fields, or None if the poll does not exist. Unless `force`, an existing
+    tally is left alone (another reader rebuilt it first).
+    """
+    poll = _load_poll(poll_id)
+    if poll is None:
+        return None
+    if not client:
+        return _count(poll, fetch_responses(poll_id))[0]
+
+    for _ in range(WATCH_RETRIES):
+        with client.pipeline() as pipe:
+            try:
+                # Watch before reading the table: a response stored after the
+                # read bumps the sequence and aborts this write
+                pipe.watch(_seq_key(poll_id), _key(poll_id))
+                if not force and pipe.exists(_key(poll_id)):
+                    return pipe.hgetall(_key(poll_id))
+                fields, seen = _count(poll, fetch_responses(poll_id))
+                pipe.multi()
+                pipe.delete(_key(poll_id), _seen_key(poll_id))
+                pipe.hset(_key(poll_id), mapping=fields)
+                if seen:
+                    pipe.hset(_seen_key(poll_id), mapping=seen)
+                pipe.expire(_key(poll_id), TALLY_TTL)
+                pipe.expire(_seen_key(poll_id), TALLY_TTL)
+                pipe.execute()
+                return fields
+            except redis.WatchError:
+                continue
+    # Responses keep arriving; answer from the table without caching
+    return _count(poll, fetch_responses(poll_id))[0]
+
+
+def load_tally(poll_id):
+    """Counter fields for a poll (rebuilt on a miss), or None if the poll does not exist."""
+    client = get_client()
+    if client:
+        try:
+            fields = client.hgetall(_key(poll_id))
+            if fields:
+                return fields
+            return _rebuild(client, poll_id)
+        except Exception as e:
+            print(f"[poll_tally] Redis read failed for poll {poll_id}, counting from the table: {e}")
+    return _rebuild(None, poll_id)
+
+
+def record_response(poll_id, response):
+    """Count a stored response row (new or re-evaluated) into the cached tally, if it is cached."""
+    client = get_client()
+    if not client:
+        return
+    key, seen_key = _key(poll_id), _seen_key(poll_id)
+    bucket = bucket_for(response.get('evaluation'))
+    try:
+        client.incr(_seq_key(poll_id))
+        client.expire(_seq_key(poll_id), TALLY_TTL)
+        for _ in range(WATCH_RETRIES):
+            with client.pipeline() as pipe:
+                try:
+                    pipe.watch(key, seen_key)
+                    if not pipe.exists(key):
+                        return  # not cached; the next read rebuilds from the table
+                    previous = pipe.hget(seen_key, response['id'])
+                    if previous == bucket:
+                        return
+                    pipe.multi()
+                    if previous is None:
+                        pipe.hincrby(key, 'responses', 1)
+                    else:
+                        pipe.hincrby(key, previous, -1)
+                    pipe.hincrby(key, bucket, 1)
+                    pipe.hset(seen_key, response['id'], bucket)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+        client.delete(key)
+    except Exception as e:
+        print(f"[poll_tally] Update failed for poll {poll_id}: {e}")
+        try:
+            client.delete(key)
+        except Exception:
+            pass
+
+
+def reconcile(poll_id):
+    """Recount a poll from the table and overwrite its cached tally (run when the poll closes)."""
+    client = get_client()
+    try:
+        return _rebuild(client, poll_id, force=True)
+    except Exception as e:
+        print(f"[poll_tally] Reconcile failed for poll {poll_id}: {e}")
+        if client:
+            try:
+                client.delete(_key(poll_id))
+            except Exception:
+                pass
+        return None
+
+
+def tally_view(poll_id, fields):
+    """Public shape of a tally: totals, bucket distribution and the poll concept's correctness."""
+    counts = {bucket: int(fields.get(bucket, 0)) for bucket in BUCKETS}
+    total = int(fields.get('responses', 0))
+    evaluated = total - counts['unevaluated']
+    concept_id = fields.get('concept_id') or None
+    return {
+        'poll_id': poll_id,
+        'total_responses': total,
+        'distribution': counts,
+        'concepts': [{
+            'concept_id': concept_id,
+            'responses': evaluated,
+            'correct': counts['correct'],
+            'partial': counts['partial'],
+            'wrong': counts['wrong'],
+            'correct_rate': round(counts['correct'] / evaluated, 4) if evaluated else None,
+        }] if concept_id else [],
+    }
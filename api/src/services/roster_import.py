@@ -0,0 +1,160 @@
+"""
+Roster import: parse a CSV or NDJSON roster as a stream and create students
+in chunked bulk inserts.
+
+Rows are read one at a time from the upload, so memory stays flat for large
+sections. Full chunks are inserted on the shared query pool while parsing
+continues, with a bounded number of inserts in flight. Mastery is sparse,
+so no per-student mastery rows are written.
+"""
+
+import csv
+import io
+import json
+import os
+from collections import deque
+
+from ..db import supabase
+from ..parallel import submit
+from ..query import select_all
+
+IMPORT_CHUNK_SIZE = int(os.getenv("ROSTER_IMPORT_CHUNK_SIZE", "250"))
+MAX_IN_FLIGHT = 4
+MAX_ROSTER_ROWS = 10000
+MAX_REPORTED_ERRORS = 50
+
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(content_type, filename=None):
+    """Pick csv or ndjson from an explicit filename or content type. Returns None if unknown."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json-seq' in content_type:
+        return 'ndjson'
+    return None
+
+
+def iter_roster_rows(binary_stream, fmt):
+    """Yield (line_number, record_dict_or_None, error) for each roster line, reading lazily."""
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            # DictReader collects fields beyond the header under the None key; trailing
+            # empty ones (a stray comma) are harmless, anything else is a misaligned row
+            extras = record.pop(None, None) or []
+            if any(v.strip() for v in extras):
+                yield reader.line_num, None, f'Row has {len(extras)} more field(s) than the header'
+                continue
+            yield reader.line_num, {(k or '').strip().lower(): (v or '').strip() for k, v in record.items()}, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, 'Each line must be a JSON object'
+            continue
+        yield line_number, {str(k).lower(): (str(v).strip() if v is not None else '') for k, v in record.items()}, None
+
+
+def _existing_emails(course_id):
+    rows = select_all(lambda: supabase.table('students').select('id, email').eq('course_id', course_id))
+    return {r['email'].lower() for r in rows if r.get('email')}
+
+
+def _insert_chunk(chunk):
+    # Bulk inserts need uniform keys; only send cohort when someone in the chunk has one
+    with_cohort = any(row.get('cohort') for _, row in chunk)
+    payload = []
+    for _, row in chunk:
+        item = {'name': row['name'], 'email': row['email'], 'course_id': row['course_id']}
+        if with_cohort:
+            item['cohort'] = row.get('cohort')
+        payload.append(item)
+    return supabase.table('students').insert(payload).execute().data
+
+
+def import_roster(course_id, records):
+    """
+    Create students from (line_number, record, error) tuples.
+
+    Yields a progress dict after every completed chunk and a final summary dict
+    with type 'done'. Emails already in the course, or repeated in the file,
+    are skipped (case-insensitive).
+    """
+    seen_emails = _existing_emails(course_id)
+    stats = {'processed': 0, 'created': 0, 'skipped_duplicates': 0, 'failed': 0}
+    errors = []
+    pending = deque()  # (future, chunk)
+    chunk = []
+
+    def record_error(line, message):
+        stats['failed'] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line, 'error': message})
+
+    def progress(kind='progress'):
+        return dict(stats, type=kind)
+
+    def settle(future, sent):
+        try:
+            stats['created'] += len(future.result())
+        except Exception as e:
+            for line, _ in sent:
+                record_error(line, f'Insert failed: {e}')
+
+    for line, record, error in records:
+        stats['processed'] += 1
+        if stats['processed'] > MAX_ROSTER_ROWS:
+            record_error(line, f'Roster exceeds {MAX_ROSTER_ROWS} rows; remaining lines ignored')
+            stats['processed'] -= 1
+            break
+        if error:
+            record_error(line, error)
+            continue
+
+        name = record.get('name', '')
+        email = record.get('email') or None
+        if not name:
+            record_error(line, 'name is required')
+            continue
+        if email:
+            key = email.lower()
+            if key in seen_emails:
+                stats['skipped_duplicates'] += 1
+                continue
+            seen_emails.add(key)
+
+        chunk.append((line, {'name': name, 'email': email, 'course_id': course_id,
+                             'cohort': record.get('cohort') or None}))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            pending.append((submit(_insert_chunk, chunk), chunk))
+            chunk = []
+            # Keep parsing while inserts run, but bound how many are in flight
+            while len(pending) >= MAX_IN_FLIGHT or (pending and pending[0][0].done()):
+                settle(*pending.popleft())
+                yield progress()
+
+    if chunk:
+        pending.append((submit(_insert_chunk, chunk), chunk))
+    while pending:
+        settle(*pending.popleft())
+        yield progress()
+
+    summary = progress('done')
+    summary['errors'] = errors
+    yield summary
@@ -0,0 +1,346 @@
+"""
+Per-course full-text search over transcripts, learning pages and tutoring
+messages, ranked with BM25.
+
+Each course has a directory of immutable, zlib-compressed segments plus a
+manifest recording, per source table, the (created_at, id) keyset cursor of
+the last row indexed. A refresh reads only rows past those cursors and writes
+them as one new segment; once a course has MAX_SEGMENTS segments they are
+merged into one. A document re-indexed in a newer segment supersedes older
+copies. Rows edited or deleted in place are picked up by a periodic full
+rebuild (SEARCH_REBUILD_SECONDS).
+
+Segments are written to a temp file and renamed into place, and refreshes
+take a per-course file lock, so several workers can share one directory.
+"""
+
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: in-process lock only
+    fcntl = None
+
+from ..db import supabase
+from ..query import PAGE_SIZE, after_cursor, make_cursor
+from .concept_detector import tokenize
+
+INDEX_DIR = os.getenv("SEARCH_INDEX_DIR", os.path.join(tempfile.gettempdir(), "search_index"))
+REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "10"))
+REBUILD_SECONDS = float(os.getenv("SEARCH_REBUILD_SECONDS", "21600"))
+MAX_SEGMENTS = 8
+EXCERPT_WORDS = 30
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset((
+    'a an and are as at be but by for from has have i if in into is it its of on or so that the their then '
+    'there these this to was we were what when which will with you your'
+).split())
+
+# source -> (table, columns, course filter column, row -> (text, meta))
+SOURCES = {
+    'transcript': (
+        'transcript_chunks',
+        'id, text, timestamp_sec, lecture_id, created_at, lecture_sessions!inner(course_id)',
+        'lecture_sessions.course_id',
+        lambda r: (r['text'], {'lecture_id': r['lecture_id'], 'timestamp_sec': r.get('timestamp_sec')}),
+    ),
+    'learning_page': (
+        'learning_pages',
+        'id, title, content, student_id, concept_id, created_at, concept_nodes!inner(course_id)',
+        'concept_nodes.course_id',
+        lambda r: (f"{r.get('title') or ''}\n{r.get('content') or ''}",
+                   {'title': r.get('title'), 'student_id': r.get('student_id'), 'concept_id': r.get('concept_id')}),
+    ),
+    'tutoring_message': (
+        'tutoring_messages',
+        'id, content, role, session_id, concept_id, created_at, '
+        'tutoring_sessions!inner(student_id, students!inner(course_id))',
+        'tutoring_sessions.students.course_id',
+        lambda r: (r['content'], {'session_id': r['session_id'], 'role': r.get('role'),
+                                  'concept_id': r.get('concept_id'),
+                                  'student_id': (r.get('tutoring_sessions') or {}).get('student_id')}),
+    ),
+}
+
+_locks = {}
+_locks_guard = threading.Lock()
+_views = {}  # course_id -> (manifest signature, _IndexView)
+_last_refresh = {}  # course_id -> monotonic time
+
+
+def _course_dir(course_id):
+    if not re.fullmatch(r'[\w-]+', course_id or ''):
+        raise ValueError('Invalid course id')
+    return os.path.join(INDEX_DIR, course_id)
+
+
+def _course_lock(course_id):
+    with _locks_guard:
+        return _locks.setdefault(course_id, threading.Lock())
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.handle = open(self.path, 'a')
+        if fcntl:
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+        self.handle.close()
+
+
+def index_terms(text):
+    return [t for t, _, _ in tokenize(text) if t not in STOPWORDS]
+
+
+def _epoch_ms(created_at):
+    if not created_at:
+        return None
+    try:
+        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+# --- Segments ---
+
+def _build_segment(docs):
+    """docs: [(key, source, row_id, meta, text)] -> compact segment dict."""
+    postings = {}
+    entries = []
+    for index, (key, source, row_id, meta, text) in enumerate(docs):
+        counts = {}
+        terms = index_terms(text)
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            postings.setdefault(term, []).extend((index, tf))
+        entries.append([key, source, row_id, meta, len(terms), text])
+    return {'docs': entries, 'postings': postings}
+
+
+def _write_atomic(path, payload):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def _write_segment(course_id, name, segment):
+    _write_atomic(os.path.join(_course_dir(course_id), name),
+                  zlib.compress(json.dumps(segment, separators=(',', ':')).encode(), 6))
+
+
+def _read_segment(course_id, name):
+    with open(os.path.join(_course_dir(course_id), name), 'rb') as f:
+        return json.loads(zlib.decompress(f.read()))
+
+
+def _read_manifest(course_id):
+    try:
+        with open(os.path.join(_course_dir(course_id), 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(course_id, manifest):
+    _write_atomic(os.path.join(_course_dir(course_id), 'manifest.json'), json.dumps(manifest).encode())
+
+
+# --- Refresh ---
+
+def _fetch_new_rows(course_id, source, watermark):
+    """Rows of one source past the watermark, oldest first, paged by keyset."""
+    table, columns, course_column, _ = SOURCES[source]
+    rows = []
+    cursor = tuple(watermark.split(',', 1)) if watermark else None
+    while True:
+        query = supabase.table(table).select(columns).eq(course_column, course_id)
+        if cursor:
+            query = after_cursor(query, cursor)
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+
+
+def _to_doc(source, row):
+    text, meta = SOURCES[source][3](row)
+    meta['created_at_ms'] = _epoch_ms(row.get('created_at'))
+    return (f"{source}:{row['id']}", source, row['id'], meta, text or '')
+
+
+def _merge_segments(course_id, names):
+    latest = {}
+    for name in names:
+        for key, source, row_id, meta, _, text in _read_segment(course_id, name)['docs']:
+            latest[key] = (key, source, row_id, meta, text)
+    return _build_segment(list(latest.values()))
+
+
+def refresh(course_id, rebuild=False):
+    """Index rows added since the last refresh (or everything, with rebuild). Returns docs indexed."""
+    os.makedirs(_course_dir(course_id), exist_ok=True)
+    with _course_lock(course_id), _FileLock(os.path.join(_course_dir(course_id), '.lock')):
+        manifest = _read_manifest(course_id)
+        changed = manifest is None or rebuild or time.time() - manifest.get('built_at', 0) > REBUILD_SECONDS
+        old_segments = []
+        if changed:
+            old_segments = manifest['segments'] if manifest else []
+            next_seq = manifest['next_seq'] if manifest else 1
+            manifest = {'segments': [], 'watermarks': {}, 'built_at': time.time(), 'next_seq': next_seq}
+
+        docs = []
+        for source in SOURCES:
+            rows = _fetch_new_rows(course_id, source, manifest['watermarks'].get(source))
+            if rows:
+                manifest['watermarks'][source] = make_cursor(rows[-1])
+                docs.extend(_to_doc(source, row) for row in rows)
+
+        if docs:
+            name = f"seg-{manifest['next_seq']:06d}.z"
+            manifest['next_seq'] += 1
+            _write_segment(course_id, name, _build_segment(docs))
+            manifest['segments'].append(name)
+
+        if len(manifest['segments']) > MAX_SEGMENTS:
+            name = f"seg-{manifest['next_seq']:06d}.z"
+            manifest['next_seq'] += 1
+            _write_segment(course_id, name, _merge_segments(course_id, manifest['segments']))
+            old_segments += manifest['segments']
+            manifest['segments'] = [name]
+
+        if changed or docs:
+            _write_manifest(course_id, manifest)
+        for name in old_segments:
+            try:
+                os.remove(os.path.join(_course_dir(course_id), name))
+            except OSError:
+                pass
+        _last_refresh[course_id] = time.monotonic()
+        return len(docs)
+
+
+# --- Query ---
+
+class _IndexView:
+    """All live segments of a course, with superseded documents masked out."""
+
+    def __init__(self, segments):
+        self.segments = segments
+        latest = {}
+        for seg_no, segment in enumerate(segments):
+            for doc_no, doc in enumerate(segment['docs']):
+                latest[doc[0]] = (seg_no, doc_no)
+        self.live = set(latest.values())
+        self.doc_count = len(latest)
+        total = sum(segments[s]['docs'][d][4] for s, d in self.live)
+        self.avg_length = total / self.doc_count if self.doc_count else 0.0
+
+    def postings(self, term):
+        for seg_no, segment in enumerate(self.segments):
+            flat = segment['postings'].get(term)
+            if flat:
+                for i in range(0, len(flat), 2):
+                    if (seg_no, flat[i]) in self.live:
+                        yield seg_no, flat[i], flat[i + 1]
+
+    def doc(self, seg_no, doc_no):
+        return self.segments[seg_no]['docs'][doc_no]
+
+
+def _load_view(course_id):
+    manifest = _read_manifest(course_id)
+    if not manifest:
+        return None
+    signature = tuple(manifest['segments'])
+    cached = _views.get(course_id)
+    if cached and cached[0] == signature:
+        return cached[1]
+    view = _IndexView([_read_segment(course_id, name) for name in manifest['segments']])
+    _views[course_id] = (signature, view)
+    return view
+
+
+def _excerpt(text, terms):
+    tokens = tokenize(text)
+    if not tokens:
+        return text[:200]
+    hit = next((i for i, (t, _, _) in enumerate(tokens) if t in terms), 0)
+    start = max(0, hit - EXCERPT_WORDS // 3)
+    end = min(len(tokens), start + EXCERPT_WORDS) - 1
+    snippet = text[tokens[start][1]:tokens[end][2]]
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(tokens) - 1 else '')
+
+
+def search(course_id, query, sources=None, student_id=None, limit=20):
+    """
+    BM25-ranked hits for `query` in a course. Student-owned documents (personal
+    learning pages, tutoring messages) are limited to `student_id` when it is
+    given; shared ones are always included.
+    """
+    if time.monotonic() - _last_refresh.get(course_id, float('-inf')) > REFRESH_SECONDS:
+        try:
+            refresh(course_id)
+        except Exception as e:
+            # Serve what is already indexed rather than failing the search
+            print(f"[search_index] Refresh failed for course {course_id}: {e}")
+    view = _load_view(course_id)
+    terms = list(dict.fromkeys(index_terms(query)))
+    if not view or not terms or not view.doc_count:
+        return []
+
+    scores = {}
+    for term in terms:
+        matches = list(view.postings(term))
+        if not matches:
+            continue
+        idf = math.log(1 + (view.doc_count - len(matches) + 0.5) / (len(matches) + 0.5))
+        for seg_no, doc_no, tf in matches:
+            doc = view.doc(seg_no, doc_no)
+            if sources and doc[1] not in sources:
+                continue
+            # Shared documents (transcripts, general learning pages) have no owner
+            owner = doc[3].get('student_id')
+            if student_id and owner is not None and owner != student_id:
+                continue
+            norm = K1 * (1 - B + B * doc[4] / (view.avg_length or 1))
+            scores[(seg_no, doc_no)] = scores.get((seg_no, doc_no), 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    results = []
+    term_set = set(terms)
+    for (seg_no, doc_no), score in ranked:
+        _, source, row_id, meta, _, text = view.doc(seg_no, doc_no)
+        timestamp_sec = meta.get('timestamp_sec')
+        result = {
+            'source': source,
+            'id': row_id,
+            'score': round(score, 4),
+            'excerpt': _excerpt(text, term_set),
+            'timestamp_ms': int(timestamp_sec * 1000) if timestamp_sec is not None else None,
+        }
+        result.update({k: v for k, v in meta.items() if k != 'timestamp_sec'})
+        results.append(result)
+    return results
@@ -0,0 +1,182 @@
+"""
+Transcript ingestion shared by the single-chunk and batch endpoints.
+
+write_chunks() stores any number of transcript chunks and their concept
+links in two bulk writes, then folds them into each lecture's concept
+coverage and publishes them to the course event stream. Chunk ids are
+assigned when a payload is validated and both writes are upserts, so
+retrying a write that failed part-way stores nothing twice. The batch endpoint
+does not write inline: it hands batches to a bounded in-memory queue drained
+by a background writer, which coalesces whatever is queued into one write.
+When the queue is full callers get QueueFull and should answer 429 with
+Retry-After.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+
+from ..db import supabase
+from ..log import log_event
+from ..query import select_in
+from ..events import publish
+from .concept_detector import detect_for_lecture, course_for_lecture
+from .lecture_coverage import record_chunks
+
+INGEST_QUEUE_SIZE = int(os.getenv("TRANSCRIPT_QUEUE_SIZE", "200"))
+INGEST_RETRY_AFTER = int(os.getenv("TRANSCRIPT_RETRY_AFTER", "1"))
+MAX_CHUNKS_PER_WRITE = 1000
+WRITE_RETRIES = 3
+
+_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+_lock = threading.Lock()
+_writer = None
+
+QueueFull = queue.Full
+
+
+def normalize_chunk(lecture_id, item):
+    """
+    Validate one chunk payload. Returns (row, concept_ids) or raises ValueError.
+    concept_ids is None when the payload has none, so the caller may detect them.
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('text'), str) or not item['text'].strip():
+        raise ValueError('text is required')
+    concept_ids = item.get('concept_ids')
+    if concept_ids is None:
+        return _row(lecture_id, item), None
+    if not isinstance(concept_ids, list):
+        raise ValueError('concept_ids must be a list')
+    # transcript_concepts is keyed on (chunk, concept), so repeats would fail the insert
+    return _row(lecture_id, item), list(dict.fromkeys(concept_ids))
+
+
+def _row(lecture_id, item):
+    return {
+        'id': str(uuid.uuid4()),
+        'lecture_id': lecture_id,
+        'text': item['text'],
+        'timestamp_sec': item.get('timestamp_sec'),
+        'speaker_name': item.get('speaker_name'),
+    }
+
+
+def tag_missing(lecture_id, entries, detect):
+    """Fill in concept_ids for entries that came without any: detected lexically if `detect`, else none."""
+    missing = [i for i, (_, concept_ids) in enumerate(entries) if concept_ids is None]
+    if not missing:
+        return entries
+    detected = detect_for_lecture(lecture_id, [entries[i][0]['text'] for i in missing]) if detect else []
+    entries = list(entries)
+    for n, i in enumerate(missing):
+        entries[i] = (entries[i][0], detected[n] if detect else [])
+    return entries
+
+
+def _upsert_links(links):
+    supabase.table('transcript_concepts').upsert(
+        links, on_conflict='transcript_chunk_id,concept_id', ignore_duplicates=True).execute()
+
+
+def _insert_links(links):
+    try:
+        _upsert_links(links)
+    except Exception as e:
+        # Usually a stale concept id after a re-upload; keep the links that still resolve
+        known = {c['id'] for c in select_in('concept_nodes', 'id', 'id', list({l['concept_id'] for l in links}))}
+        valid = [l for l in links if l['concept_id'] in known]
+        print(f"[transcript_ingest] Link insert failed ({e}); retrying with {len(valid)}/{len(links)} links")
+        if valid:
+            _upsert_links(valid)
+
+
+def write_chunks(entries):
+    """
+    Store [(row, concept_ids), ...] with one chunk upsert and one link upsert.
+    Safe to call again with the same entries. Returns the stored chunk rows in input order.
+    """
+    if not entries:
+        return []
+    stored = supabase.table('transcript_chunks').upsert(
+        [row for row, _ in entries], on_conflict='id').execute().data
+    by_id = {chunk['id']: chunk for chunk in stored}
+    chunks = [by_id[row['id']] for row, _ in entries]
+    links = [{'transcript_chunk_id': chunk['id'], 'concept_id': concept_id}
+             for chunk, (_, concept_ids) in zip(chunks, entries)
+             for concept_id in concept_ids or []]
+    if links:
+        _insert_links(links)
+
+    by_lecture = {}
+    for chunk, (_, concept_ids) in zip(chunks, entries):
+        by_lecture.setdefault(chunk['lecture_id'], []).append((chunk, concept_ids or []))
+    for lecture_id, stored in by_lecture.items():
+        record_chunks(lecture_id, stored)
+        _publish_chunks(lecture_id, stored)
+    return chunks
+
+
+def _publish_chunks(lecture_id, stored):
+    try:
+        publish(course_for_lecture(lecture_id), 'transcript', {'lecture_id': lecture_id, 'chunks': [{
+            'id': chunk['id'],
+            'text': chunk['text'],
+            'timestamp_sec': chunk.get('timestamp_sec'),
+            'speaker_name': chunk.get('speaker_name'),
+            'created_at': chunk.get('created_at'),
+            'concept_ids': concept_ids,
+        } for chunk, concept_ids in stored]})
+    except Exception as e:
+        print(f"[transcript_ingest] Failed to publish chunks for lecture {lecture_id}: {e}")
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="transcript-writer", daemon=True)
+            _writer.start()
+
+
+def _write_with_retries(entries):
+    for attempt in range(1, WRITE_RETRIES + 1):
+        try:
+            write_chunks(entries)
+            return True
+        except Exception as e:
+            print(f"[transcript_ingest] Write of {len(entries)} chunks failed (attempt {attempt}): {e}")
+            time.sleep(0.5 * attempt)
+    return False
+
+
+def _write_loop():
+    while True:
+        batches = [_queue.get()]
+        # Coalesce everything already waiting into the same write
+        while sum(len(b) for b in batches) < MAX_CHUNKS_PER_WRITE:
+            try:
+                batches.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        if _write_with_retries([entry for batch in batches for entry in batch]):
+            continue
+        # One bad batch (e.g. a deleted lecture) should not take the others down with it
+        for batch in batches:
+            if len(batches) == 1 or not _write_with_retries(batch):
+                # The client already got 202 for these; make the loss visible
+                log_event('transcript_ingest', 'batch_dropped', level='error', chunks=len(batch),
+                          lecture_ids=sorted({row['lecture_id'] for row, _ in batch}))
+
+
+def enqueue(entries):
+    """Queue [(row, concept_ids), ...] for the background writer. Raises QueueFull when saturated."""
+    _ensure_writer()
+    _queue.put_nowait(entries)
+
+
+def queue_depth():
+    return _queue.qsize()
@@ -0,0 +1,151 @@
+"""
+Everything a tutoring turn's prompt needs, assembled server-side in one call.
+
+The bundle holds the session's target concepts (label, description), their
+prerequisites, the student's mastery on both, recent lecture transcript
+excerpts mentioning the targets and the student's past quiz misconceptions
+on them. The independent reads run concurrently; concepts and edges come
+from the course snapshot.
+
+Bundles are cached per session under `tutoring_context:{student_id}:{session_id}`
+and dropped by invalidate_mastery() whenever that student's mastery changes.
+Buffered mastery ops are overlaid on every read, like the other mastery caches.
+"""
+
+from ..db import supabase
+from ..cache import cache_get, cache_set
+from ..parallel import fan_out
+from ..query import select_in
+from ..snapshot import load_course_snapshot
+from ..routes.heatmap import confidence_to_color
+from . import mastery_buffer
+from .mastery import courses_for
+
+CONTEXT_TTL = 300
+EXCERPT_LIMIT = 8
+MISCONCEPTION_LIMIT = 10
+
+
+def context_key(student_id, session_id):
+    return f"tutoring_context:{student_id}:{session_id}"
+
+
+def _load_session(session_id):
+    rows = supabase.table('tutoring_sessions').select(
+        'id, student_id, target_concepts').eq('id', session_id).execute().data
+    return rows[0] if rows else None
+
+
+def _mastery(student_id, concept_ids):
+    rows = select_in('student_mastery', 'concept_id, confidence, attempts', 'concept_id', concept_ids,
+                     filters=lambda q: q.eq('student_id', student_id))
+    # Mastery is sparse: concepts without a row are 0.0
+    return {r['concept_id']: r['confidence'] or 0.0 for r in rows}
+
+
+def _excerpts(concept_ids):
+    return select_in(
+        'transcript_concepts', 'concept_id, transcript_chunks!inner(text, timestamp_sec, lecture_id, created_at)',
+        'concept_id', concept_ids,
+        order='transcript_chunks(created_at)', desc=True,
+        sort_key=lambda row: row['transcript_chunks'].get('created_at') or '',
+        limit=EXCERPT_LIMIT,
+        key='transcript_chunk_id,concept_id',
+    )
+
+
+def _misconceptions(student_id, concept_ids):
+    quizzes = select_in('practice_quizzes', 'id, concept_id', 'concept_id', concept_ids,
+                        filters=lambda q: q.eq('student_id', student_id))
+    concept_for_quiz = {q['id']: q['concept_id'] for q in quizzes}
+    # Most recent mistakes first, so the limit keeps what the student is getting wrong now
+    rows = select_in(
+        'quiz_responses', 'quiz_id, misconception, created_at, quiz_questions!inner(question_text, explanation)',
+        'quiz_id', list(concept_for_quiz),
+        filters=lambda q: q.eq('is_correct', False),
+        order='created_at', desc=True,
+        limit=MISCONCEPTION_LIMIT,
+    )
+    return [{
+        'concept_id': concept_for_quiz.get(r['quiz_id']),
+        'question': (r.get('quiz_questions') or {}).get('question_text'),
+        'misconception': r.get('misconception'),
+        'explanation': (r.get('quiz_questions') or {}).get('explanation'),
+    } for r in rows]
+
+
+def build_context(session):
+    student_id = session['student_id']
+    course_id = courses_for([student_id]).get(student_id)
+    targets = list(dict.fromkeys(session.get('target_concepts') or []))
+
+    snapshot = load_course_snapshot(course_id) if course_id else {'concepts': [], 'edges': [], 'lectures': []}
+    concepts = {c['id']: c for c in snapshot['concepts']}
+    prerequisites = {}
+    for edge in snapshot['edges']:
+        if edge['target_id'] in targets and edge['source_id'] in concepts:
+            prerequisites.setdefault(edge['target_id'], []).append(edge['source_id'])
+    prereq_ids = [cid for ids in prerequisites.values() for cid in ids if cid not in targets]
+    all_ids = list(dict.fromkeys(targets + prereq_ids))
+
+    if all_ids:
+        fetched = fan_out(
+            mastery=lambda: _mastery(student_id, all_ids),
+            excerpts=lambda: _excerpts(targets) if targets else [],
+            misconceptions=lambda: _misconceptions(student_id, targets) if targets else [],
+        )
+    else:
+        fetched = {'mastery': {}, 'excerpts': [], 'misconceptions': []}
+    confidence = fetched['mastery']
+
+    # Lecture number = position among the course's lectures by start time
+    ordinals = {l['id']: n for n, l in enumerate(reversed(snapshot['lectures']), start=1)}
+
+    def concept_view(cid):
+        concept = concepts.get(cid) or {}
+        value = confidence.get(cid, 0.0)
+        return {'id': cid, 'label': concept.get('label'), 'description': concept.get('description'),
+                'confidence': value, 'color': confidence_to_color(value)}
+
+    return {
+        'session_id': session['id'],
+        'student_id': student_id,
+        'course_id': course_id,
+        'target_concepts': [dict(concept_view(cid), prerequisites=[concept_view(p) for p in prerequisites.get(cid, [])])
+                            for cid in targets if cid in concepts],
+        'transcript_excerpts': [{
+            'concept_id': r['concept_id'],
+            'text': r['transcript_chunks'].get('text'),
+            'timestamp_sec': r['transcript_chunks'].get('timestamp_sec'),
+            'lecture_id': r['transcript_chunks'].get('lecture_id'),
+            'lecture_title': f"Lecture {ordinals[r['transcript_chunks']['lecture_id']]}"
+            if r['transcript_chunks'].get('lecture_id') in ordinals else None,
+        } for r in fetched['excerpts']],
+        'misconceptions': fetched['misconceptions'],
+    }
+
+
+def _with_pending(bundle):
+    """Layer the student's buffered (not yet flushed) mastery ops over the bundle's concepts."""
+    if not mastery_buffer.ENABLED:
+        return bundle
+    views = [view for target in bundle['target_concepts'] for view in [target] + target['prerequisites']]
+    updated = {row['concept_id']: row['confidence'] for row in mastery_buffer.apply_pending(
+        bundle['student_id'], [{'concept_id': v['id'], 'confidence': v['confidence']} for v in views])}
+    for view in views:
+        view['confidence'] = updated[view['id']]
+        view['color'] = confidence_to_color(view['confidence'])
+    return bundle
+
+
+def load_context(session_id, refresh=False):
+    """The session's context bundle, or None if the session does not exist."""
+    session = _load_session(session_id)
+    if session is None:
+        return None
+    key = context_key(session['student_id'], session_id)
+    bundle = None if refresh else cache_get(key)
+    if bundle is None:
+        bundle = build_context(session)
+        cache_set(key, bundle, ttl_seconds=CONTEXT_TTL)
+    return _with_pending(bundle)
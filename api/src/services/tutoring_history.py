@@ -0,0 +1,177 @@
+"""
+Bounded tutoring history: a rolling summary plus a recent window.
+
+Each session stores a summary of its older messages and the (created_at, id)
+cursor of the last message folded into it. Once SUMMARY_EVERY messages past
+the window have piled up after the cursor, a background pass asks the model
+to fold the oldest of them into the summary and advances the cursor. The
+summary write is conditional on the cursor it started from, so two workers
+refreshing the same session cannot both apply.
+
+load_history() returns the system prompt, the summary and only the messages
+after the cursor, so what a client fetches and sends to the model stays
+bounded however long the session runs.
+"""
+
+import os
+import threading
+
+from ..db import supabase
+from ..llm import MODELS, complete
+from ..query import PAGE_SIZE, make_cursor, after_cursor
+
+SUMMARY_EVERY = int(os.getenv("TUTORING_SUMMARY_EVERY", "20"))
+RECENT_WINDOW = int(os.getenv("TUTORING_RECENT_WINDOW", "10"))
+SUMMARY_MAX_TOKENS = 600
+SUMMARY_TIMEOUT = 30
+
+# Messages stored in one batch share created_at; keep them in conversational order
+_ROLE_ORDER = {'system': 0, 'user': 1, 'assistant': 2}
+
+_lock = threading.Lock()
+_refreshing = set()
+
+
+def _sort_key(message):
+    return message['created_at'], _ROLE_ORDER.get(message['role'], 3)
+
+
+def _load_session(session_id):
+    rows = supabase.table('tutoring_sessions').select(
+        'id, student_id, summary, summary_cursor, summary_message_count').eq('id', session_id).execute().data
+    return rows[0] if rows else None
+
+
+def _parse_stored_cursor(stored):
+    if not stored:
+        return None
+    created_at, row_id = stored.split(',', 1)
+    return created_at, row_id
+
+
+def _messages_after(session_id, stored_cursor):
+    """Conversation messages (no system prompt) after the summary cursor, in order."""
+    rows = []
+    cursor = _parse_stored_cursor(stored_cursor)
+    while True:
+        query = supabase.table('tutoring_messages').select(
+            'id, role, content, concept_id, created_at').eq('session_id', session_id).neq('role', 'system')
+        if cursor:
+            query = after_cursor(query, cursor)
+        page = query.order('created_at').order('id').limit(PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        cursor = (page[-1]['created_at'], page[-1]['id'])
+    rows.sort(key=_sort_key)
+    return rows
+
+
+def _system_prompt(session_id):
+    rows = supabase.table('tutoring_messages').select('content').eq('session_id', session_id).eq(
+        'role', 'system').order('created_at', desc=True).limit(1).execute().data
+    return rows[0]['content'] if rows else None
+
+
+def load_history(session_id):
+    """
+    {'system', 'summary', 'summarized_count', 'messages', 'next_cursor'} for a
+    session, or None if it does not exist. `messages` are the unsummarized ones.
+    """
+    session = _load_session(session_id)
+    if session is None:
+        return None
+    messages = _messages_after(session_id, session.get('summary_cursor'))
+    newest = max(messages, key=lambda m: (m['created_at'], m['id']), default=None)
+    return {
+        'session_id': session_id,
+        'system': _system_prompt(session_id),
+        'summary': session.get('summary'),
+        'summarized_count': session.get('summary_message_count') or 0,
+        'messages': messages,
+        'next_cursor': make_cursor(newest) if newest else None,
+    }
+
+
+def _fold_point(messages):
+    """
+    Index splitting messages into (to summarize, to keep). Keeps at least
+    RECENT_WINDOW messages and starts the kept window on a user turn, since
+    a model conversation has to open with one.
+    """
+    split = len(messages) - RECENT_WINDOW
+    while split < len(messages) and messages[split]['role'] != 'user':
+        split += 1
+    return split if split < len(messages) else 0
+
+
+def summarize(previous_summary, messages):
+    """Fold messages into the previous summary with the model. Returns the new summary text."""
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    prompt = f"""You maintain a running summary of a tutoring conversation between a student and an AI tutor.
+
+EXISTING SUMMARY:
+{previous_summary or '(none yet)'}
+
+NEW MESSAGES:
+{transcript}
+
+Write an updated summary (at most 250 words) that the tutor can rely on instead of the full history.
+Keep: concepts covered, what the student now understands, misconceptions still open, questions left
+unanswered, and any commitments the tutor made. Drop pleasantries. Return only the summary text."""
+
+    completion = complete('tutoring_summary', [{"role": "user", "content": prompt}], MODELS['summary'],
+                          SUMMARY_MAX_TOKENS, timeout=SUMMARY_TIMEOUT)
+    return completion.text.strip()
+
+
+def refresh_summary(session_id):
+    """
+    Fold old messages into the session summary if enough have piled up.
+    Returns True if the summary advanced.
+    """
+    session = _load_session(session_id)
+    if session is None:
+        return False
+    messages = _messages_after(session_id, session.get('summary_cursor'))
+    if len(messages) < RECENT_WINDOW + SUMMARY_EVERY:
+        return False
+    split = _fold_point(messages)
+    if split <= 0:
+        return False
+
+    folded = messages[:split]
+    summary = summarize(session.get('summary'), folded)
+    last = max(folded, key=lambda m: (m['created_at'], m['id']))
+
+    # Only apply if nobody advanced the cursor while the model was running
+    query = supabase.table('tutoring_sessions').update({
+        'summary': summary,
+        'summary_cursor': make_cursor(last),
+        'summary_message_count': (session.get('summary_message_count') or 0) + len(folded),
+    }).eq('id', session_id)
+    previous = session.get('summary_cursor')
+    query = query.eq('summary_cursor', previous) if previous else query.is_('summary_cursor', 'null')
+    return bool(query.execute().data)
+
+
+def _refresh_in_background(session_id):
+    try:
+        refresh_summary(session_id)
+    except Exception as e:
+        print(f"[tutoring_history] Summary refresh failed for session {session_id}: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(session_id)
+
+
+def schedule_refresh(session_id):
+    """Start a background summary refresh for a session unless one is already running here."""
+    if not os.getenv("ANTHROPIC_API_KEY"):
+        return
+    with _lock:
+        if session_id in _refreshing:
+            return
+        _refreshing.add(session_id)
+    threading.Thread(target=_refresh_in_background, args=(session_id,),
+                     name="tutoring-summary", daemon=True).start()
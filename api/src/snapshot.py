@@ -0,0 +1,82 @@
+"""
+Course snapshot: the slow-changing structure of a course (concepts, edges,
+roster, lectures) loaded once and shared by every section that needs it.
+
+Cached in Redis for a short TTL and invalidated on structural writes
+(PDF upload, student creation/enrollment, lecture creation). Each
+invalidation bumps a small version counter, so in-process structures built
+from a snapshot can check it without reloading the snapshot itself.
+"""
+
+from .db import supabase
+from .cache import cache_get, cache_set, cache_delete, get_client
+from .parallel import fan_out
+from .query import select_all
+
+SNAPSHOT_TTL = 30
+
+
+def _snapshot_key(course_id):
+    return f"snapshot:{course_id}"
+
+
+def _version_key(course_id):
+    return f"snapshot_version:{course_id}"
+
+
+def _fetch_concepts(course_id):
+    return supabase.table('concept_nodes').select('*').eq('course_id', course_id).execute().data
+
+
+def _fetch_edges(course_id):
+    return supabase.table('concept_edges').select('*').eq('course_id', course_id).execute().data
+
+
+def _fetch_students(course_id):
+    # Whole roster: total_students and the heatmap's gray counts must match /heatmap
+    return select_all(lambda: supabase.table('students').select('id, name').eq('course_id', course_id))
+
+
+def _fetch_lectures(course_id):
+    return supabase.table('lecture_sessions').select('*').eq('course_id', course_id).order(
+        'started_at', desc=True).execute().data
+
+
+def load_course_snapshot(course_id):
+    """Return {concepts, edges, students, lectures} for a course, reading all four tables concurrently."""
+    key = _snapshot_key(course_id)
+    hit = cache_get(key)
+    if hit is not None:
+        return hit
+
+    snapshot = fan_out(
+        concepts=lambda: _fetch_concepts(course_id),
+        edges=lambda: _fetch_edges(course_id),
+        students=lambda: _fetch_students(course_id),
+        lectures=lambda: _fetch_lectures(course_id),
+    )
+
+    cache_set(key, snapshot, ttl_seconds=SNAPSHOT_TTL)
+    return snapshot
+
+
+def snapshot_version(course_id):
+    """The course's snapshot version (a string), or None without Redis."""
+    client = get_client()
+    if not client:
+        return None
+    try:
+        return client.get(_version_key(course_id)) or '0'
+    except Exception:
+        return None
+
+
+def invalidate_course_snapshot(course_id):
+    """Drop the cached snapshot after a structural change to the course."""
+    cache_delete(_snapshot_key(course_id))
+    client = get_client()
+    if client:
+        try:
+            client.incr(_version_key(course_id))
+        except Exception:
+            pass
@@ -0,0 +1,105 @@
+"""
+Worker pool for the generation job queue (src/jobs.py).
+
+Run it as its own process with `python -m src.worker`, or let each web
+process run one in background threads (JOB_WORKER_EMBEDDED, on by default so
+a single-container deploy keeps generating content). Any number of workers
+can run at once: claims use SKIP LOCKED, so each job goes to one of them.
+A worker stops if the queue is not installed
+(scripts/migration_generation_jobs.sql has not been run) rather than retrying
+the claim forever.
+
+Each worker claims at most as many jobs as it has idle slots, runs them on a
+thread pool and reports success or failure back to the queue.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import jobs
+from .services.content_tasks import run_task, ConceptGone, UnknownJobType
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_WORKER_EMBEDDED = os.getenv("JOB_WORKER_EMBEDDED", "true").lower() == "true"
+CLAIM_ERROR_BACKOFF = 30
+
+_lock = threading.Lock()
+_started = False
+
+
+def run_job(job):
+    """Run one claimed job and record the outcome. Never raises."""
+    label = f"{job['content_type']} for concept {job['concept_id']} (attempt {job['attempts']}/{job['max_attempts']})"
+    try:
+        run_task(job['content_type'], job['concept_id'])
+    except Exception as e:
+        status = jobs.fail(job, e, retry=not isinstance(e, (ConceptGone, UnknownJobType)))
+        print(f"[worker] ✗ {label}: {e} -> {status}")
+        return
+    if jobs.complete(job):
+        print(f"[worker] ✓ {label}")
+    else:
+        print(f"[worker] Lease lost before {label} finished; result kept, job left to its new owner")
+
+
+def _loop(worker_id, concurrency):
+    slots = threading.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job")
+
+    def run_and_release(job):
+        try:
+            run_job(job)
+        finally:
+            slots.release()
+
+    while True:
+        # Wait for one free slot, then take every other free slot without blocking
+        slots.acquire()
+        free = 1
+        while free < concurrency and slots.acquire(blocking=False):
+            free += 1
+        try:
+            claimed = jobs.claim(worker_id, free)
+        except Exception as e:
+            if jobs.queue_missing(e):
+                print(f"[worker] Job queue not installed ({e}); run scripts/migration_generation_jobs.sql. "
+                      "Worker stopped")
+                executor.shutdown(wait=False)
+                return
+            print(f"[worker] Claim failed ({e}); retrying in {CLAIM_ERROR_BACKOFF}s")
+            for _ in range(free):
+                slots.release()
+            time.sleep(CLAIM_ERROR_BACKOFF)
+            continue
+
+        for _ in range(free - len(claimed)):
+            slots.release()
+        for job in claimed:
+            executor.submit(run_and_release, job)
+        if not claimed:
+            jobs.wait_for_work(JOB_POLL_SECONDS)
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def start(concurrency=JOB_WORKER_CONCURRENCY):
+    """Start this process's worker pool in a background thread (once)."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_loop, args=(_worker_id(), concurrency), name="job-worker", daemon=True).start()
+
+
+if __name__ == '__main__':
+    worker_id = _worker_id()
+    print(f"[worker] {worker_id} running {JOB_WORKER_CONCURRENCY} slots")
+    _loop(worker_id, JOB_WORKER_CONCURRENCY)
@@ -5,7 +5,8 @@
  */
 
 import { Router, json } from "express";
-import { emitToLectureRoom } from "./socket-helpers";
+import { emitToLectureRoom, emitToStudent } from "./socket-helpers";
+import { confidenceToColor } from "../src/lib/colors";
 import Anthropic from "@anthropic-ai/sdk";
 
 const router = Router();
@@ -109,15 +110,35 @@ router.post("/api/lectures/:id/poll/:pollId/close", json(), async (req, res) =>
 
     console.log(`[poll-close] Closing poll ${pollId} for lecture ${lectureId}`);
 
-    // Update poll status to closed
-    let poll: { id: string; status: string; question: string; concept_id: string };
+    // Close the poll and apply every evaluated response to mastery in one batch
+    let poll: {
+      id: string;
+      status: string;
+      question: string;
+      concept_id: string;
+      mastery?: {
+        applied: boolean;
+        changes: { student_id: string; old_confidence: number; confidence: number }[];
+      };
+    };
     try {
-      poll = await flaskPut(`/api/polls/${pollId}/status`, { status: "closed" });
+      poll = await flaskPut(`/api/polls/${pollId}/status`, { status: "closed", apply_mastery: true });
     } catch (err) {
       console.error("[poll-close] Failed to update poll status:", err);
       return res.status(404).json({ error: "Poll not found" });
     }
 
+    // Emit mastery:updated to each student whose mastery changed
+    for (const change of poll.mastery?.changes || []) {
+      emitToStudent(change.student_id, "mastery:updated", {
+        studentId: change.student_id,
+        conceptId: poll.concept_id,
+        oldColor: confidenceToColor(change.old_confidence),
+        newColor: confidenceToColor(change.confidence),
+        confidence: change.confidence,
+      });
+    }
+
     // Fetch all responses for this poll
     let responses: { answer: string; evaluation: { eval_result?: string } | null }[] = [];
     try {
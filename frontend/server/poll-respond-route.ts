@@ -5,7 +5,6 @@
  */
 
 import { Router, json } from "express";
-import { emitToStudent, emitToProfessor } from "./socket-helpers";
 import Anthropic from "@anthropic-ai/sdk";
 
 const router = Router();
@@ -47,19 +46,6 @@ async function flaskPost<T>(path: string, body: unknown): Promise<T> {
   return res.json() as Promise<T>;
 }
 
-async function flaskPut<T>(path: string, body: unknown): Promise<T> {
-  const res = await fetch(`${getFlaskUrl()}${path}`, {
-    method: "PUT",
-    headers: { "Content-Type": "application/json", "ngrok-skip-browser-warning": "1" },
-    body: JSON.stringify(body),
-  });
-  if (!res.ok) {
-    const text = await res.text();
-    throw new Error(`Flask PUT ${path} failed: ${res.status} - ${text.slice(0, 200)}`);
-  }
-  return res.json() as Promise<T>;
-}
-
 // Evaluate response with Claude
 async function evaluateResponse(
   question: string,
@@ -165,39 +151,7 @@ router.post("/api/polls/:pollId/respond", json(), async (req, res) => {
     });
     console.log(`[poll-respond] Response stored successfully: ${JSON.stringify(storedResponse).slice(0, 100)}`);
 
-    // Update mastery via Flask
-    let masteryUpdate = {
-      concept_id: poll.concept_id,
-      old_color: "gray",
-      new_color: "gray",
-      confidence: 0,
-    };
-
-    try {
-      masteryUpdate = await flaskPut(
-        `/api/students/${studentId}/mastery/${poll.concept_id}`,
-        { eval_result: evaluation.eval_result }
-      );
-      console.log(`[poll-respond] Mastery updated: ${masteryUpdate.old_color} -> ${masteryUpdate.new_color}`);
-    } catch (err) {
-      console.error("[poll-respond] Failed to update mastery:", err);
-    }
-
-    // Emit mastery:updated to the specific student
-    emitToStudent(studentId, "mastery:updated", {
-      studentId,
-      conceptId: poll.concept_id,
-      oldColor: masteryUpdate.old_color,
-      newColor: masteryUpdate.new_color,
-      confidence: masteryUpdate.confidence,
-    });
-
-    // Emit heatmap:updated to the professor
-    emitToProfessor(poll.lecture_id, "heatmap:updated", {
-      conceptId: poll.concept_id,
-    });
-
-    console.log(`[poll-respond] Success - emitted updates to student and professor`);
+    // Mastery is applied for the whole poll in one batch when it closes (poll-close-route.ts)
 
     res.json({
       evaluation: {
@@ -205,7 +159,6 @@ router.post("/api/polls/:pollId/respond", json(), async (req, res) => {
         feedback: evaluation.feedback,
         reasoning: evaluation.reasoning,
       },
-      updated: masteryUpdate,
     });
 
   } catch (err) {
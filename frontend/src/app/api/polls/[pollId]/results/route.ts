@@ -7,19 +7,18 @@ export async function GET(
 ) {
   const { pollId } = await params;
 
-  const responses = await flaskGet<
-    { answer: string; evaluation: { eval_result?: string } | null }[]
-  >(`/api/polls/${pollId}/responses`);
+  // Flask keeps live counters per poll, so this is O(1) however many students answered
+  const tally = await flaskGet<{
+    total_responses: number;
+    distribution: { correct: number; partial: number; wrong: number; unevaluated: number };
+  }>(`/api/polls/${pollId}/tally`);
 
-  const totalResponses = responses?.length || 0;
-  const distribution = { green: 0, yellow: 0, red: 0 };
-
-  for (const r of responses || []) {
-    const evalResult = r.evaluation?.eval_result;
-    if (evalResult === "correct") distribution.green++;
-    else if (evalResult === "partial") distribution.yellow++;
-    else if (evalResult === "wrong") distribution.red++;
-  }
+  const totalResponses = tally?.total_responses || 0;
+  const distribution = {
+    green: tally?.distribution.correct || 0,
+    yellow: tally?.distribution.partial || 0,
+    red: tally?.distribution.wrong || 0,
+  };
 
   return NextResponse.json({ totalResponses, distribution });
 }
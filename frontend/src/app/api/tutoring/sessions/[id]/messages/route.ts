@@ -43,10 +43,19 @@ export async function POST(
     );
   }
 
-  // Fetch the session to get student_id and target_concepts
-  let session: { id: string; student_id: string; target_concepts: string[] };
+  // Fetch the session's prompt context (targets, prerequisite mastery, excerpts) in one request
+  let context: {
+    student_id: string;
+    target_concepts: {
+      id: string;
+      label: string;
+      description: string | null;
+      confidence: number;
+    }[];
+    transcript_excerpts: { text: string; timestamp_sec: number | null }[];
+  };
   try {
-    session = await flaskGet(`/api/tutoring/sessions/${sessionId}`);
+    context = await flaskGet(`/api/tutoring/sessions/${sessionId}/context`);
   } catch {
     return NextResponse.json(
       { error: "Session not found" },
@@ -60,53 +69,41 @@ export async function POST(
     content,
   });
 
-  // 2. Load full conversation history
-  const allMessages = await flaskGet<
-    { id: string; role: string; content: string; created_at: string }[]
-  >(`/api/tutoring/sessions/${sessionId}/messages`);
-
-  // Separate system prompt from conversation
-  const systemMessage = (allMessages || []).find((m) => m.role === "system");
-  const conversationHistory = (allMessages || [])
-    .filter((m) => m.role !== "system")
-    .map((m) => ({
-      role: m.role as "user" | "assistant",
-      content: m.content,
-    }));
+  // 2. Load bounded history: system prompt, rolling summary of older turns, recent messages
+  const history = await flaskGet<{
+    system: string | null;
+    summary: string | null;
+    messages: { id: string; role: string; content: string; created_at: string }[];
+  }>(`/api/tutoring/sessions/${sessionId}/history`);
+
+  const conversationHistory = (history?.messages || []).map((m) => ({
+    role: m.role as "user" | "assistant",
+    content: m.content,
+  }));
 
   // 3. Rebuild system prompt if no stored one (fallback)
-  let systemPrompt = systemMessage?.content || "";
+  let systemPrompt = history?.system || "";
   if (!systemPrompt) {
-    // Fetch weak concepts and rebuild
-    let masteryData: { concept_id: string; confidence: number }[] = [];
-    try {
-      masteryData = await flaskGet(`/api/students/${session.student_id}/mastery`);
-    } catch {
-      // mastery fetch failed — use empty array
-    }
-    const targetIds = session.target_concepts || [];
-    const concepts = await flaskGet<
-      { id: string; label: string; description: string }[]
-    >(`/api/concepts?ids=${targetIds.join(",")}`);
-
-    const weakConcepts = (concepts || []).map((c) => {
-      const m = masteryData.find(
-        (md: { concept_id: string }) => md.concept_id === c.id
-      );
-      return {
-        label: c.label,
-        description: c.description || "",
-        confidence: m?.confidence || 0,
-      };
-    });
+    const weakConcepts = context.target_concepts.map((c) => ({
+      label: c.label,
+      description: c.description || "",
+      confidence: c.confidence,
+    }));
     systemPrompt = buildTutoringSystemPrompt(
       "CS229 Machine Learning",
       weakConcepts,
-      []
+      context.transcript_excerpts.map((t) => ({
+        text: t.text,
+        timestampSec: t.timestamp_sec || 0,
+      }))
     );
   }
 
-  // 4. Call Claude Sonnet with full history
+  if (history?.summary) {
+    systemPrompt += `\n\nSUMMARY OF THE CONVERSATION SO FAR (older messages are not repeated below):\n${history.summary}`;
+  }
+
+  // 4. Call Claude Sonnet with the recent history
   const aiMessage = await anthropic.messages.create({
     model: "claude-sonnet-4-5-20250929",
     max_tokens: 512,
@@ -127,10 +124,7 @@ export async function POST(
   const storedMessage = Array.isArray(storedMessages) ? storedMessages[0] : storedMessages;
 
   // 6. Understanding check (Haiku sidecar)
-  const targetConceptIds = session.target_concepts || [];
-  const targetConcepts = await flaskGet<
-    { id: string; label: string; description: string }[]
-  >(`/api/concepts?ids=${targetConceptIds.join(",")}`);
+  const targetConcepts = context.target_concepts;
 
   const masteryUpdates: {
     conceptId: string;
@@ -163,7 +157,7 @@ export async function POST(
             new_color: string;
             confidence: number;
           }>(
-            `/api/students/${session.student_id}/mastery/${matchedConcept.id}`,
+            `/api/students/${context.student_id}/mastery/${matchedConcept.id}`,
             { delta: 0.2 }
           );
 
@@ -184,8 +178,8 @@ export async function POST(
           }
 
           // Emit mastery:updated via Socket.IO
-          emitToStudent(session.student_id, "mastery:updated", {
-            studentId: session.student_id,
+          emitToStudent(context.student_id, "mastery:updated", {
+            studentId: context.student_id,
             conceptId: matchedConcept.id,
             oldColor: update.old_color,
             newColor: update.new_color,
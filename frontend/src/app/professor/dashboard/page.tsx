@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { useRouter } from "next/navigation";
 import { Button } from "@/components/ui/button";
 import TranscriptFeed, { type TranscriptChunk } from "@/components/dashboard/TranscriptFeed";
@@ -11,7 +11,7 @@ import PollControls from "@/components/dashboard/PollControls";
 import InterventionPanel from "@/components/dashboard/InterventionPanel";
 import ZoomSettingsDialog from "@/components/dashboard/ZoomSettingsDialog";
 import { useSocket, useSocketEvent, useSocketReady } from "@/lib/socket";
-import { flaskApi, nextApi } from "@/lib/api";
+import { flaskApi, flaskEvents, nextApi } from "@/lib/api";
 import { useAuth } from "@/lib/auth-context";
 
 
@@ -59,56 +59,150 @@ export default function ProfessorDashboard() {
       .catch(() => {});
   }, [authCourses]);
 
-  // Fetch heatmap data
+  // Heatmap and student summaries come from one dashboard bundle request
+  const loadDashboard = useCallback(
+    (sections: string) => {
+      if (!courseId) return;
+      flaskApi
+        .get(`/api/courses/${courseId}/dashboard?sections=${sections}`)
+        .then((data: {
+          sections: {
+            heatmap?: { concepts: HeatmapConcept[]; total_students: number };
+            students?: StudentSummary[];
+          };
+        }) => {
+          const { heatmap, students: summaries } = data.sections;
+          if (heatmap) {
+            setHeatmapData(heatmap.concepts);
+            setTotalStudents(heatmap.total_students);
+          }
+          if (summaries) setStudents(summaries);
+        })
+        .catch(() => {});
+    },
+    [courseId],
+  );
+
   useEffect(() => {
+    loadDashboard("heatmap,students");
+  }, [loadDashboard]);
+
+  // Join the newest live lecture; run on load and whenever the event stream may have missed a change
+  const loadLiveLecture = useCallback(() => {
     if (!courseId) return;
     flaskApi
-      .get(`/api/courses/${courseId}/heatmap`)
-      .then((data: { concepts: HeatmapConcept[]; total_students: number }) => {
-        if (data.concepts) setHeatmapData(data.concepts);
-        if (data.total_students) setTotalStudents(data.total_students);
+      .get(`/api/courses/${courseId}/lectures`)
+      .then((lectures: { id: string; status: string; started_at?: string }[]) => {
+        const liveLectures = lectures.filter((l) => l.status === "live");
+        liveLectures.sort((a, b) => (b.started_at || "").localeCompare(a.started_at || ""));
+        const live = liveLectures[0];
+        if (live) {
+          setLectureId((prev) => {
+            if (prev !== live.id) {
+              localStorage.setItem("lectureId", live.id);
+            }
+            return live.id;
+          });
+        }
       })
       .catch(() => {});
   }, [courseId]);
 
-  // Fetch students with mastery distributions (single batch endpoint)
   useEffect(() => {
-    if (!courseId) return;
-    flaskApi
-      .get(`/api/courses/${courseId}/students/summary`)
-      .then((summaries: StudentSummary[]) => {
-        setStudents(summaries);
-      })
-      .catch(() => {});
-  }, [courseId]);
+    loadLiveLecture();
+  }, [loadLiveLecture]);
+
+  // Student summaries are reloaded at most once per second while mastery events arrive
+  const studentsReload = useRef<ReturnType<typeof setTimeout> | null>(null);
+  const totalStudentsRef = useRef(0);
+  totalStudentsRef.current = totalStudents;
 
-  // Poll for the latest live lecture every 5s so we auto-join when RTMS creates one
+  // Course event stream (SSE): live lectures, heatmap deltas and mastery changes are
+  // pushed as they are written, so nothing here polls
   useEffect(() => {
     if (!courseId) return;
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | null = null;
+    let connected = false;
 
-    const checkLiveLecture = () => {
-      flaskApi
-        .get(`/api/courses/${courseId}/lectures`)
-        .then((lectures: { id: string; status: string; started_at?: string }[]) => {
-          const liveLectures = lectures.filter((l) => l.status === "live");
-          liveLectures.sort((a, b) => (b.started_at || "").localeCompare(a.started_at || ""));
-          const live = liveLectures[0];
-          if (live) {
-            setLectureId((prev) => {
-              if (prev !== live.id) {
-                localStorage.setItem("lectureId", live.id);
-              }
-              return live.id;
-            });
+    const resync = () => {
+      loadDashboard("heatmap,students");
+      loadLiveLecture();
+    };
+
+    const connect = () => {
+      source = flaskEvents(`/api/courses/${courseId}/events`);
+
+      source.addEventListener("ready", () => {
+        // The first connection follows the initial load; a reconnect may have missed events
+        if (connected) resync();
+        connected = true;
+      });
+
+      source.addEventListener("resync", resync);
+
+      source.addEventListener("lecture", (e) => {
+        const { data } = JSON.parse((e as MessageEvent).data) as {
+          data: { lecture_id: string; status: string };
+        };
+        if (data.status !== "live") return;
+        setLectureId((prev) => {
+          if (prev !== data.lecture_id) {
+            localStorage.setItem("lectureId", data.lecture_id);
           }
-        })
-        .catch(() => {});
+          return data.lecture_id;
+        });
+      });
+
+      source.addEventListener("heatmap", (e) => {
+        const { data } = JSON.parse((e as MessageEvent).data) as {
+          data: { cells: { concept_id: string; counts: Record<string, number>; sum_delta: number }[] };
+        };
+        const cells = new Map(data.cells.map((c) => [c.concept_id, c]));
+        const total = totalStudentsRef.current;
+        setHeatmapData((prev) =>
+          prev.map((concept) => {
+            const cell = cells.get(concept.id);
+            if (!cell) return concept;
+            const distribution = { ...concept.distribution };
+            for (const [color, delta] of Object.entries(cell.counts)) {
+              const key = color as keyof typeof distribution;
+              distribution[key] = Math.max(0, (distribution[key] || 0) + delta);
+            }
+            const avg = total ? concept.avg_confidence + cell.sum_delta / total : concept.avg_confidence;
+            return { ...concept, distribution, avg_confidence: avg };
+          }),
+        );
+      });
+
+      source.addEventListener("mastery", () => {
+        if (studentsReload.current) return;
+        studentsReload.current = setTimeout(() => {
+          studentsReload.current = null;
+          loadDashboard("students");
+        }, 1000);
+      });
+
+      source.onerror = () => {
+        // EventSource retries dropped connections itself, but gives up after an error
+        // response (e.g. 503 when the API is at its stream limit): reconnect later
+        if (source?.readyState === EventSource.CLOSED) {
+          source = null;
+          retry = setTimeout(connect, 5000);
+        }
+      };
     };
 
-    checkLiveLecture();
-    const interval = setInterval(checkLiveLecture, 5000);
-    return () => clearInterval(interval);
-  }, [courseId]);
+    connect();
+    return () => {
+      if (retry) clearTimeout(retry);
+      if (studentsReload.current) {
+        clearTimeout(studentsReload.current);
+        studentsReload.current = null;
+      }
+      source?.close();
+    };
+  }, [courseId, loadDashboard, loadLiveLecture]);
 
   // Join lecture room as professor
   useEffect(() => {
@@ -174,69 +268,6 @@ export default function ProfessorDashboard() {
     }, []),
   );
 
-  // Socket: poll:closed
-  useSocketEvent<{ pollId: string; results: unknown }>(
-    "poll:closed",
-    useCallback(() => {
-      // PollControls handles its own state; refresh heatmap
-      if (courseId) {
-        flaskApi
-          .get(`/api/courses/${courseId}/heatmap`)
-          .then((data: { concepts: HeatmapConcept[]; total_students: number }) => {
-            if (data.concepts) setHeatmapData(data.concepts);
-          })
-          .catch(() => {});
-      }
-    }, [courseId]),
-  );
-
-  // Socket: heatmap:updated — re-fetch from Flask
-  useSocketEvent<{ conceptId: string }>(
-    "heatmap:updated",
-    useCallback(() => {
-      if (!courseId) return;
-      flaskApi
-        .get(`/api/courses/${courseId}/heatmap`)
-        .then((data: { concepts: HeatmapConcept[]; total_students: number }) => {
-          if (data.concepts) setHeatmapData(data.concepts);
-        })
-        .catch(() => {});
-    }, [courseId]),
-  );
-
-  // Socket: mastery:updated — refresh student mastery distributions
-  useSocketEvent<{ studentId: string; conceptId: string; newColor: string }>(
-    "mastery:updated",
-    useCallback((data) => {
-      setStudents((prev) =>
-        prev.map((s) => {
-          if (s.id !== data.studentId) return s;
-          // Re-fetch this student's mastery to update distribution
-          flaskApi
-            .get(`/api/students/${s.id}/mastery`)
-            .then((mastery: { confidence: number }[]) => {
-              const dist = { green: 0, lime: 0, yellow: 0, orange: 0, gray: 0 };
-              for (const m of mastery) {
-                const c = m.confidence;
-                if (c === 0) dist.gray++;
-                else if (c < 0.4) dist.orange++;
-                else if (c < 0.55) dist.yellow++;
-                else if (c < 0.7) dist.lime++;
-                else dist.green++;
-              }
-              setStudents((current) =>
-                current.map((cs) =>
-                  cs.id === s.id ? { ...cs, masteryDistribution: dist } : cs
-                )
-              );
-            })
-            .catch(() => {});
-          return s;
-        })
-      );
-    }, []),
-  );
-
   const strugglingConceptIds = heatmapData
     .filter((c) => c.distribution.red > 0 || c.avg_confidence < 0.5)
     .map((c) => c.id);
@@ -41,3 +41,8 @@ export const nextApi = {
   post: (path: string, body: unknown) =>
     request("", path, { method: "POST", body: JSON.stringify(body) }),
 };
+
+// Server-Sent Events from Flask (EventSource cannot send headers; the stream is public)
+export function flaskEvents(path: string): EventSource {
+  return new EventSource(`${FLASK_API_URL}${path}`);
+}
@@ -82,12 +82,17 @@ def check_student_mastery(student_id: str) -> tuple[int, int]:
         return (0, 0)
 
 
-def set_student_mastery(student_id: str, concept_id: str, confidence: float):
-    """Set mastery confidence for a student/concept pair."""
-    resp = requests.put(
-        f"{API_URL}/api/students/{student_id}/mastery/{concept_id}",
-        json={"confidence": confidence},
-        timeout=10
+# Small enough that one request stays well inside the timeout even where the
+# server has to fall back to per-op updates
+BATCH_SIZE = 500
+
+
+def set_mastery_batch(updates: List[Dict]) -> Dict:
+    """Set many (student, concept) confidences in one request; returns the API response."""
+    resp = requests.post(
+        f"{API_URL}/api/mastery/batch",
+        json={"updates": updates},
+        timeout=60
     )
     resp.raise_for_status()
     return resp.json()
@@ -127,24 +132,33 @@ def main():
     print(f"🔧 Fixing {len(students_to_fix)} students...")
     print()
 
-    # Assign profiles evenly
+    # Assign profiles evenly and collect every update up front
+    updates = []
     for i, student in enumerate(students_to_fix):
         profile = PROFILES[i % len(PROFILES)]
-        student_name = student["name"]
-        student_id = student["id"]
-
-        print(f"[{i+1}/{len(students_to_fix)}] {student_name} ({profile['name']} profile)")
+        print(f"[{i+1}/{len(students_to_fix)}] {student['name']} ({profile['name']} profile)")
 
-        success_count = 0
         for concept in concepts:
-            confidence = assign_confidence_by_profile(profile)
-            try:
-                set_student_mastery(student_id, concept["id"], confidence)
-                success_count += 1
-            except Exception as e:
-                print(f"  ❌ Failed for {concept['label']}: {str(e)}")
-
-        print(f"  ✅ Set {success_count}/{len(concepts)} concepts")
+            updates.append({
+                "student_id": student["id"],
+                "concept_id": concept["id"],
+                "confidence": assign_confidence_by_profile(profile)
+            })
+
+    # Send in a few large batches instead of one PUT per concept
+    print()
+    updated = 0
+    for start in range(0, len(updates), BATCH_SIZE):
+        batch = updates[start:start + BATCH_SIZE]
+        try:
+            result = set_mastery_batch(batch)
+            updated += result["updated"]
+            for missing in result["not_found"]:
+                print(f"  ❌ No mastery row for student {missing['student_id']}, concept {missing['concept_id']}")
+        except Exception as e:
+            print(f"  ❌ Batch {start // BATCH_SIZE + 1} failed: {str(e)}")
+
+    print(f"  ✅ Set {updated}/{len(updates)} mastery values")
 
     print()
     print("=" * 60)
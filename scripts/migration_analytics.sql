@@ -0,0 +1,8 @@
+-- Migration: Student cohorts for the class-wide analytics cube
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+
+-- Optional grouping label (section, lab group, term...); NULL rolls up under 'all'
+ALTER TABLE students ADD COLUMN IF NOT EXISTS cohort VARCHAR(100);
+
+-- Cube builds scan the roster and a course's mastery rows by student
+CREATE INDEX IF NOT EXISTS idx_students_course_cohort ON students(course_id, cohort);
@@ -0,0 +1,6 @@
+-- Migration: Concept synonyms for lexical transcript tagging
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+
+-- Extra surface forms matched by the concept detector alongside the label
+-- (e.g. 'backprop' for Backpropagation); empty by default
+ALTER TABLE concept_nodes ADD COLUMN IF NOT EXISTS synonyms TEXT[] DEFAULT '{}';
@@ -0,0 +1,92 @@
+-- Migration: Durable job queue for background content generation
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- One row per (course, concept, content type) generation task. Workers claim
+-- due jobs with claim_generation_jobs(), which locks rows with SKIP LOCKED so
+-- concurrent workers never take the same job, and holds a lease on each one.
+-- A job whose worker died is re-claimed once its lease expires. Failed jobs
+-- go back to 'queued' with a later run_after until max_attempts is reached.
+--
+-- The partial unique index allows one active (queued or running) job per
+-- (course, concept, content type); enqueue_generation_jobs() skips requests
+-- that already have one and returns the existing job instead.
+
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    course_id UUID NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    concept_id UUID NOT NULL REFERENCES concept_nodes(id) ON DELETE CASCADE,
+    content_type VARCHAR(30) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    lease_expires_at TIMESTAMPTZ,
+    worker_id VARCHAR(100),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    CHECK (status IN ('queued', 'running', 'succeeded', 'failed'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_generation_jobs_active
+    ON generation_jobs(course_id, concept_id, content_type) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_due ON generation_jobs(run_after) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_lease ON generation_jobs(lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_course ON generation_jobs(course_id, created_at);
+
+-- p_jobs: [{"course_id": ..., "concept_id": ..., "content_type": ...}, ...]
+CREATE OR REPLACE FUNCTION enqueue_generation_jobs(p_jobs JSONB)
+RETURNS TABLE (id UUID, concept_id UUID, content_type VARCHAR, status VARCHAR, created BOOLEAN)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH wanted AS (
+        SELECT DISTINCT (j->>'course_id')::UUID AS course_id,
+                        (j->>'concept_id')::UUID AS concept_id,
+                        (j->>'content_type')::VARCHAR AS content_type
+          FROM jsonb_array_elements(p_jobs) AS j
+    ), inserted AS (
+        INSERT INTO generation_jobs (course_id, concept_id, content_type)
+        SELECT w.course_id, w.concept_id, w.content_type FROM wanted w
+        ON CONFLICT (course_id, concept_id, content_type) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING generation_jobs.id, generation_jobs.concept_id, generation_jobs.content_type, generation_jobs.status
+    )
+    SELECT i.id, i.concept_id, i.content_type, i.status, TRUE FROM inserted i
+    UNION ALL
+    SELECT g.id, g.concept_id, g.content_type, g.status, FALSE
+      FROM generation_jobs g
+      JOIN wanted w ON w.course_id = g.course_id AND w.concept_id = g.concept_id
+                   AND w.content_type = g.content_type
+     WHERE g.status IN ('queued', 'running');
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION claim_generation_jobs(p_worker_id TEXT, p_limit INT, p_lease_seconds INT)
+RETURNS SETOF generation_jobs
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Jobs whose worker died on their last attempt are not retried again
+    UPDATE generation_jobs
+       SET status = 'failed', finished_at = NOW(), lease_expires_at = NULL,
+           last_error = COALESCE(last_error, 'Lease expired')
+     WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE generation_jobs g
+       SET status = 'running',
+           attempts = g.attempts + 1,
+           worker_id = p_worker_id,
+           lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+           started_at = NOW()
+     WHERE g.id IN (
+        SELECT c.id FROM generation_jobs c
+         WHERE (c.status = 'queued' AND c.run_after <= NOW())
+            OR (c.status = 'running' AND c.lease_expires_at < NOW())
+         ORDER BY c.run_after
+         LIMIT p_limit
+           FOR UPDATE SKIP LOCKED)
+    RETURNING g.*;
+END;
+$$;
@@ -0,0 +1,70 @@
+-- Migration: Prerequisites-first ordering for content generation jobs
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- Adds generation_jobs.priority (lower runs first). The API sets it from the
+-- concept graph: a concept's depth in the prerequisite graph, then how many
+-- concepts build on it, so foundational concepts get their content first.
+-- Requires migration_generation_jobs.sql.
+
+ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS priority INT NOT NULL DEFAULT 0;
+
+DROP INDEX IF EXISTS idx_generation_jobs_due;
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_due ON generation_jobs(priority, run_after) WHERE status = 'queued';
+
+-- p_jobs: [{"course_id": ..., "concept_id": ..., "content_type": ..., "priority": ...}, ...]
+CREATE OR REPLACE FUNCTION enqueue_generation_jobs(p_jobs JSONB)
+RETURNS TABLE (id UUID, concept_id UUID, content_type VARCHAR, status VARCHAR, created BOOLEAN)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH wanted AS (
+        SELECT DISTINCT ON (1, 2, 3)
+               (j->>'course_id')::UUID AS course_id,
+               (j->>'concept_id')::UUID AS concept_id,
+               (j->>'content_type')::VARCHAR AS content_type,
+               COALESCE((j->>'priority')::INT, 0) AS priority
+          FROM jsonb_array_elements(p_jobs) AS j
+    ), inserted AS (
+        INSERT INTO generation_jobs (course_id, concept_id, content_type, priority)
+        SELECT w.course_id, w.concept_id, w.content_type, w.priority FROM wanted w
+        ON CONFLICT (course_id, concept_id, content_type) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING generation_jobs.id, generation_jobs.concept_id, generation_jobs.content_type, generation_jobs.status
+    )
+    SELECT i.id, i.concept_id, i.content_type, i.status, TRUE FROM inserted i
+    UNION ALL
+    SELECT g.id, g.concept_id, g.content_type, g.status, FALSE
+      FROM generation_jobs g
+      JOIN wanted w ON w.course_id = g.course_id AND w.concept_id = g.concept_id
+                   AND w.content_type = g.content_type
+     WHERE g.status IN ('queued', 'running');
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION claim_generation_jobs(p_worker_id TEXT, p_limit INT, p_lease_seconds INT)
+RETURNS SETOF generation_jobs
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Jobs whose worker died on their last attempt are not retried again
+    UPDATE generation_jobs
+       SET status = 'failed', finished_at = NOW(), lease_expires_at = NULL,
+           last_error = COALESCE(last_error, 'Lease expired')
+     WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE generation_jobs g
+       SET status = 'running',
+           attempts = g.attempts + 1,
+           worker_id = p_worker_id,
+           lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+           started_at = NOW()
+     WHERE g.id IN (
+        SELECT c.id FROM generation_jobs c
+         WHERE (c.status = 'queued' AND c.run_after <= NOW())
+            OR (c.status = 'running' AND c.lease_expires_at < NOW())
+         ORDER BY c.priority, c.run_after
+         LIMIT p_limit
+           FOR UPDATE SKIP LOCKED)
+    RETURNING g.*;
+END;
+$$;
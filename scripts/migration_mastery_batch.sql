@@ -0,0 +1,47 @@
+-- Migration: Atomic batch mastery updates
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- apply_mastery_ops applies a list of mastery operations in order, each through
+-- apply_mastery_op (see migration_mastery_ops.sql), inside one transaction.
+-- Every touched row is locked up front in (student_id, concept_id) order, so
+-- concurrent batches cannot deadlock and a concurrent single-row update is
+-- applied before or after the batch, never overwritten by it.
+--
+-- p_ops: [{"student_id": ..., "concept_id": ..., "op": ..., "value": ...}, ...]
+-- Returns one row per applied op with its 0-based position in p_ops; ops whose
+-- student or concept does not exist return nothing.
+
+CREATE OR REPLACE FUNCTION apply_mastery_ops(p_ops JSONB)
+RETURNS TABLE (op_index INT, old_confidence FLOAT, new_confidence FLOAT, attempts INT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_op RECORD;
+BEGIN
+    -- Sparse storage: create the 0.0 rows first so all of them can be locked together
+    INSERT INTO student_mastery (student_id, concept_id, confidence, attempts)
+    SELECT DISTINCT (o->>'student_id')::UUID, (o->>'concept_id')::UUID, 0.0, 0
+      FROM jsonb_array_elements(p_ops) o
+     WHERE EXISTS (SELECT 1 FROM students s WHERE s.id = (o->>'student_id')::UUID)
+       AND EXISTS (SELECT 1 FROM concept_nodes c WHERE c.id = (o->>'concept_id')::UUID)
+     ORDER BY 1, 2
+    ON CONFLICT (student_id, concept_id) DO NOTHING;
+
+    PERFORM 1
+       FROM student_mastery m
+      WHERE (m.student_id, m.concept_id) IN (
+            SELECT (o->>'student_id')::UUID, (o->>'concept_id')::UUID FROM jsonb_array_elements(p_ops) o)
+      ORDER BY m.student_id, m.concept_id
+        FOR UPDATE;
+
+    FOR v_op IN
+        SELECT o.value AS op, (o.ordinality - 1)::INT AS idx
+          FROM jsonb_array_elements(p_ops) WITH ORDINALITY o
+         ORDER BY o.ordinality
+    LOOP
+        RETURN QUERY
+        SELECT v_op.idx, r.old_confidence, r.new_confidence, r.attempts
+          FROM apply_mastery_op((v_op.op->>'student_id')::UUID, (v_op.op->>'concept_id')::UUID,
+                                v_op.op->>'op', v_op.op->>'value') r;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,71 @@
+-- Migration: Atomic server-side mastery updates
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- apply_mastery_op locks the (student, concept) row, applies one scoring rule
+-- and writes the result in a single call, returning the old and new values.
+-- Concurrent updates serialize on the row lock instead of overwriting each
+-- other. No row is returned when the mastery row does not exist.
+--
+-- Ops (mirrors apply_rule in api/src/services/mastery.py):
+--   confidence   set, clamped to [0, 1]
+--   delta        add, clamped to [0, 1]
+--   max          raise to the value if higher; counts an attempt when it raises
+--   eval_result  correct -> at least 0.85, partial -> at least 0.5,
+--                anything else -> 0.2 (or lower if already lower); counts an attempt
+
+CREATE OR REPLACE FUNCTION apply_mastery_op(
+    p_student_id UUID,
+    p_concept_id UUID,
+    p_op TEXT,
+    p_value TEXT
+) RETURNS TABLE (old_confidence FLOAT, new_confidence FLOAT, attempts INT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_old FLOAT;
+    v_attempts INT;
+    v_new FLOAT;
+    v_increment INT := 0;
+BEGIN
+    SELECT COALESCE(m.confidence, 0.0), COALESCE(m.attempts, 0)
+      INTO v_old, v_attempts
+      FROM student_mastery m
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    IF p_op = 'confidence' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, p_value::FLOAT));
+    ELSIF p_op = 'delta' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, v_old + p_value::FLOAT));
+    ELSIF p_op = 'max' THEN
+        v_new := GREATEST(v_old, LEAST(1.0, GREATEST(0.0, p_value::FLOAT)));
+        IF v_new > v_old THEN
+            v_increment := 1;
+        END IF;
+    ELSIF p_op = 'eval_result' THEN
+        v_increment := 1;
+        IF p_value = 'correct' THEN
+            v_new := GREATEST(v_old, 0.85);
+        ELSIF p_value = 'partial' THEN
+            v_new := GREATEST(v_old, 0.50);
+        ELSIF v_old = 0.0 THEN
+            v_new := 0.20;
+        ELSE
+            v_new := LEAST(v_old, 0.20);
+        END IF;
+    ELSE
+        RAISE EXCEPTION 'Unknown mastery op: %', p_op;
+    END IF;
+
+    UPDATE student_mastery m
+       SET confidence = v_new,
+           attempts = v_attempts + v_increment,
+           last_updated = NOW()
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id;
+
+    RETURN QUERY SELECT v_old, v_new, v_attempts + v_increment;
+END;
+$$;
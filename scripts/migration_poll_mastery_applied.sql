@@ -0,0 +1,7 @@
+-- Migration: Apply poll evaluations to mastery once, at close
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- Closing a poll with apply_mastery applies every response's eval_result to
+-- the poll concept in one batch. The timestamp records that it happened, so
+-- closing the same poll again never applies the evaluations twice.
+ALTER TABLE poll_questions ADD COLUMN IF NOT EXISTS mastery_applied_at TIMESTAMPTZ;
@@ -0,0 +1,15 @@
+-- Migration: One poll response per student per poll
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- Poll responses are now upserted on (question_id, student_id): a retry or
+-- double submit overwrites the student's answer instead of adding a row.
+
+-- Keep only the latest response for each (question, student) pair
+DELETE FROM poll_responses r
+ USING poll_responses newer
+ WHERE r.question_id = newer.question_id
+   AND r.student_id = newer.student_id
+   AND (r.answered_at, r.id) < (newer.answered_at, newer.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_poll_responses_question_student
+    ON poll_responses(question_id, student_id);
@@ -0,0 +1,75 @@
+-- Migration: Sparse mastery storage
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- student_mastery rows are no longer created for every student x concept pair
+-- on enrollment or PDF upload. A missing row means confidence 0.0 (gray);
+-- rows appear the first time a pair is updated.
+
+-- apply_mastery_op now creates the row on first touch instead of returning nothing.
+-- It returns no row only when the student or concept does not exist.
+CREATE OR REPLACE FUNCTION apply_mastery_op(
+    p_student_id UUID,
+    p_concept_id UUID,
+    p_op TEXT,
+    p_value TEXT
+) RETURNS TABLE (old_confidence FLOAT, new_confidence FLOAT, attempts INT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_old FLOAT;
+    v_attempts INT;
+    v_new FLOAT;
+    v_increment INT := 0;
+BEGIN
+    -- Sparse storage: create the 0.0 row on first touch (only for real students/concepts)
+    INSERT INTO student_mastery (student_id, concept_id, confidence, attempts)
+    SELECT p_student_id, p_concept_id, 0.0, 0
+     WHERE EXISTS (SELECT 1 FROM students s WHERE s.id = p_student_id)
+       AND EXISTS (SELECT 1 FROM concept_nodes c WHERE c.id = p_concept_id)
+    ON CONFLICT (student_id, concept_id) DO NOTHING;
+
+    SELECT COALESCE(m.confidence, 0.0), COALESCE(m.attempts, 0)
+      INTO v_old, v_attempts
+      FROM student_mastery m
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    IF p_op = 'confidence' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, p_value::FLOAT));
+    ELSIF p_op = 'delta' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, v_old + p_value::FLOAT));
+    ELSIF p_op = 'max' THEN
+        v_new := GREATEST(v_old, LEAST(1.0, GREATEST(0.0, p_value::FLOAT)));
+        IF v_new > v_old THEN
+            v_increment := 1;
+        END IF;
+    ELSIF p_op = 'eval_result' THEN
+        v_increment := 1;
+        IF p_value = 'correct' THEN
+            v_new := GREATEST(v_old, 0.85);
+        ELSIF p_value = 'partial' THEN
+            v_new := GREATEST(v_old, 0.50);
+        ELSIF v_old = 0.0 THEN
+            v_new := 0.20;
+        ELSE
+            v_new := LEAST(v_old, 0.20);
+        END IF;
+    ELSE
+        RAISE EXCEPTION 'Unknown mastery op: %', p_op;
+    END IF;
+
+    UPDATE student_mastery m
+       SET confidence = v_new,
+           attempts = v_attempts + v_increment,
+           last_updated = NOW()
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id;
+
+    RETURN QUERY SELECT v_old, v_new, v_attempts + v_increment;
+END;
+$$;
+
+-- Reclaim the eagerly created rows that were never touched
+DELETE FROM student_mastery WHERE confidence = 0.0 AND attempts = 0;
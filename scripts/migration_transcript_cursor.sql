@@ -0,0 +1,7 @@
+-- Migration: Keyset pagination for transcript polling
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+
+-- `after=` cursors read a lecture's chunks in (created_at, id) order;
+-- this index keeps each poll an index range scan as the transcript grows
+CREATE INDEX IF NOT EXISTS idx_transcript_chunks_lecture_created
+    ON transcript_chunks(lecture_id, created_at, id);
@@ -0,0 +1,13 @@
+-- Migration: Rolling tutoring summaries and message cursors
+-- Run this in Supabase SQL Editor (Dashboard > SQL Editor)
+--
+-- Older tutoring messages are folded into a per-session summary; the cursor
+-- ('<created_at>,<id>') marks the last message folded in, and the history
+-- endpoint returns only the messages after it.
+ALTER TABLE tutoring_sessions ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE tutoring_sessions ADD COLUMN IF NOT EXISTS summary_cursor TEXT;
+ALTER TABLE tutoring_sessions ADD COLUMN IF NOT EXISTS summary_message_count INT DEFAULT 0;
+
+-- Keyset reads of a session's messages (after= cursors, history window)
+CREATE INDEX IF NOT EXISTS idx_tutoring_messages_session_created
+    ON tutoring_messages(session_id, created_at, id);
@@ -19,7 +19,8 @@ CREATE TABLE concept_nodes (
     category VARCHAR(100),
     difficulty INT DEFAULT 3,
     x FLOAT,
-    y FLOAT
+    y FLOAT,
+    synonyms TEXT[] DEFAULT '{}'
 );
 
 CREATE TABLE concept_edges (
@@ -34,7 +35,8 @@ CREATE TABLE students (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     name VARCHAR(255) NOT NULL,
     email VARCHAR(255),
-    course_id UUID REFERENCES courses(id) ON DELETE CASCADE
+    course_id UUID REFERENCES courses(id) ON DELETE CASCADE,
+    cohort VARCHAR(100)
 );
 
 CREATE TABLE student_mastery (
@@ -71,6 +73,8 @@ CREATE TABLE transcript_concepts (
     PRIMARY KEY (transcript_chunk_id, concept_id)
 );
 
+CREATE INDEX IF NOT EXISTS idx_transcript_chunks_lecture_created ON transcript_chunks(lecture_id, created_at, id);
+
 CREATE TABLE poll_questions (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     lecture_id UUID REFERENCES lecture_sessions(id) ON DELETE CASCADE,
@@ -78,7 +82,8 @@ CREATE TABLE poll_questions (
     question TEXT NOT NULL,
     expected_answer TEXT,
     status VARCHAR(20) DEFAULT 'draft',
-    generated_at TIMESTAMP DEFAULT NOW()
+    generated_at TIMESTAMP DEFAULT NOW(),
+    mastery_applied_at TIMESTAMPTZ
 );
 
 CREATE TABLE poll_responses (
@@ -90,11 +95,16 @@ CREATE TABLE poll_responses (
     answered_at TIMESTAMP DEFAULT NOW()
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS idx_poll_responses_question_student ON poll_responses(question_id, student_id);
+
 CREATE TABLE tutoring_sessions (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     student_id UUID REFERENCES students(id) ON DELETE CASCADE,
     target_concepts UUID[],
-    started_at TIMESTAMP DEFAULT NOW()
+    started_at TIMESTAMP DEFAULT NOW(),
+    summary TEXT,
+    summary_cursor TEXT,
+    summary_message_count INT DEFAULT 0
 );
 
 CREATE TABLE tutoring_messages (
@@ -106,6 +116,8 @@ CREATE TABLE tutoring_messages (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+CREATE INDEX IF NOT EXISTS idx_tutoring_messages_session_created ON tutoring_messages(session_id, created_at, id);
+
 -- Auth extension: teachers table + course/student auth columns
 CREATE TABLE teachers (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -189,3 +201,192 @@ CREATE TABLE concept_quiz_questions (
 
 CREATE INDEX IF NOT EXISTS idx_learning_pages_concept ON concept_learning_pages(concept_id);
 CREATE INDEX IF NOT EXISTS idx_quiz_questions_concept ON concept_quiz_questions(concept_id);
+
+-- Atomic mastery update (see migration_mastery_ops.sql for the op rules).
+-- Mastery is sparse: a missing row is 0.0 and is created on first touch.
+CREATE OR REPLACE FUNCTION apply_mastery_op(
+    p_student_id UUID,
+    p_concept_id UUID,
+    p_op TEXT,
+    p_value TEXT
+) RETURNS TABLE (old_confidence FLOAT, new_confidence FLOAT, attempts INT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_old FLOAT;
+    v_attempts INT;
+    v_new FLOAT;
+    v_increment INT := 0;
+BEGIN
+    -- Sparse storage: create the 0.0 row on first touch (only for real students/concepts)
+    INSERT INTO student_mastery (student_id, concept_id, confidence, attempts)
+    SELECT p_student_id, p_concept_id, 0.0, 0
+     WHERE EXISTS (SELECT 1 FROM students s WHERE s.id = p_student_id)
+       AND EXISTS (SELECT 1 FROM concept_nodes c WHERE c.id = p_concept_id)
+    ON CONFLICT (student_id, concept_id) DO NOTHING;
+
+    SELECT COALESCE(m.confidence, 0.0), COALESCE(m.attempts, 0)
+      INTO v_old, v_attempts
+      FROM student_mastery m
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id
+       FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    IF p_op = 'confidence' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, p_value::FLOAT));
+    ELSIF p_op = 'delta' THEN
+        v_new := LEAST(1.0, GREATEST(0.0, v_old + p_value::FLOAT));
+    ELSIF p_op = 'max' THEN
+        v_new := GREATEST(v_old, LEAST(1.0, GREATEST(0.0, p_value::FLOAT)));
+        IF v_new > v_old THEN
+            v_increment := 1;
+        END IF;
+    ELSIF p_op = 'eval_result' THEN
+        v_increment := 1;
+        IF p_value = 'correct' THEN
+            v_new := GREATEST(v_old, 0.85);
+        ELSIF p_value = 'partial' THEN
+            v_new := GREATEST(v_old, 0.50);
+        ELSIF v_old = 0.0 THEN
+            v_new := 0.20;
+        ELSE
+            v_new := LEAST(v_old, 0.20);
+        END IF;
+    ELSE
+        RAISE EXCEPTION 'Unknown mastery op: %', p_op;
+    END IF;
+
+    UPDATE student_mastery m
+       SET confidence = v_new,
+           attempts = v_attempts + v_increment,
+           last_updated = NOW()
+     WHERE m.student_id = p_student_id AND m.concept_id = p_concept_id;
+
+    RETURN QUERY SELECT v_old, v_new, v_attempts + v_increment;
+END;
+$$;
+
+-- Ordered batch of mastery ops in one transaction (see migration_mastery_batch.sql).
+-- p_ops: [{"student_id": ..., "concept_id": ..., "op": ..., "value": ...}, ...]
+CREATE OR REPLACE FUNCTION apply_mastery_ops(p_ops JSONB)
+RETURNS TABLE (op_index INT, old_confidence FLOAT, new_confidence FLOAT, attempts INT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_op RECORD;
+BEGIN
+    -- Sparse storage: create the 0.0 rows first so all of them can be locked together
+    INSERT INTO student_mastery (student_id, concept_id, confidence, attempts)
+    SELECT DISTINCT (o->>'student_id')::UUID, (o->>'concept_id')::UUID, 0.0, 0
+      FROM jsonb_array_elements(p_ops) o
+     WHERE EXISTS (SELECT 1 FROM students s WHERE s.id = (o->>'student_id')::UUID)
+       AND EXISTS (SELECT 1 FROM concept_nodes c WHERE c.id = (o->>'concept_id')::UUID)
+     ORDER BY 1, 2
+    ON CONFLICT (student_id, concept_id) DO NOTHING;
+
+    PERFORM 1
+       FROM student_mastery m
+      WHERE (m.student_id, m.concept_id) IN (
+            SELECT (o->>'student_id')::UUID, (o->>'concept_id')::UUID FROM jsonb_array_elements(p_ops) o)
+      ORDER BY m.student_id, m.concept_id
+        FOR UPDATE;
+
+    FOR v_op IN
+        SELECT o.value AS op, (o.ordinality - 1)::INT AS idx
+          FROM jsonb_array_elements(p_ops) WITH ORDINALITY o
+         ORDER BY o.ordinality
+    LOOP
+        RETURN QUERY
+        SELECT v_op.idx, r.old_confidence, r.new_confidence, r.attempts
+          FROM apply_mastery_op((v_op.op->>'student_id')::UUID, (v_op.op->>'concept_id')::UUID,
+                                v_op.op->>'op', v_op.op->>'value') r;
+    END LOOP;
+END;
+$$;
+
+-- Background content generation queue (see migration_generation_jobs.sql).
+-- One active job per (course, concept, content type); workers claim with SKIP LOCKED,
+-- lowest priority first (see migration_generation_priority.sql).
+CREATE TABLE generation_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    course_id UUID NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    concept_id UUID NOT NULL REFERENCES concept_nodes(id) ON DELETE CASCADE,
+    content_type VARCHAR(30) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    priority INT NOT NULL DEFAULT 0,
+    run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    lease_expires_at TIMESTAMPTZ,
+    worker_id VARCHAR(100),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    CHECK (status IN ('queued', 'running', 'succeeded', 'failed'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_generation_jobs_active
+    ON generation_jobs(course_id, concept_id, content_type) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_due ON generation_jobs(priority, run_after) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_lease ON generation_jobs(lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_course ON generation_jobs(course_id, created_at);
+
+-- p_jobs: [{"course_id": ..., "concept_id": ..., "content_type": ..., "priority": ...}, ...]
+CREATE OR REPLACE FUNCTION enqueue_generation_jobs(p_jobs JSONB)
+RETURNS TABLE (id UUID, concept_id UUID, content_type VARCHAR, status VARCHAR, created BOOLEAN)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH wanted AS (
+        SELECT DISTINCT ON (1, 2, 3)
+               (j->>'course_id')::UUID AS course_id,
+               (j->>'concept_id')::UUID AS concept_id,
+               (j->>'content_type')::VARCHAR AS content_type,
+               COALESCE((j->>'priority')::INT, 0) AS priority
+          FROM jsonb_array_elements(p_jobs) AS j
+    ), inserted AS (
+        INSERT INTO generation_jobs (course_id, concept_id, content_type, priority)
+        SELECT w.course_id, w.concept_id, w.content_type, w.priority FROM wanted w
+        ON CONFLICT (course_id, concept_id, content_type) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING generation_jobs.id, generation_jobs.concept_id, generation_jobs.content_type, generation_jobs.status
+    )
+    SELECT i.id, i.concept_id, i.content_type, i.status, TRUE FROM inserted i
+    UNION ALL
+    SELECT g.id, g.concept_id, g.content_type, g.status, FALSE
+      FROM generation_jobs g
+      JOIN wanted w ON w.course_id = g.course_id AND w.concept_id = g.concept_id
+                   AND w.content_type = g.content_type
+     WHERE g.status IN ('queued', 'running');
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION claim_generation_jobs(p_worker_id TEXT, p_limit INT, p_lease_seconds INT)
+RETURNS SETOF generation_jobs
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Jobs whose worker died on their last attempt are not retried again
+    UPDATE generation_jobs
+       SET status = 'failed', finished_at = NOW(), lease_expires_at = NULL,
+           last_error = COALESCE(last_error, 'Lease expired')
+     WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE generation_jobs g
+       SET status = 'running',
+           attempts = g.attempts + 1,
+           worker_id = p_worker_id,
+           lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+           started_at = NOW()
+     WHERE g.id IN (
+        SELECT c.id FROM generation_jobs c
+         WHERE (c.status = 'queued' AND c.run_after <= NOW())
+            OR (c.status = 'running' AND c.lease_expires_at < NOW())
+         ORDER BY c.priority, c.run_after
+         LIMIT p_limit
+           FOR UPDATE SKIP LOCKED)
+    RETURNING g.*;
+END;
+$$;